@@ -1,32 +1,37 @@
 import streamlit as st
-from openai import OpenAI
-from utils.mongodb import check_identifier
+from utils.llm import get_provider
+from utils.breaker import mongo_breaker
+from utils.feedback_batch import JOB_DONE
+from utils.identifiers import is_valid_identifier
+from utils.mongodb import find_resumable_session
+from utils.scenarios import default_scenario_id, get_scenario, list_scenarios
+from utils.transcript import Transcript
+from utils.session import rehydrate_session
+from utils.session_reaper import watch_idle
+from utils.session_store import shared_session_state
+from utils.config import get_setting
+from utils.profiling import profile_section
+from utils.telemetry import measure_interaction, start_metrics_server
+from utils.warmup import start_warm_up
 
 def is_identifier_valid():
     identifier = st.session_state.get("user_identifier", "").strip()
     if not identifier:
         return False
-    return check_identifier(st.session_state["mongodb_uri"], identifier)
+    return is_valid_identifier(st.session_state["mongodb_uri"], identifier)
 
+@profile_section("setup")
 def setup():
-    # Load prompts
-    if "patient_prompt" not in st.session_state: 
-        with open("./prompts/patient_prompt.txt", "r") as file:
-            patientprompt = file.read()
-        st.session_state["patient_prompt"] = patientprompt
+    # Pre-initialise pooled clients and prompts in the background (once per process)
+    start_warm_up(st.secrets["MONGODB_CONNECTION_STRING"])
 
-    if "assessor_prompt" not in st.session_state:
-        with open("./prompts/assessor_prompt.txt", "r") as file:
-            assessorprompt = file.read()
-        st.session_state["assessor_prompt"] = assessorprompt
-
-    # Model configuration
-    if "model" not in st.session_state:
-        st.session_state["model"] = "gpt-4o-mini"
+    # Scenario (the pack itself is loaded once per process and shared between sessions)
+    if "scenario_id" not in st.session_state:
+        st.session_state["scenario_id"] = default_scenario_id()
 
     # Chat histories
     if "patient_chat_history" not in st.session_state:
-        st.session_state["patient_chat_history"] = []
+        st.session_state["patient_chat_history"] = Transcript()
 
     if "assessor_chat_history" not in st.session_state:
         st.session_state["assessor_chat_history"] = []
@@ -59,9 +64,13 @@ def setup():
     if "user_identifier" not in st.session_state:
         st.session_state["user_identifier"] = ""
 
+    # Interview messages of a resumed session still waiting in MongoDB
+    if "patient_history_offset" not in st.session_state:
+        st.session_state["patient_history_offset"] = 0
+
     # Audio conversation session state variables
     if "audio_chat_history" not in st.session_state:
-        st.session_state["audio_chat_history"] = []
+        st.session_state["audio_chat_history"] = Transcript()
 
     if "audio_conversation_finished" not in st.session_state:
         st.session_state["audio_conversation_finished"] = False
@@ -73,10 +82,73 @@ def setup():
     if "diagnosis_results" not in st.session_state:
         st.session_state["diagnosis_results"] = {}
 
-    # Set up OpenAI API client
-    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-    return client
+    # Prometheus-style metrics endpoint (one per process)
+    metrics_port = get_setting("METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
+    # Park this session's state while it sits idle (SESSION_IDLE_SECONDS; see utils/session_reaper.py)
+    watch_idle()
+
+    # Model providers for each role (pooled per process; see utils/llm.py)
+    return get_provider("patient")
+
+def offer_resume(identifier):
+    """Offer to continue the latest unfinished session for this identifier."""
+    if st.session_state.get("session_id"):
+        return
+
+    # Look the session up once per identifier rather than on every rerun
+    if st.session_state.get("resume_checked_for") != identifier:
+        try:
+            st.session_state["resumable_session"] = mongo_breaker.call(
+                find_resumable_session, st.session_state["mongodb_uri"], identifier
+            )
+        except Exception:
+            # Degraded: no resume offer while MongoDB is unavailable; look again on a later rerun
+            return
+        st.session_state["resume_checked_for"] = identifier
+
+    resumable = st.session_state.get("resumable_session")
+    if not resumable:
+        return
+
+    started = resumable.get("timestamp")
+    started_text = f" started {started:%d %b %Y %H:%M} UTC" if started else ""
+    if (resumable.get("feedback_job") or {}).get("status") == JOB_DONE:
+        st.success(f"📬 Your feedback report for the session{started_text} is ready. Resume the session to read it.")
+    else:
+        st.info(f"You have an unfinished session{started_text}. You can pick up where you left off.")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("▶️ Resume session", use_container_width=True):
+            rehydrate_session(resumable)
+            st.session_state["resumable_session"] = None
+            st.rerun()
+    with col2:
+        if st.button("🆕 Start a new session", use_container_width=True):
+            st.session_state["resumable_session"] = None
+            st.rerun()
+
+def choose_scenario():
+    """Let the trainee pick a scenario before their interview starts."""
+    catalog = list_scenarios()
+    if len(catalog) < 2:
+        return
+    titles = dict(catalog)
+    ids = list(titles)
+    current = st.session_state["scenario_id"]
+    started = bool(st.session_state.get("session_id") or st.session_state["patient_chat_history"])
+    chosen = st.selectbox(
+        "Scenario",
+        ids,
+        index=ids.index(current) if current in ids else 0,
+        format_func=titles.get,
+        disabled=started,
+        help="Restart the simulation from the Feedback Report to change scenario" if started else None
+    )
+    if not started:
+        st.session_state["scenario_id"] = chosen
 
 def init_page():
     setup()
@@ -101,10 +173,13 @@ def init_page():
         "4. **Reflect & retry** – Use the feedback to refine your approach; restart the simulation at any time.\n"
     )
 
+    choose_scenario()
+    patient_name = get_scenario(st.session_state["scenario_id"]).patient_name
+
     st.markdown(
         "## Instructions\n"
         "1. Enter your unique identifier below. This will be used to associate your conversation records with you.\n"
-        "2. In the **Patient Interview** tab, converse with Jai (the simulated student) and apply the HEADSS assessment framework. Only click 'Finish Interview' when you are completely finished.\n"
+        f"2. In the **Patient Interview** tab, converse with {patient_name} (the simulated student) and apply the HEADSS assessment framework. Only click 'Finish Interview' when you are completely finished.\n"
         "3. Complete the **Diagnostic Assessment** with multiple choice questions about possible diagnoses.\n"
         "4. Review your **Feedback Report** to see how well you covered each HEADSS element.\n"
         "\n**Note:** Please ensure you have a stable internet connection to prevent any issues."
@@ -119,9 +194,17 @@ def init_page():
     )
 
     if identifier:
-        if check_identifier(st.session_state["mongodb_uri"], identifier):
+        try:
+            valid = is_valid_identifier(st.session_state["mongodb_uri"], identifier)
+        except Exception:
+            # Database unreachable and identifiers not cached yet
+            valid = None
+        if valid is None:
+            st.warning("⚠️ Identifiers can't be checked right now. Please try again in a minute.")
+        elif valid:
             st.session_state["user_identifier"] = identifier
             st.success("✅ Identifier validated successfully. You can now proceed to the interview pages.")
+            offer_resume(identifier)
         else:
             st.error("❌ Invalid identifier. Please enter a valid identifier.")
             st.session_state["user_identifier"] = ""
@@ -153,4 +236,5 @@ def init_page():
     """)
 
 if __name__ == "__main__":
-    init_page()
+    with measure_interaction("home", "page"), shared_session_state():
+        init_page()
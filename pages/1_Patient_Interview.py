@@ -1,37 +1,30 @@
 import streamlit as st
 from Home import setup
-from utils.mongodb import log_transcript
-
-# Check if user has entered identifier
-if not bool(st.session_state.get("user_identifier", "").strip()):
-    st.error("Please enter your identifier on the Home page before starting the conversation.")
-    st.stop()
+from utils.breaker import CircuitOpenError
+from utils.idempotency import submit_once
+from utils.mongodb import append_patient_messages, log_transcript, start_patient_session
+from utils.profiling import profile_section
+from utils.response_cache import get_response_cache
+from utils.scenarios import get_scenario
+from utils.session import ensure_full_history, transcript_owner
+from utils.config import get_setting
+from utils.streaming import StreamStats, coalesce
+from utils.session_store import shared_session_state
+from utils.telemetry import TurnMetrics, instrument_stream, measure_interaction, timed_render
+from utils.transcript import Transcript, order_realtime
 
 MAXIMUM_RESPONSES = 1000
 
-client = setup()
-
-st.title("👨‍⚕️ Patient Interview with Jai")
-st.markdown("**Jai Murray, 16-year-old student from Murray Plains Secondary College**")
-
-# Display patient information
-with st.expander("📋 Patient Information", expanded=False):
-    st.markdown("""
-    **Name:** Jai Murray  
-    **Age:** 16 years old  
-    **School:** Murray Plains Secondary College (Year 10)  
-    **Location:** Swan Hill, rural Victoria  
-    **Background:** Aboriginal (Koori), neurodiverse, lives with Mum, step-dad, and two younger siblings  
-    **Interests:** Digital drawing, local footy, fishing with Aunty, Aussie hip hop
-    """)
-
-# Voice/Text toggle
-use_voice = st.checkbox("🎤 Use Voice Conversation", key="voice_toggle")
-
-if use_voice:
-    st.markdown("### Voice Conversation Mode")
-    st.markdown("Click the button below to start a voice conversation with Jai.")
-    
+# Coalesce streamed tokens into one UI delta per interval to cut websocket traffic
+STREAM_FLUSH_INTERVAL = float(get_setting("STREAM_FLUSH_INTERVAL_MS", 50)) / 1000
+
+
+# Interactive areas are fragments so that a chat submission or component update
+# reruns only that area instead of the whole page script.
+@st.fragment
+@measure_interaction("patient_interview", "voice")
+@shared_session_state()
+def voice_pane(scenario):
     # Import voice functionality
     try:
         from st_realtime_audio import realtime_audio_conversation
@@ -47,7 +40,7 @@ if use_voice:
             conversation_result = realtime_audio_conversation(
                 api_key=st.secrets["OPENAI_API_KEY"],
                 voice="alloy",
-                instructions=st.session_state["patient_prompt"],
+                instructions=scenario.patient_prompt,
                 auto_start=False,
                 temperature=0.8,
                 turn_detection_threshold=0.5,
@@ -63,10 +56,7 @@ if use_voice:
                 st.subheader("Conversation Transcript")
                 
                 # Sort transcript by sequence to ensure correct chronological order
-                sorted_transcript = sorted(
-                    conversation_result["transcript"], 
-                    key=lambda x: x.get("sequence", x.get("timestamp", 0))
-                )
+                sorted_transcript = order_realtime(conversation_result["transcript"])
                 
                 # Display transcript in chat format
                 for message in sorted_transcript:
@@ -76,14 +66,10 @@ if use_voice:
                         st.chat_message("assistant").write(message["content"])
                 
                 # Store transcript in session state for logging
-                if sorted_transcript and not st.session_state.get("audio_transcript_logged", False):
-                    # Convert transcript to chat history format
-                    chat_history = []
-                    for message in sorted_transcript:
-                        role = "user" if message["type"] == "user" else "assistant"
-                        chat_history.append({"role": role, "content": message["content"]})
-                    
-                    st.session_state["audio_chat_history"] = chat_history
+                # (rebuilt only when the component reports new messages)
+                if (sorted_transcript and not st.session_state.get("audio_transcript_logged", False)
+                        and len(sorted_transcript) != len(st.session_state["audio_chat_history"])):
+                    st.session_state["audio_chat_history"] = Transcript.from_realtime(sorted_transcript)
 
             # Add finish conversation button
             st.markdown("---")
@@ -91,15 +77,15 @@ if use_voice:
             with col2:
                 if conversation_result.get("transcript") and st.session_state.get("audio_chat_history"):
                     if st.button("Finish Interview", key="finish_audio", use_container_width=True):
+                        # Log the transcript (once, even if the button is clicked twice)
+                        mongodb_uri = st.session_state["mongodb_uri"]
+                        audio_history = st.session_state.audio_chat_history
+                        owner = transcript_owner()
+                        session_id = submit_once("patient_audio", lambda key: log_transcript(
+                            mongodb_uri, "patient_audio", audio_history, idempotency_key=key, **owner
+                        ))
                         st.session_state.audio_conversation_finished = True
                         st.session_state.patient_conversation_done = True
-                        
-                        # Log the transcript
-                        session_id = log_transcript(
-                            st.session_state["mongodb_uri"],
-                            "patient_audio",
-                            st.session_state.audio_chat_history
-                        )
                         st.session_state.audio_session_id = session_id
                         st.session_state.session_id = session_id
                         st.success("Audio interview logged successfully!")
@@ -130,7 +116,7 @@ if use_voice:
             
             **Tips:**
             - Speak clearly and at normal volume
-            - Wait for Jai to finish before speaking
+            - Wait for the patient to finish before speaking
             - Remember to click "Finish Interview" when done
             
             **Requirements:**
@@ -142,21 +128,46 @@ if use_voice:
     except ImportError:
         st.error("Voice conversation requires the streamlit-realtime-audio package. Please install it or use text mode.")
 
-else:
-    # Text conversation mode
-    st.markdown("### Text Conversation Mode")
-    st.markdown("Chat with Jai using text messages below.")
-    
+
+def save_turn():
+    """Persist the latest user/assistant exchange so the session can be resumed."""
+    turn = st.session_state.patient_chat_history[-2:]
+    if st.session_state.get("session_id"):
+        append_patient_messages(st.session_state["mongodb_uri"], st.session_state.session_id, turn)
+    else:
+        mongodb_uri = st.session_state["mongodb_uri"]
+        history = st.session_state.patient_chat_history
+        owner = transcript_owner()
+        st.session_state.session_id = submit_once("interview_start", lambda key: start_patient_session(
+            mongodb_uri, history, owner["identifier"], idempotency_key=key, scenario_id=owner["scenario_id"]
+        ))
+
+
+@st.fragment
+@measure_interaction("patient_interview", "chat")
+@shared_session_state()
+def chat_pane(provider, scenario):
+    # A resumed session only loads the tail of the history up front
+    earlier = st.session_state.get("patient_history_offset", 0)
+    if earlier:
+        st.caption(f"{earlier} earlier messages are not shown.")
+        if st.button("Show earlier messages", key="load_history"):
+            ensure_full_history()
+            st.rerun(scope="fragment")
+
     # Write chat history
-    for message in st.session_state.patient_chat_history:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    with profile_section("history"):
+        for message in st.session_state.patient_chat_history:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
 
     # Chat logic
     if prompt := st.chat_input(
         "Type your message here...",
         disabled=st.session_state.patient_conversation_done or st.session_state.patient_response_counter >= MAXIMUM_RESPONSES
     ):
+        # The model needs the whole conversation, not just the resumed tail
+        ensure_full_history()
         st.session_state.patient_chat_history.append({"role": "user", "content": prompt})
 
         if st.session_state.patient_response_counter < MAXIMUM_RESPONSES:
@@ -164,20 +175,50 @@ else:
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
-                messages_with_system_prompt = [{"role": "system", "content": st.session_state["patient_prompt"]}] + [
-                    {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.patient_chat_history
-                ]
-
-                stream = client.chat.completions.create(
-                    model=st.session_state["model"],
-                    messages=messages_with_system_prompt,
-                    stream=True,
+                # A view over the history rather than a fresh copy of every message
+                messages_with_system_prompt = st.session_state.patient_chat_history.request_messages(
+                    scenario.patient_prompt
                 )
-                response = st.write_stream(stream)
+
+                metrics = TurnMetrics(provider.model, scenario.prompt_version)
+
+                # Opening turns that most interviews share can come from the cache (opt-in)
+                cache = get_response_cache()
+                cache_key = cache.key(
+                    provider.model, scenario.patient_prompt, st.session_state.patient_chat_history
+                ) if cache else None
+                response = cache.get(cache_key) if cache else None
+                if response is not None:
+                    st.markdown(response)
+                    turn_metrics = {"model": provider.model, "prompt_version": metrics.prompt_version, "cached_response": True}
+                else:
+                    try:
+                        stream = provider.create(messages_with_system_prompt, stream=True)
+                    except Exception as error:
+                        if not isinstance(error, CircuitOpenError) and not provider.breaker.is_failure(error):
+                            raise
+                        # Drop the unanswered message so the clinician can simply send it again
+                        st.session_state.patient_chat_history = Transcript(st.session_state.patient_chat_history[:-1])
+                        retry_in = provider.breaker.retry_in()
+                        wait_text = f" Please try again in about {retry_in:.0f} seconds." if retry_in else " Please try again shortly."
+                        st.warning(f"{scenario.patient_name} can't reply right now because the language model service is unavailable." + wait_text)
+                        return
+                    stream_stats = StreamStats()
+                    response = st.write_stream(timed_render(
+                        coalesce(instrument_stream(stream, metrics), interval=STREAM_FLUSH_INTERVAL, stats=stream_stats),
+                        metrics
+                    ))
+                    metrics.export()
+                    stream_stats.export(model=provider.model)
+                    turn_metrics = {**metrics.to_dict(), **stream_stats.to_dict()}
+                    if cache:
+                        cache.put(cache_key, response)
 
             st.session_state.patient_response_counter += 1
-            st.session_state.patient_chat_history.append({"role": "assistant", "content": response})
+            st.session_state.patient_chat_history.append(
+                {"role": "assistant", "content": response, "metrics": turn_metrics}
+            )
+            save_turn()
 
         else:
             with st.chat_message("user"):
@@ -189,21 +230,70 @@ else:
             final_message = {"role": "assistant", "content": "Thanks for talking with me, doc."}
             st.session_state.patient_chat_history.append(final_message)
             st.session_state.patient_conversation_done = True
+            save_turn()
+            # The progress indicator and finish controls live outside this fragment
+            st.rerun()
+
 
-    # Add finish conversation button below chat input
+@st.fragment
+@measure_interaction("patient_interview", "finish")
+@shared_session_state()
+def finish_controls(scenario):
+    # The chat pane reruns on its own, so the button is always shown and
+    # an empty interview is rejected here rather than by hiding it
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        if not st.session_state.patient_conversation_done and st.session_state.patient_chat_history:
+        if not st.session_state.patient_conversation_done:
             if st.button("Finish Interview", key="finish_patient", use_container_width=True):
-                st.session_state.patient_conversation_done = True
-                session_id = log_transcript(
-                    st.session_state["mongodb_uri"],
-                    "patient",
-                    st.session_state.patient_chat_history
-                )
+                if not st.session_state.patient_chat_history:
+                    st.warning(f"Please talk with {scenario.patient_name} before finishing the interview.")
+                    return
+                ensure_full_history()
+                # A second click (or a rerun racing this one) gets the first write's result
+                mongodb_uri = st.session_state["mongodb_uri"]
+                history = st.session_state.patient_chat_history
+                owner = transcript_owner()
+                session_id = submit_once("patient", lambda key: log_transcript(
+                    mongodb_uri, "patient", history, idempotency_key=key, **owner
+                ))
                 st.session_state.session_id = session_id
+                st.session_state.patient_conversation_done = True
                 st.rerun()
 
-# Progress indicator
-if st.session_state.patient_conversation_done:
-    st.success("✅ Interview completed! You can now proceed to the Diagnostic Assessment.")
+
+with measure_interaction("patient_interview", "page"), shared_session_state():
+    # Check if user has entered identifier
+    if not bool(st.session_state.get("user_identifier", "").strip()):
+        st.error("Please enter your identifier on the Home page before starting the conversation.")
+        st.stop()
+
+    provider = setup()
+    scenario = get_scenario(st.session_state["scenario_id"])
+
+    st.title(f"👨‍⚕️ Patient Interview with {scenario.patient_name}")
+    st.markdown(f"**{scenario.patient_full_name}, {scenario.patient_summary}**")
+
+    # Display patient information
+    with st.expander("📋 Patient Information", expanded=False):
+        st.markdown(scenario.patient_info)
+
+    # Voice/Text toggle
+    use_voice = st.checkbox("🎤 Use Voice Conversation", key="voice_toggle")
+
+    if use_voice:
+        st.markdown("### Voice Conversation Mode")
+        st.markdown(f"Click the button below to start a voice conversation with {scenario.patient_name}.")
+        voice_pane(scenario)
+
+    else:
+        # Text conversation mode
+        st.markdown("### Text Conversation Mode")
+        st.markdown(f"Chat with {scenario.patient_name} using text messages below.")
+        chat_pane(provider, scenario)
+
+        # Add finish conversation button below chat input
+        finish_controls(scenario)
+
+    # Progress indicator
+    if st.session_state.patient_conversation_done:
+        st.success("✅ Interview completed! You can now proceed to the Diagnostic Assessment.")
@@ -0,0 +1,82 @@
+import streamlit as st
+from utils.config import get_setting
+from utils.dashboard import HEADSS_DOMAINS, STAGES, get_cohort_watcher, min_prefix_length
+from utils.telemetry import measure_interaction
+
+STAGE_LABELS = {
+    "interview": "Interviewing",
+    "diagnosis": "Diagnosing",
+    "feedback": "Reviewing feedback",
+    "complete": "Finished",
+}
+
+REFRESH_SECONDS = float(get_setting("DASHBOARD_REFRESH_SECONDS", 2))
+
+
+# Only this fragment re-runs on the timer. It reads the in-memory aggregate
+# kept current by the cohort watcher, so a refresh never queries MongoDB.
+@st.fragment(run_every=REFRESH_SECONDS)
+@measure_interaction("instructor_dashboard", "cohort")
+def cohort_view(prefix):
+    watcher = get_cohort_watcher(st.secrets["MONGODB_CONNECTION_STRING"], prefix)
+    summary = watcher.aggregate.summary()
+
+    updated = summary["updated_at"]
+    updated_text = f", last activity {updated:%H:%M:%S} UTC" if updated else ""
+    st.caption(f"Live via {watcher.mode} · {summary['events']} updates{updated_text}")
+    if watcher.error:
+        st.warning(f"Connection problem, showing the last known state: {watcher.error}")
+
+    st.markdown("### Progress")
+    columns = st.columns(len(STAGES) + 1)
+    columns[0].metric("Sessions", summary["sessions"])
+    for column, stage in zip(columns[1:], STAGES):
+        column.metric(STAGE_LABELS[stage], summary["stages"].get(stage, 0))
+
+    st.markdown("### Diagnostic Accuracy")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Assessments submitted", summary["diagnosed"])
+    if summary["diagnosed"]:
+        col2.metric("Mean correct", f"{summary['mean_correct']:.1f} / {summary['mean_possible']:g}")
+        col3.metric("Mean incorrect selections", f"{summary['mean_incorrect']:.1f}")
+        st.progress(summary["accuracy"], text=f"Cohort accuracy {summary['accuracy']:.0%}")
+
+    st.markdown("### HEADSS Coverage")
+    st.caption("Share of sessions in which the clinician raised each domain")
+    st.bar_chart({domain: summary["headss_coverage"][domain] for domain in HEADSS_DOMAINS})
+
+    st.markdown("### Sessions")
+    rows = watcher.aggregate.rows()
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No sessions for this cohort yet.")
+
+
+with measure_interaction("instructor_dashboard", "page"):
+    st.set_page_config(page_title="Instructor Dashboard", page_icon="🧑‍🏫", layout="wide")
+    st.title("🧑‍🏫 Instructor Dashboard")
+
+    instructor_key = get_setting("INSTRUCTOR_KEY")
+    if not instructor_key:
+        st.error("The instructor dashboard is disabled. Set INSTRUCTOR_KEY in the app secrets to enable it.")
+        st.stop()
+
+    if st.session_state.get("instructor_key") != instructor_key:
+        entered = st.text_input("Instructor key", type="password")
+        if entered != instructor_key:
+            if entered:
+                st.error("❌ Incorrect instructor key.")
+            st.stop()
+        st.session_state["instructor_key"] = entered
+
+    st.markdown("Follow a class in real time. Enter the identifier prefix shared by the cohort (e.g. `2025-S1-`).")
+    prefix = st.text_input("Cohort identifier prefix", key="cohort_prefix").strip()
+    if not prefix:
+        st.info("Enter a cohort prefix to start following a class.")
+        st.stop()
+    if len(prefix) < min_prefix_length():
+        st.warning(f"Enter at least {min_prefix_length()} characters of the cohort prefix.")
+        st.stop()
+
+    cohort_view(prefix)
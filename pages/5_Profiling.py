@@ -0,0 +1,62 @@
+import os
+import streamlit as st
+from utils.config import get_setting
+from utils.profiling import ENABLED, PROFILE_DIR, STORE
+
+
+def milliseconds(rows, fields):
+    return [{key: round(value * 1000, 1) if key in fields else value for key, value in row.items()} for row in rows]
+
+
+st.set_page_config(page_title="Profiling", page_icon="⏱️", layout="wide")
+st.title("⏱️ Profiling")
+
+admin_key = get_setting("ADMIN_KEY") or get_setting("INSTRUCTOR_KEY")
+if not admin_key:
+    st.error("The profiling page is disabled. Set ADMIN_KEY (or INSTRUCTOR_KEY) in the app secrets to enable it.")
+    st.stop()
+
+if st.session_state.get("admin_key") != admin_key:
+    entered = st.text_input("Admin key", type="password")
+    if entered != admin_key:
+        if entered:
+            st.error("❌ Incorrect admin key.")
+        st.stop()
+    st.session_state["admin_key"] = entered
+
+if not ENABLED:
+    st.info("Profiling is off. Set PROFILING = true in the app secrets (or environment) and restart to collect data.")
+    st.stop()
+
+st.caption("Figures are for this server process since it started or was last reset. Times are in milliseconds.")
+if st.button("Reset"):
+    STORE.reset()
+    st.rerun()
+
+st.markdown("### Rerun latency")
+st.caption("Wall time per full page run, and per fragment run on its own (page/fragment)")
+latencies = STORE.rerun_latencies()
+if latencies:
+    st.dataframe(milliseconds(latencies, {"p50", "p90", "p99", "max", "cpu_mean"}),
+                 use_container_width=True, hide_index=True)
+else:
+    st.info("No page runs recorded yet.")
+
+st.markdown("### Sections")
+st.caption("Named parts of each run: fragments, setup() and the chat history render")
+sections = STORE.section_totals()
+if sections:
+    st.dataframe(milliseconds(sections, {"wall", "cpu", "wall_mean"}), use_container_width=True, hide_index=True)
+
+st.markdown("### External calls")
+st.caption("MongoDB and model calls made through their circuit breakers; streamed replies count until the first response")
+calls = STORE.call_totals()
+if calls:
+    st.dataframe(milliseconds(calls, {"wall", "cpu", "wall_mean"}), use_container_width=True, hide_index=True)
+
+st.markdown("### Sampled profiles")
+st.caption(f"Folded stacks in {PROFILE_DIR}; open them with speedscope or flamegraph.pl")
+for path in list(STORE.profiles)[:10]:
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            st.download_button(os.path.basename(path), file.read(), file_name=os.path.basename(path), key=path)
@@ -0,0 +1,126 @@
+from datetime import datetime, time, timedelta
+
+import streamlit as st
+from utils.config import get_setting
+from utils.scenarios import get_scenario, list_scenarios
+from utils.search import get_search_index
+from utils.telemetry import measure_interaction
+
+PAGE_SIZE = 20
+
+OUTCOME_LABELS = {
+    None: "Any",
+    "all_correct": "All diagnoses correct",
+    "missed": "Missed a diagnosis",
+    "incorrect": "Selected an incorrect diagnosis",
+}
+
+ROLE_LABELS = {
+    "user": "Clinician",
+    "assistant": "Patient",
+    None: "Either",
+}
+
+
+def reset_page():
+    st.session_state["search_page"] = 1
+
+
+def search_filters():
+    """The filter widgets, as keyword arguments for SearchIndex.search()."""
+    col1, col2, col3 = st.columns(3)
+    identifier_prefix = col1.text_input("Identifier prefix", placeholder="2025-S1-", on_change=reset_page).strip()
+    scenarios = dict(list_scenarios())
+    scenario_id = col2.selectbox("Scenario", [None] + list(scenarios), on_change=reset_page,
+                                 format_func=lambda scenario_id: scenarios.get(scenario_id, "Any"))
+    role = col3.selectbox("Said by", list(ROLE_LABELS), format_func=ROLE_LABELS.get, on_change=reset_page)
+
+    col1, col2, col3 = st.columns(3)
+    dates = col1.date_input("Started between", value=(), on_change=reset_page)
+    outcome = col2.selectbox("Outcome", list(OUTCOME_LABELS), format_func=OUTCOME_LABELS.get, on_change=reset_page)
+    diagnosis = None
+    names = list(get_scenario(scenario_id).diagnoses)
+    name = col3.selectbox("Diagnosis", [None] + names, format_func=lambda name: name or "Any", on_change=reset_page)
+    if name:
+        result = col3.radio("Result", ["missed", "correct", "incorrect"], horizontal=True, on_change=reset_page)
+        diagnosis = (name, result)
+
+    since = until = None
+    if len(dates) == 2:
+        since = datetime.combine(dates[0], time.min)
+        until = datetime.combine(dates[1], time.min) + timedelta(days=1)
+    return {
+        "identifier_prefix": identifier_prefix or None,
+        "scenario_id": scenario_id,
+        "role": role,
+        "since": since,
+        "until": until,
+        "outcome": outcome,
+        "diagnosis": diagnosis,
+    }
+
+
+def show_hit(index, hit):
+    started = f"{hit['started']:%Y-%m-%d %H:%M}" if hit["started"] else "unknown date"
+    score = f" · {hit['total_correct']} correct, {hit['total_missed']} missed" if hit["total_correct"] is not None else ""
+    with st.container(border=True):
+        st.markdown(f"**{hit['identifier']}** · {hit['scenario_id']} · {started}{score}")
+        if hit["snippet"]:
+            st.markdown(hit["snippet"].replace("\n", " · "))
+        with st.expander("Transcript"):
+            for message in index.messages(hit["session_id"]):
+                speaker = "Clinician" if message["role"] == "user" else "Patient"
+                st.markdown(f"**{speaker}:** {message['content']}")
+
+
+with measure_interaction("transcript_search", "page"):
+    st.set_page_config(page_title="Transcript Search", page_icon="🔎", layout="wide")
+    st.title("🔎 Transcript Search")
+
+    instructor_key = get_setting("INSTRUCTOR_KEY")
+    if not instructor_key:
+        st.error("Transcript search is disabled. Set INSTRUCTOR_KEY in the app secrets to enable it.")
+        st.stop()
+
+    if st.session_state.get("instructor_key") != instructor_key:
+        entered = st.text_input("Instructor key", type="password")
+        if entered != instructor_key:
+            if entered:
+                st.error("❌ Incorrect instructor key.")
+            st.stop()
+        st.session_state["instructor_key"] = entered
+
+    indexer = get_search_index(st.secrets["MONGODB_CONNECTION_STRING"])
+    index = indexer.index
+    st.caption(f"{index.session_count()} sessions indexed · new activity appears within {indexer.interval:g}s")
+    if indexer.error:
+        st.warning(f"The index may be behind: {indexer.error}")
+
+    query = st.text_input(
+        "Search transcripts",
+        placeholder='e.g. self-harm, "thoughts of self-harm", contracept*',
+        on_change=reset_page
+    ).strip()
+    filters = search_filters()
+
+    page = st.session_state.setdefault("search_page", 1)
+    results = index.search(query, page=page, page_size=PAGE_SIZE, **filters)
+
+    if not results["total"]:
+        st.info("No sessions match.")
+        st.stop()
+
+    by_scenario = ", ".join(f"{count} {scenario_id}" for scenario_id, count in results["scenarios"].items())
+    st.markdown(f"**{results['total']} sessions** ({by_scenario})")
+    for hit in results["hits"]:
+        show_hit(index, hit)
+
+    pages = -(-results["total"] // PAGE_SIZE)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("← Previous", disabled=page <= 1):
+        st.session_state["search_page"] = page - 1
+        st.rerun()
+    col2.caption(f"Page {page} of {pages}")
+    if col3.button("Next →", disabled=page >= pages):
+        st.session_state["search_page"] = page + 1
+        st.rerun()
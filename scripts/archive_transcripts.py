@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Archive old transcripts out of the live collection
+
+Streams finished sessions older than a cutoff from diss_chatbot.transcripts
+into zstd-compressed Parquet files, reads each file back to verify it, and
+only then deletes that batch (and any GridFS payloads it referenced) from
+MongoDB. Archived sessions remain readable through utils.archive.find_transcripts.
+
+Meant to be run on a schedule (cron, a CI job, ...). Requires pyarrow.
+
+Usage:
+    python scripts/archive_transcripts.py --uri "$MONGODB_CONNECTION_STRING" \\
+        --dest ./archive [--older-than-days 180] [--batch-size 500] [--include-abandoned] [--dry-run]
+
+--dest may be a local directory or an object-store URI (s3://bucket/prefix,
+gs://bucket/prefix) using the credentials pyarrow finds in the environment.
+"""
+
+import argparse
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.archive import archive_filesystem, archive_row, archive_schema  # noqa: E402
+from utils.feedback_batch import JOB_DONE  # noqa: E402
+from utils.mongodb import MESSAGES_BUCKET, STATUS_COMPLETE, get_mongo_client  # noqa: E402
+from utils.transcript_codec import packed_field  # noqa: E402
+
+MESSAGE_FIELDS = ["patient_messages", "patient_audio_messages", "assessor_messages"]
+
+
+def archive_query(cutoff, include_abandoned):
+    """Sessions to archive.
+
+    Documents written before the status field existed are finished ones, and
+    so are sessions whose batch feedback is done, even if the trainee never
+    opened it (their status stays "feedback").
+    """
+    query = {"timestamp": {"$lt": cutoff}}
+    if not include_abandoned:
+        query["$or"] = [
+            {"status": STATUS_COMPLETE},
+            {"status": {"$exists": False}},
+            {"feedback_job.status": JOB_DONE},
+        ]
+    return query
+
+
+def offloaded_files(document):
+    """GridFS file ids referenced by a transcript document."""
+    return [
+        document[packed_field(field)]["file_id"]
+        for field in MESSAGE_FIELDS
+        if "file_id" in (document.get(packed_field(field)) or {})
+    ]
+
+
+def write_batch(uri, documents, filesystem, directory, name):
+    """Write one batch to Parquet and verify it by reading it back. Returns the file path."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = [archive_row(uri, document) for document in documents]
+    table = pa.Table.from_pylist(rows, schema=archive_schema())
+    path = f"{directory.rstrip('/')}/{name}"
+    pq.write_table(table, path, filesystem=filesystem, compression="zstd")
+
+    written = pq.read_table(path, filesystem=filesystem, columns=["id", "message_count"])
+    expected = {row["id"]: row["message_count"] for row in rows}
+    actual = dict(zip(written.column("id").to_pylist(), written.column("message_count").to_pylist()))
+    if written.num_rows != len(rows) or actual != expected:
+        raise RuntimeError(f"Verification failed for {path}: wrote {len(rows)} rows, read back {written.num_rows}")
+    return path
+
+
+def delete_batch(uri, documents):
+    from gridfs import GridFSBucket
+    db = get_mongo_client(uri).diss_chatbot
+    result = db.transcripts.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+    bucket = GridFSBucket(db, bucket_name=MESSAGES_BUCKET)
+    for document in documents:
+        for file_id in offloaded_files(document):
+            bucket.delete(file_id)
+    return result.deleted_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old transcripts from MongoDB into Parquet files")
+    parser.add_argument("--uri", required=True, help="MongoDB connection string")
+    parser.add_argument("--dest", required=True, help="Archive directory or object-store URI")
+    parser.add_argument("--older-than-days", type=int, default=180)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--include-abandoned", action="store_true",
+                        help="Also archive sessions that were never finished")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+    args = parser.parse_args()
+
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    query = archive_query(cutoff, args.include_abandoned)
+    collection = get_mongo_client(args.uri).diss_chatbot.transcripts
+
+    if args.dry_run:
+        print(f"{collection.count_documents(query)} transcripts older than {cutoff:%Y-%m-%d} would be archived")
+        return
+
+    filesystem, directory = archive_filesystem(args.dest)
+    filesystem.create_dir(directory, recursive=True)
+    run = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    archived = deleted = 0
+    batch = []
+    # Sorting on _id keeps the scan stable while earlier batches are deleted
+    cursor = collection.find(query, batch_size=args.batch_size).sort("_id", 1)
+
+    def flush():
+        nonlocal archived, deleted
+        path = write_batch(args.uri, batch, filesystem, directory, f"transcripts-{run}-{archived // args.batch_size:05d}.parquet")
+        archived += len(batch)
+        deleted += delete_batch(args.uri, batch)
+        print(f"  {path}: {len(batch)} sessions")
+        batch.clear()
+
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= args.batch_size:
+            flush()
+    if batch:
+        flush()
+
+    print(f"Archived {archived} transcripts older than {cutoff:%Y-%m-%d}; deleted {deleted} from MongoDB")
+
+
+if __name__ == "__main__":
+    main()
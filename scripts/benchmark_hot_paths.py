@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the pure hot paths
+
+Times the pure-Python work the pages redo on every rerun or submission:
+the assessor prompt (transcript join and diagnosis summary), diagnosis
+scoring, realtime transcript ordering and rebuilding, and the feedback
+markdown assembly. Each runs on synthetic inputs across a size ladder,
+10 to 1000 turns for transcripts, and reports the best time per call.
+
+Every run also times a fixed calibration workload, and cases are compared
+as multiples of it, which absorbs most of the difference between machines
+and load. With --baseline it compares against a stored run and exits with
+status 1 if any case slowed down by more than --threshold. Baselines are
+still only meaningful on the host that recorded them, so none is
+committed: save one on your machine before changing these functions.
+
+Usage:
+    python scripts/benchmark_hot_paths.py --save-baseline .benchmarks/hot_paths.json
+    python scripts/benchmark_hot_paths.py --baseline .benchmarks/hot_paths.json [--threshold 0.25]
+    python scripts/benchmark_hot_paths.py --filter realtime --repeat 25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.feedback import (  # noqa: E402
+    assessor_prompt,
+    feedback_markdown,
+    format_diagnosis_summary,
+    format_transcript,
+    parse_feedback,
+)
+from utils.report_export import HEADSS_ELEMENTS  # noqa: E402
+from utils.scenarios import Scenario, get_scenario  # noqa: E402
+from utils.transcript import Transcript, order_realtime  # noqa: E402
+
+TURN_LADDER = (10, 50, 100, 500, 1000)
+DIAGNOSIS_LADDER = (5, 15, 50)
+FEEDBACK_ITEM_LADDER = (3, 10, 30)
+
+WORDS = ("i", "dunno", "school", "mum", "friends", "sleep", "sometimes", "really", "tired", "weekend",
+         "party", "drink", "feel", "okay", "worried", "home", "dad", "phone", "late", "class", "anxious",
+         "how", "are", "things", "tell", "me", "about", "what", "do", "you", "with", "your", "time")
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def synthetic_history(turns, rng):
+    """turns clinician/patient exchanges of realistic length."""
+    history = []
+    for _ in range(turns):
+        history.append({"role": "user", "content": sentence(rng, rng.randint(6, 20))})
+        history.append({"role": "assistant", "content": sentence(rng, rng.randint(10, 40))})
+    return history
+
+
+def realtime_events(turns, rng):
+    """Realtime transcript events for turns exchanges, with about 1 in 10 delivered out of order."""
+    events = []
+    for index, message in enumerate(synthetic_history(turns, rng)):
+        events.append({
+            "type": "user" if message["role"] == "user" else "assistant",
+            "content": message["content"],
+            "sequence": index,
+            "timestamp": 1_700_000_000 + index * 3.5,
+        })
+    for index in range(0, len(events) - 1, 10):
+        events[index], events[index + 1] = events[index + 1], events[index]
+    return events
+
+
+def synthetic_scenario(diagnoses, rng):
+    manifest = {
+        "patient": {"name": "Bench"},
+        "diagnoses": [
+            {"name": f"Diagnosis {index}", "correct": rng.random() < 0.3, "description": sentence(rng, 12)}
+            for index in range(diagnoses)
+        ],
+    }
+    return Scenario("bench", manifest, "", "")
+
+
+def structured_feedback(items, rng):
+    """An assessor reply in the structured format, without "Detailed Feedback"."""
+    return {
+        "Overall Assessment": " ".join(sentence(rng, 18) for _ in range(4)),
+        "Strengths": [sentence(rng, 14) for _ in range(items)],
+        "Areas for Improvement": [sentence(rng, 14) for _ in range(items)],
+        "HEADSS Coverage Analysis": {element: rng.random() < 0.6 for element in HEADSS_ELEMENTS},
+        "Recommendations": [sentence(rng, 14) for _ in range(items)],
+        "Diagnostic Accuracy": {"Total Correct": 2},
+    }
+
+
+def diagnosis_results(rng):
+    return synthetic_scenario(15, rng).score({f"Diagnosis {i}": rng.random() < 0.4 for i in range(15)})
+
+
+def bench_format_transcript(size, rng):
+    history = synthetic_history(size, rng)
+    return lambda: format_transcript(history)
+
+
+def bench_assessor_prompt(size, rng):
+    scenario = get_scenario()
+    history = Transcript(synthetic_history(size, rng))
+    results = diagnosis_results(rng)
+    return lambda: assessor_prompt(scenario, history, results, results["total_possible"])
+
+
+def bench_diagnosis_summary(size, rng):
+    scenario = synthetic_scenario(size, rng)
+    results = scenario.score({name: rng.random() < 0.4 for name in scenario.diagnoses})
+    return lambda: format_diagnosis_summary(results, scenario.correct_count)
+
+
+def bench_score(size, rng):
+    scenario = synthetic_scenario(size, rng)
+    selections = {name: rng.random() < 0.4 for name in scenario.diagnoses}
+    return lambda: scenario.score(selections)
+
+
+def bench_order_realtime(size, rng):
+    events = realtime_events(size, rng)
+    return lambda: order_realtime(events)
+
+
+def bench_transcript_from_realtime(size, rng):
+    events = order_realtime(realtime_events(size, rng))
+    return lambda: Transcript.from_realtime(events)
+
+
+def bench_feedback_markdown(size, rng):
+    feedback = parse_feedback(json.dumps(structured_feedback(size, rng)), True)[0]
+    return lambda: feedback_markdown(feedback)
+
+
+def bench_parse_feedback(size, rng):
+    content = json.dumps(structured_feedback(size, rng))
+    return lambda: parse_feedback(content, True)
+
+
+# (name, size axis, ladder, setup(size, rng) -> callable)
+BENCHMARKS = (
+    ("format_transcript", "turns", TURN_LADDER, bench_format_transcript),
+    ("assessor_prompt", "turns", TURN_LADDER, bench_assessor_prompt),
+    ("diagnosis_summary", "diagnoses", DIAGNOSIS_LADDER, bench_diagnosis_summary),
+    ("score_diagnoses", "diagnoses", DIAGNOSIS_LADDER, bench_score),
+    ("order_realtime", "turns", TURN_LADDER, bench_order_realtime),
+    ("transcript_from_realtime", "turns", TURN_LADDER, bench_transcript_from_realtime),
+    ("feedback_markdown", "items", FEEDBACK_ITEM_LADDER, bench_feedback_markdown),
+    ("parse_feedback", "items", FEEDBACK_ITEM_LADDER, bench_parse_feedback),
+)
+
+
+def calibration(rng):
+    """Fixed workload of string, dict and JSON work like the cases', timed as the unit of comparison."""
+    history = synthetic_history(50, rng)
+
+    def workload():
+        text = "\n".join(f"{message['role']}: {message['content']}" for message in history)
+        counts = {}
+        for word in text.split():
+            counts[word] = counts.get(word, 0) + 1
+        return json.dumps(sorted(counts.items()))
+    return workload
+
+
+def measure(function, repeat):
+    """Best seconds per call over repeat rounds, each sized to run for at least 0.2s."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results, unit, baseline, threshold):
+    """Print the change per case, relative to each run's calibration; returns the cases that regressed."""
+    regressions = []
+    print(f"\n{'case':<36}{'baseline':>10}{'now':>10}{'change':>10}   (multiples of the calibration)")
+    for case, seconds in results.items():
+        before = baseline["results"].get(case)
+        if before is None:
+            continue
+        before /= baseline["calibration"]
+        after = seconds / unit
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSED"
+            regressions.append(case)
+        print(f"{case:<36}{before:>10.3f}{after:>10.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the pages' pure hot paths")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=15, help="Timing rounds per case (the best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic inputs")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown counted as a regression")
+    parser.add_argument("--save-baseline", default=None, help="Write this run's results as a baseline")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"Python {platform.python_version()} on {platform.machine()} ({platform.node()})")
+    unit = measure(calibration(random.Random(args.seed)), args.repeat)
+    print(f"\ncalibration  {unit * 1e6:>10.1f}us")
+    for name, axis, ladder, setup in BENCHMARKS:
+        if args.filter and args.filter not in name:
+            continue
+        print(f"\n{name}")
+        for size in ladder:
+            function = setup(size, random.Random(args.seed))
+            seconds = measure(function, args.repeat)
+            results[f"{name}[{axis}={size}]"] = seconds
+            print(f"  {axis:>9} {size:>5}  {seconds * 1e6:>10.1f}us")
+    if not results:
+        sys.exit(f"No benchmark matches {args.filter!r}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if "calibration" not in baseline:
+            sys.exit(f"{args.baseline} has no calibration; save a new baseline on this machine")
+        recorded = (baseline.get("host"), baseline.get("python"), baseline.get("machine"))
+        if recorded != (platform.node(), platform.python_version(), platform.machine()):
+            print(f"\nWarning: baseline was recorded on {recorded[0]} (Python {recorded[1]} on {recorded[2]}); "
+                  f"save one on this machine for a reliable comparison")
+        regressions = compare(results, unit, baseline, args.threshold)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as file:
+            json.dump({
+                "host": platform.node(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "calibration": unit,
+                "results": results,
+            }, file, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmark for the patient-simulator LLM providers
+
+Plays the same scripted clinician turns against each provider through the
+request path the interview page uses (utils.llm.Provider.create with the
+patient prompt and a Transcript request view) and reports, side by side:
+  - time to first token (median / p95)
+  - full reply time (median / p95)
+  - completion tokens per second per stream
+  - aggregate tokens per second at each concurrency level
+
+Providers are configured exactly as for the app (OPENAI_API_KEY,
+LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, ... in the environment).
+
+Usage:
+    python scripts/benchmark_llm_providers.py [--providers openai,local] [--turns 6] [--concurrency 1,4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.llm import create_provider  # noqa: E402
+from utils.scenarios import get_scenario  # noqa: E402
+from utils.transcript import Transcript  # noqa: E402
+
+CLINICIAN_TURNS = [
+    "Hi Jai, I'm one of the doctors here. Is it ok if we have a chat today?",
+    "Before we start, everything you tell me stays between us unless I'm worried about your safety. Does that make sense?",
+    "How are things at home at the moment?",
+    "How's school going?",
+    "What do you like to do when you're not at school?",
+    "How have you been sleeping and eating lately?",
+    "Some people your age try vaping or drinking. Is that something you've come across?",
+    "Have you been feeling down or stressed recently?",
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_conversation(provider, prompt, turns):
+    """One scripted interview; returns a (ttft, total, completion_tokens) sample per turn."""
+    history = Transcript()
+    samples = []
+    for clinician in CLINICIAN_TURNS[:turns]:
+        history.add("user", clinician)
+        started = time.perf_counter()
+        first = None
+        parts = []
+        usage_tokens = None
+        for chunk in provider.create(history.request_messages(prompt), stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first is None:
+                    first = time.perf_counter() - started
+                parts.append(chunk.choices[0].delta.content)
+            if getattr(chunk, "usage", None):
+                usage_tokens = chunk.usage.completion_tokens
+        total = time.perf_counter() - started
+        reply = "".join(parts)
+        history.add("assistant", reply)
+        # Without usage in the stream, one content delta is roughly one token
+        samples.append((first if first is not None else total, total, usage_tokens or len(parts)))
+    return samples
+
+
+def benchmark(provider, prompt, turns, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: run_conversation(provider, prompt, turns), range(concurrency)))
+    wall = time.perf_counter() - started
+    samples = [sample for conversation in results for sample in conversation]
+    ttfts = [s[0] for s in samples]
+    totals = [s[1] for s in samples]
+    rates = [s[2] / max(s[1] - s[0], 1e-6) for s in samples]
+    return {
+        "ttft_p50": statistics.median(ttfts),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "total_p50": statistics.median(totals),
+        "total_p95": percentile(totals, 0.95),
+        "stream_tps": statistics.median(rates),
+        "aggregate_tps": sum(s[2] for s in samples) / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM providers for the patient simulator")
+    parser.add_argument("--providers", default="openai,local", help="Comma-separated provider names")
+    parser.add_argument("--turns", type=int, default=6, help=f"Clinician turns per conversation (max {len(CLINICIAN_TURNS)})")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated numbers of simultaneous conversations")
+    args = parser.parse_args()
+
+    prompt = get_scenario().patient_prompt
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{'provider':<10}{'model':<22}{'conc':>5}{'ttft p50':>10}{'ttft p95':>10}"
+          f"{'reply p50':>11}{'reply p95':>11}{'tok/s':>8}{'agg tok/s':>11}")
+    for name in args.providers.split(","):
+        provider = create_provider(name.strip())
+        for level in levels:
+            try:
+                result = benchmark(provider, prompt, args.turns, level)
+            except Exception as error:
+                print(f"{provider.name:<10}{provider.model[:21]:<22}{level:>5}  failed: {error}")
+                break
+            print(f"{provider.name:<10}{provider.model[:21]:<22}{level:>5}"
+                  f"{result['ttft_p50']:>9.2f}s{result['ttft_p95']:>9.2f}s"
+                  f"{result['total_p50']:>10.2f}s{result['total_p95']:>10.2f}s"
+                  f"{result['stream_tps']:>8.1f}{result['aggregate_tps']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sync and async MongoDB data-access paths
+
+Runs the same number of check_identifier lookups through the pooled sync
+client on a thread pool and through the async client on a single event loop,
+and reports throughput for each.
+
+Usage:
+    python scripts/benchmark_mongodb_async.py --uri "$MONGODB_CONNECTION_STRING" --ops 5000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils import mongodb, mongodb_async  # noqa: E402
+
+
+def run_sync(uri, identifier, ops, concurrency):
+    mongodb.check_identifier(uri, identifier)  # warm the pool
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: mongodb.check_identifier(uri, identifier), range(ops)))
+    return time.perf_counter() - started
+
+
+async def run_async(uri, identifier, ops, concurrency):
+    await mongodb_async.check_identifier(uri, identifier)  # warm the pool
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await mongodb_async.check_identifier(uri, identifier)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(ops)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_CONNECTION_STRING"), help="MongoDB connection string")
+    parser.add_argument("--identifier", default="benchmark", help="Identifier to look up")
+    parser.add_argument("--ops", type=int, default=2000, help="Lookups per path")
+    parser.add_argument("--concurrency", type=int, default=100, help="In-flight lookups (threads for sync)")
+    args = parser.parse_args()
+
+    if not args.uri:
+        print("❌ MongoDB connection string is required (--uri or MONGODB_CONNECTION_STRING)")
+        sys.exit(1)
+
+    sync_seconds = run_sync(args.uri, args.identifier, args.ops, args.concurrency)
+    async_seconds = asyncio.run(run_async(args.uri, args.identifier, args.ops, args.concurrency))
+
+    print(f"{'path':<8}{'ops':>8}{'seconds':>10}{'ops/s':>10}")
+    for name, seconds in (("sync", sync_seconds), ("async", async_seconds)):
+        print(f"{name:<8}{args.ops:>8}{seconds:>10.2f}{args.ops / seconds:>10.0f}")
+    print(f"\nsync used {args.concurrency} threads; async used 1 thread")
+
+
+if __name__ == "__main__":
+    main()
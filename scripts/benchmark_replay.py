@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark for the patient simulator
+
+Replays the clinician turns of recorded interviews (from MongoDB and the
+archive, or from a fixture file) through the request path the interview page
+uses: the patient prompt plus a Transcript request view, sent with
+utils.llm.Provider.create(stream=True). Each turn is sent with the recorded
+conversation before it, not with this run's earlier replies, so every run
+asks the model exactly the same questions and results are comparable across
+prompt and model changes.
+
+Per turn it records time to first token, full reply time, completion tokens
+per second and reply length, then prints a summary and, with --baseline,
+the change against a stored run (exit status 1 if a metric regressed by more
+than --threshold).
+
+Providers are configured as for the app; "mock" runs offline with a
+deterministic canned patient (MOCK_LLM_TTFT_SECONDS, MOCK_LLM_TOKENS_PER_SECOND).
+
+Usage:
+    python scripts/benchmark_replay.py --provider mock --save-baseline scripts/baselines/replay_mock.json
+    python scripts/benchmark_replay.py --uri "$MONGODB_CONNECTION_STRING" --identifier-prefix 2025S1 --sessions 20 \\
+        --export-fixture replay.json
+    python scripts/benchmark_replay.py --fixture replay.json --provider openai --concurrency 4 \\
+        --baseline scripts/baselines/replay_openai.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.llm import create_provider  # noqa: E402
+from utils.scenarios import LEGACY_SCENARIO, default_scenario_id, get_scenario  # noqa: E402
+from utils.transcript import Transcript  # noqa: E402
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "replay_transcripts.json")
+
+# Summary metrics compared against a baseline; True where higher is better
+SUMMARY_METRICS = {
+    "ttft_p50": False,
+    "ttft_p95": False,
+    "total_p50": False,
+    "total_p95": False,
+    "tokens_per_second_p50": True,
+    "reply_chars_mean": None,
+    "reply_words_mean": None,
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def load_fixture(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def load_recorded(uri, scenario_id, identifier_prefix=None, sessions=20):
+    """Recent text interviews of a scenario with at least one clinician turn, live or archived."""
+    from utils.archive import find_transcripts
+    from utils.mongodb import read_messages
+
+    recorded = []
+    for document in find_transcripts(uri, identifier_prefix=identifier_prefix):
+        if document.get("conversation_type", "text") != "text":
+            continue
+        if (document.get("scenario_id") or LEGACY_SCENARIO) != scenario_id:
+            continue
+        messages = read_messages(uri, document, "patient_messages")
+        if any(message["role"] == "user" for message in messages):
+            recorded.append({
+                "id": str(document["_id"]),
+                "patient_messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            })
+        if len(recorded) >= sessions:
+            break
+    return recorded
+
+
+def replay_session(provider, prompt, session, max_turns, options):
+    """Replay one recorded interview; returns a result dict per clinician turn."""
+    history = Transcript()
+    results = []
+    for message in session["patient_messages"]:
+        if message["role"] == "user":
+            if len(results) >= max_turns:
+                break
+            history.add("user", message["content"])
+            started = time.perf_counter()
+            first = None
+            parts = []
+            usage_tokens = None
+            for chunk in provider.create(history.request_messages(prompt), stream=True, **options):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first is None:
+                        first = time.perf_counter() - started
+                    parts.append(chunk.choices[0].delta.content)
+                if getattr(chunk, "usage", None):
+                    usage_tokens = chunk.usage.completion_tokens
+            total = time.perf_counter() - started
+            first = first if first is not None else total
+            reply = "".join(parts)
+            # Without usage in the stream, one content delta is roughly one token
+            tokens = usage_tokens or len(parts)
+            results.append({
+                "session": session["id"],
+                "turn": len(results),
+                "ttft": first,
+                "total": total,
+                "tokens": tokens,
+                "tokens_per_second": tokens / max(total - first, 1e-6),
+                "reply_chars": len(reply),
+                "reply_words": len(reply.split()),
+            })
+        elif message["role"] == "assistant":
+            # Carry on from the recorded reply, not this run's
+            history.add(message["role"], message["content"])
+    return results
+
+
+def summarise(turns):
+    return {
+        "turns": len(turns),
+        "ttft_p50": statistics.median(t["ttft"] for t in turns),
+        "ttft_p95": percentile([t["ttft"] for t in turns], 0.95),
+        "total_p50": statistics.median(t["total"] for t in turns),
+        "total_p95": percentile([t["total"] for t in turns], 0.95),
+        "tokens_per_second_p50": statistics.median(t["tokens_per_second"] for t in turns),
+        "reply_chars_mean": statistics.mean(t["reply_chars"] for t in turns),
+        "reply_words_mean": statistics.mean(t["reply_words"] for t in turns),
+    }
+
+
+def compare(summary, baseline, threshold):
+    """Print the change per summary metric; returns the names of metrics that regressed."""
+    regressions = []
+    print(f"\n{'metric':<24}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, higher_is_better in SUMMARY_METRICS.items():
+        before, after = baseline["summary"].get(name), summary[name]
+        if before is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        # Reply length has no better direction; it is reported, not judged
+        if higher_is_better is not None and worse > threshold:
+            flag = "  REGRESSED"
+            regressions.append(name)
+        print(f"{name:<24}{before:>12.3f}{after:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def compare_turns(turns, baseline):
+    """Turns whose reply length moved the most against the baseline run."""
+    before = {(t["session"], t["turn"]): t for t in baseline.get("turn_results", [])}
+    moved = []
+    for turn in turns:
+        previous = before.get((turn["session"], turn["turn"]))
+        if previous:
+            moved.append((turn["reply_words"] - previous["reply_words"], turn, previous))
+    moved.sort(key=lambda item: abs(item[0]), reverse=True)
+    if moved and moved[0][0]:
+        print("\nLargest reply length changes (words):")
+        for delta, turn, previous in moved[:5]:
+            if delta:
+                print(f"  {turn['session']} turn {turn['turn']}: {previous['reply_words']} -> {turn['reply_words']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded clinician turns against the patient simulator")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--fixture", default=None, help=f"JSON list of sessions (default {DEFAULT_FIXTURE})")
+    source.add_argument("--uri", default=None, help="MongoDB connection string to read recorded interviews from")
+    parser.add_argument("--identifier-prefix", default=None, help="With --uri, only sessions for this cohort")
+    parser.add_argument("--sessions", type=int, default=20, help="With --uri, number of recent sessions to replay")
+    parser.add_argument("--export-fixture", default=None, help="Write the sessions used to this fixture file")
+    parser.add_argument("--scenario", default=None, help="Scenario pack whose persona prompt is used (default DEFAULT_SCENARIO)")
+    parser.add_argument("--provider", default="mock", help="openai, local or mock")
+    parser.add_argument("--model", default=None, help="Override the provider's model")
+    parser.add_argument("--max-turns", type=int, default=10, help="Clinician turns replayed per session")
+    parser.add_argument("--concurrency", type=int, default=1, help="Sessions replayed simultaneously")
+    parser.add_argument("--temperature", type=float, default=None, help="Sampling temperature (the app uses the default)")
+    parser.add_argument("--seed", type=int, default=None, help="Sampling seed, where the provider supports one")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--save-baseline", default=None, help="Write this run's results as a baseline")
+    args = parser.parse_args()
+
+    if args.uri:
+        sessions = load_recorded(args.uri, args.scenario or default_scenario_id(), args.identifier_prefix, args.sessions)
+    else:
+        sessions = load_fixture(args.fixture or DEFAULT_FIXTURE)
+    if not sessions:
+        sys.exit("No sessions with clinician turns to replay")
+    if args.export_fixture:
+        with open(args.export_fixture, "w") as file:
+            json.dump(sessions, file, indent=2)
+
+    options = {}
+    if args.temperature is not None:
+        options["temperature"] = args.temperature
+    if args.seed is not None:
+        options["seed"] = args.seed
+
+    provider = create_provider(args.provider, model=args.model)
+    scenario = get_scenario(args.scenario)
+    prompt = scenario.patient_prompt
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(
+            lambda session: replay_session(provider, prompt, session, args.max_turns, options), sessions
+        ))
+    wall = time.perf_counter() - started
+    turns = [turn for session in results for turn in session]
+    summary = summarise(turns)
+    summary["aggregate_tokens_per_second"] = sum(t["tokens"] for t in turns) / wall
+
+    print(f"{provider.name} {provider.model}, scenario {scenario.id} prompt {scenario.prompt_version} "
+          f"({scenario.token_counts['patient_prompt']} tokens), "
+          f"{len(sessions)} sessions, {summary['turns']} turns, concurrency {args.concurrency}")
+    print(f"  ttft     p50 {summary['ttft_p50']:.2f}s  p95 {summary['ttft_p95']:.2f}s")
+    print(f"  reply    p50 {summary['total_p50']:.2f}s  p95 {summary['total_p95']:.2f}s")
+    print(f"  tok/s    p50 {summary['tokens_per_second_p50']:.1f}  aggregate {summary['aggregate_tokens_per_second']:.1f}")
+    print(f"  length   {summary['reply_words_mean']:.1f} words / {summary['reply_chars_mean']:.0f} chars on average")
+
+    run = {
+        "provider": provider.name,
+        "model": provider.model,
+        "scenario": scenario.id,
+        "prompt_version": scenario.prompt_version,
+        "concurrency": args.concurrency,
+        "options": options,
+        "summary": summary,
+        "turn_results": turns,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if (baseline["provider"], baseline["model"], baseline["prompt_version"]) != (
+                run["provider"], run["model"], run["prompt_version"]):
+            print(f"\nBaseline is {baseline['provider']} {baseline['model']}, prompt {baseline['prompt_version']}")
+        regressions = compare(summary, baseline, args.threshold)
+        compare_turns(turns, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(run, file, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Transcript search benchmark
+
+Builds a local search index (utils.search.SearchIndex) over synthetic
+sessions and reports, per query shape, the median and worst latency of
+fetching the first page of results:
+  - a rare term ("self-harm"), a common term ("school") and a phrase
+  - the same with identifier-prefix, scenario, date and outcome filters
+  - filters only, no text
+
+Usage:
+    python scripts/benchmark_search.py [--sessions 100000] [--turns 10] [--index /tmp/search_bench.db]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.search import SearchIndex  # noqa: E402
+
+CLINICIAN = [
+    "How are things at home at the moment?",
+    "How's school going?",
+    "What do you like to do on the weekend?",
+    "Some young people your age try vaping or drinking. Is that something you've come across?",
+    "Are you in a relationship at the moment? Do you know about contraception?",
+    "Have you ever had thoughts of self-harm or hurting yourself?",
+    "How have you been sleeping and eating lately?",
+    "Is there anyone at school who makes you feel unsafe?",
+    "What would you like me to call you?",
+    "Thanks for telling me that.",
+]
+
+PATIENT = [
+    "yeah ok",
+    "It's pretty loud at home.",
+    "School's fine I guess.",
+    "Mostly draw on my tablet.",
+    "Tried a vape a couple times.",
+    "Not great. I'm up late most nights.",
+    "I dunno.",
+]
+
+DIAGNOSES = ["Major Depressive Episode", "Social Anxiety Disorder", "Body Dysmorphic Disorder",
+             "Atypical / Restrictive-type Eating Disorder", "Generalized Anxiety Disorder"]
+
+QUERIES = {
+    "rare term": {"query": "self-harm"},
+    "common term": {"query": "school"},
+    "phrase": {"query": '"thoughts of self-harm"'},
+    "two terms": {"query": "vaping contraception"},
+    "term + cohort": {"query": "contraception", "identifier_prefix": "2025-S1-"},
+    "term + scenario + dates": {"query": "self-harm", "scenario_id": "jai",
+                                "since": datetime(2025, 3, 1), "until": datetime(2025, 6, 1)},
+    "term + missed diagnosis": {"query": "sleeping", "diagnosis": ("Major Depressive Episode", "missed")},
+    "term + outcome, page 5": {"query": "home", "outcome": "all_correct", "page": 5},
+    "filters only": {"identifier_prefix": "2025-S2-", "outcome": "missed"},
+}
+
+
+def make_documents(count, turns, rng):
+    started = datetime(2025, 1, 1)
+    for i in range(count):
+        messages = []
+        for _ in range(turns):
+            messages.append({"role": "user", "content": rng.choice(CLINICIAN)})
+            messages.append({"role": "assistant", "content": rng.choice(PATIENT)})
+        correct = [d for d in DIAGNOSES[:4] if rng.random() < 0.7]
+        yield {
+            "_id": f"{i:024x}",
+            "identifier": f"2025-S{1 + i % 2}-{i % 400:04d}",
+            "scenario_id": rng.choice(["jai", "jai", "mia"]),
+            "timestamp": started + timedelta(minutes=5 * i),
+            "status": "complete",
+            "patient_messages": messages,
+            "diagnosis_results": {
+                "correct_selections": correct,
+                "incorrect_selections": ["Generalized Anxiety Disorder"] if rng.random() < 0.3 else [],
+                "missed_diagnoses": [d for d in DIAGNOSES[:4] if d not in correct],
+                "total_correct": len(correct),
+                "total_incorrect": 0,
+                "total_missed": 4 - len(correct),
+            },
+        }
+
+
+def build(path, sessions, turns):
+    index = SearchIndex(path)
+    if index.session_count() >= sessions:
+        return index
+    rng = random.Random(7)
+    started = time.perf_counter()
+    batch = []
+    for document in make_documents(sessions, turns, rng):
+        batch.append(document)
+        if len(batch) == 1000:
+            index.index_documents(batch, lambda document, field: document.get(field, []))
+            batch = []
+    if batch:
+        index.index_documents(batch, lambda document, field: document.get(field, []))
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {sessions} sessions ({sessions * turns * 2} messages) in {elapsed:.1f}s, "
+          f"{os.path.getsize(path) / 1e6:.0f} MB")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript search latency")
+    parser.add_argument("--sessions", type=int, default=100000, help="Synthetic sessions to index")
+    parser.add_argument("--turns", type=int, default=10, help="Clinician turns per session")
+    parser.add_argument("--index", default="/tmp/search_bench.db", help="Index file (reused if already built)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    args = parser.parse_args()
+
+    index = build(args.index, args.sessions, args.turns)
+
+    print(f"{'query':<28}{'total':>9}{'p50':>10}{'max':>10}")
+    for name, params in QUERIES.items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = index.search(**params)
+            timings.append(time.perf_counter() - started)
+        print(f"{name:<28}{results['total']:>9}{statistics.median(timings) * 1000:>8.0f}ms{max(timings) * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
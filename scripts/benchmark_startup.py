@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the DiSS Chatbot
+
+Reports, each in a fresh interpreter so nothing is already imported:
+  - cumulative import time of the app entry modules and heavy dependencies
+  - time to the first render of each page with Streamlit's AppTest harness
+
+Usage:
+    python scripts/benchmark_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MODULES = ["streamlit", "openai", "pymongo", "Home"]
+
+PAGES = [
+    "Home.py",
+    "pages/1_Patient_Interview.py",
+    "pages/2_Diagnostic_Assessment.py",
+    "pages/3_Feedback_Report.py",
+]
+
+FIRST_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.secrets["OPENAI_API_KEY"] = "sk-benchmark"
+at.secrets["MONGODB_CONNECTION_STRING"] = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=1"
+started = time.perf_counter()
+at.run()
+print(json.dumps({"seconds": time.perf_counter() - started, "exception": bool(at.exception)}))
+"""
+
+
+def import_time(module):
+    """Cumulative import time of a module in microseconds, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return None
+
+
+def first_render(page):
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RENDER, page],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and first-render time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    print("Import time (cumulative, median of runs)")
+    for module in MODULES:
+        samples = [t for t in (import_time(module) for _ in range(args.runs)) if t is not None]
+        if samples:
+            print(f"  {module:<12}{statistics.median(samples) / 1000:>10.1f} ms")
+        else:
+            print(f"  {module:<12}{'not importable':>14}")
+
+    print("\nFirst render (fresh process, median of runs)")
+    for page in PAGES:
+        samples = [r for r in (first_render(page) for _ in range(args.runs)) if r is not None]
+        if samples:
+            seconds = statistics.median(r["seconds"] for r in samples)
+            print(f"  {page:<34}{seconds * 1000:>10.1f} ms")
+        else:
+            print(f"  {page:<34}{'failed':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for chat history storage
+
+Builds the same synthetic interviews as a list of message dicts (the old
+representation) and as utils.transcript.Transcript, and reports retained
+bytes per turn per session plus the allocations made building one request.
+
+Usage:
+    python scripts/benchmark_transcript_memory.py [--sessions 200] [--turns 60]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.transcript import Transcript  # noqa: E402
+
+CLINICIAN = [
+    "Hi Jai, I'm one of the school doctors. What would you like me to call you?",
+    "Before we start, can I explain what stays private between us?",
+    "How are things at home at the moment?",
+    "What do you usually do after school?",
+    "Some young people your age try vaping or drinking. Is that something you've come across?",
+    "How have you been sleeping lately?",
+    "ok",
+    "Thanks for telling me that.",
+]
+
+PATIENT = [
+    "Jai's fine.",
+    "yeah ok",
+    "It's pretty loud at home. Mum and my step-dad argue about my phone sometimes.",
+    "Mostly draw on my tablet. Don't really go out much.",
+    "Tried a vape a couple times. Felt dumb about it.",
+    "Not great. I'm up late most nights and wrecked in the morning.",
+    "I dunno.",
+    "Thanks for talking with me, doc.",
+]
+
+
+def make_turns(turns, rng):
+    # Fresh string objects per session, as they would arrive from the browser and the API
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": "".join(rng.choice(CLINICIAN))})
+        messages.append({
+            "role": "assistant",
+            "content": "".join(rng.choice(PATIENT)),
+            "metrics": {"ttft_s": 0.4, "generation_s": 1.2, "prompt_tokens": 1500 + i * 40, "completion_tokens": 30},
+        })
+    return messages
+
+
+def retained(build, sessions, turns):
+    rng = random.Random(42)
+    sources = [make_turns(turns, rng) for _ in range(sessions)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    histories = [build(source) for source in sources]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del histories
+    return (after - before) / (sessions * turns)
+
+
+def build_list(source):
+    history = []
+    for message in source:
+        history.append(dict(message))
+    return history
+
+
+def build_transcript(source):
+    history = Transcript()
+    for message in source:
+        history.append(message)
+    return history
+
+
+def request_allocations(history, build_request):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    request = build_request(history)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del request
+    return peak - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat history memory per turn")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=60, help="Clinician/patient exchanges per session")
+    args = parser.parse_args()
+
+    list_bytes = retained(build_list, args.sessions, args.turns)
+    transcript_bytes = retained(build_transcript, args.sessions, args.turns)
+
+    # Message text and metrics are shared with the source in both cases, so
+    # this is the per-message container overhead each representation adds
+    print(f"{args.sessions} sessions x {args.turns} turns (storage overhead excluding message text)")
+    print(f"  list of dicts : {list_bytes:>8.0f} bytes/turn/session")
+    print(f"  Transcript    : {transcript_bytes:>8.0f} bytes/turn/session")
+    print(f"  saving        : {1 - transcript_bytes / list_bytes:>8.0%}")
+
+    source = make_turns(args.turns, random.Random(7))
+    old_request = request_allocations(build_list(source), lambda history: [{"role": "system", "content": "prompt"}] + [
+        {"role": m["role"], "content": m["content"]} for m in history
+    ])
+    new_request = request_allocations(build_transcript(source), lambda history: history.request_messages("prompt"))
+    print(f"\nBuilding one request at {args.turns} turns")
+    print(f"  copied list   : {old_request:>8} bytes allocated")
+    print(f"  request view  : {new_request:>8} bytes allocated")
+
+
+if __name__ == "__main__":
+    main()
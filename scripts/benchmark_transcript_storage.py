@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Storage benchmark for transcript documents
+
+Compares plain message arrays with the packed (compressed) representation
+used for finished sessions, on synthetic interviews of realistic length:
+  - BSON document size
+  - pack / unpack time
+  - with --uri, write and read latency against a scratch collection
+
+Usage:
+    python scripts/benchmark_transcript_storage.py [--uri "$MONGODB_CONNECTION_STRING"]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bson  # noqa: E402
+
+from utils.transcript_codec import pack_messages, unpack_messages  # noqa: E402
+
+LENGTHS = [20, 60, 150, 400]
+
+WORDS = (
+    "yeah nah I dunno school has been hard lately mum step-dad aunty footy drawing tablet "
+    "phone group chat tired sleep breakfast hoodie lights noise quiet room culture koori "
+    "how are things at home can you tell me more about that what helps when you feel "
+    "like that is it ok if I ask some questions about safety thanks for sharing"
+).split()
+
+
+def make_messages(count, rng):
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 45)))
+        message = {"role": role, "content": text.capitalize() + "."}
+        if role == "assistant":
+            message["metrics"] = {
+                "model": "gpt-4o-mini", "prompt_version": "3f2a9c1b", "ttft_s": round(rng.uniform(0.2, 1.5), 4),
+                "generation_s": round(rng.uniform(0.5, 4), 4), "render_s": 0.01,
+                "prompt_tokens": 1500 + i * 40, "completion_tokens": rng.randint(10, 80), "cached_tokens": 1280,
+            }
+        messages.append(message)
+    return messages
+
+
+def timed(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, statistics.median(samples)
+
+
+def live_latency(uri, plain_doc, packed_doc, repeat=20):
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+    client = MongoClient(uri, server_api=ServerApi('1'))
+    collection = client.diss_chatbot.benchmark_transcripts
+    results = {}
+    try:
+        for name, document in (("plain", plain_doc), ("packed", packed_doc)):
+            writes, reads = [], []
+            for _ in range(repeat):
+                doc = dict(document)
+                started = time.perf_counter()
+                inserted = collection.insert_one(doc).inserted_id
+                writes.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                collection.find_one({"_id": inserted})
+                reads.append(time.perf_counter() - started)
+            results[name] = (statistics.median(writes), statistics.median(reads))
+    finally:
+        collection.drop()
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plain and packed transcript storage")
+    parser.add_argument("--uri", default=None, help="MongoDB connection string for live latency (optional)")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print(f"{'messages':>8}{'plain KB':>10}{'packed KB':>11}{'ratio':>7}{'pack ms':>9}{'unpack ms':>11}")
+    for count in LENGTHS:
+        messages = make_messages(count, rng)
+        plain_doc = {"identifier": "bench", "patient_messages": messages, "message_count": count}
+        (codec, payload), pack_seconds = timed(lambda: pack_messages(messages))
+        _, unpack_seconds = timed(lambda: unpack_messages(codec, payload))
+        packed_doc = {"identifier": "bench", "patient_messages_packed": {"codec": codec, "count": count, "data": payload},
+                      "message_count": count}
+        plain_size = len(bson.encode(plain_doc))
+        packed_size = len(bson.encode(packed_doc))
+        print(f"{count:>8}{plain_size / 1024:>10.1f}{packed_size / 1024:>11.1f}{plain_size / packed_size:>6.1f}x"
+              f"{pack_seconds * 1000:>9.2f}{unpack_seconds * 1000:>11.2f}")
+
+        if args.uri:
+            latency = live_latency(args.uri, plain_doc, packed_doc)
+            for name, (write, read) in latency.items():
+                print(f"{'':>8}  {name:<7} write {write * 1000:.1f} ms, read {read * 1000:.1f} ms")
+
+    print(f"\ncodec: {codec}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Export a cohort's feedback reports
+
+Renders the feedback report of every session whose identifier starts with a
+prefix (live and archived) to HTML and/or PDF, in parallel worker
+processes. Files are named <identifier>_<session id>_<report digest>.<format>,
+so re-running the export skips reports that have not changed.
+
+Usage:
+    python scripts/export_cohort_reports.py --uri "$MONGODB_CONNECTION_STRING" \\
+        --identifier-prefix 2025-S1- --dest ./reports [--formats html,pdf] [--workers 4]
+
+PDF output needs the xhtml2pdf package.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.archive import find_transcripts  # noqa: E402
+from utils.mongodb import read_messages  # noqa: E402
+from utils.report_export import available_formats, render_to_file, report_digest, report_from_document  # noqa: E402
+from utils.scenarios import LEGACY_SCENARIO, get_scenario  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a cohort's feedback reports to HTML/PDF")
+    parser.add_argument("--uri", required=True, help="MongoDB connection string")
+    parser.add_argument("--identifier-prefix", required=True, help="Cohort identifier prefix, e.g. 2025-S1-")
+    parser.add_argument("--dest", required=True, help="Output directory")
+    parser.add_argument("--formats", default=",".join(available_formats()), help="Comma-separated: html,pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Rendering processes")
+    args = parser.parse_args()
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unsupported = set(formats) - set(available_formats())
+    if unsupported:
+        parser.error(f"Unavailable format(s): {', '.join(sorted(unsupported))} (PDF needs xhtml2pdf)")
+    os.makedirs(args.dest, exist_ok=True)
+
+    jobs = []
+    skipped = 0
+    documents = find_transcripts(args.uri, identifier_prefix=args.identifier_prefix)
+    for document in documents:
+        scenario = get_scenario(document.get("scenario_id") or LEGACY_SCENARIO)
+        report = report_from_document(document, scenario, lambda field: read_messages(args.uri, document, field))
+        if report is None:
+            continue
+        stem = f"{report['identifier']}_{report['session_id']}_{report_digest(report)}"
+        for fmt in formats:
+            path = os.path.join(args.dest, f"{stem}.{fmt}")
+            if os.path.exists(path):
+                skipped += 1
+            else:
+                jobs.append((report, fmt, path))
+    print(f"{len(documents)} sessions, {len(jobs)} exports to render, {skipped} unchanged")
+
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = {pool.submit(render_to_file, *job): job for job in jobs}
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                failed += 1
+                print(f"  {futures[future][2]}: {error}")
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {len(jobs) - failed} exports in {elapsed:.1f}s with {args.workers} workers ({failed} failed)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
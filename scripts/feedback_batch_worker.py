@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Batch feedback worker
+
+Generates the feedback of sessions queued by the Feedback Report page in
+deferred mode (DEFERRED_FEEDBACK). Each pass collects finished batches and
+writes feedback_data back to their transcripts, then submits every newly
+queued session as one batch through the provider's Batch API. Trainees see
+their report the next time they open the Feedback Report page, or resume the
+session from Home.
+
+Run one worker per database, as a long-running process or with --once on a
+schedule.
+
+Usage:
+    python scripts/feedback_batch_worker.py --uri "$MONGODB_CONNECTION_STRING" [--interval 300] [--once]
+    python scripts/feedback_batch_worker.py --uri ... --provider mock --stand-in-delay 30
+
+Providers without a Batch API ("local", "mock"), and any provider with
+--stand-in, go through utils.llm.LocalBatchClient, which runs the batch's
+requests one by one once --stand-in-delay seconds have passed.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.feedback_batch import BatchFeedbackWorker  # noqa: E402
+from utils.llm import LocalBatchClient, create_provider  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate deferred feedback through a batch API")
+    parser.add_argument("--uri", required=True, help="MongoDB connection string")
+    parser.add_argument("--provider", default="openai", choices=["openai", "local", "mock"])
+    parser.add_argument("--model", default=None, help="Assessor model (defaults to the provider's)")
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between passes")
+    parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+    parser.add_argument("--stand-in", action="store_true",
+                        help="Use the local Batch API stand-in even for openai")
+    parser.add_argument("--stand-in-dir", default=".feedback_batches", help="Where the stand-in keeps its files")
+    parser.add_argument("--stand-in-delay", type=float, default=0,
+                        help="Seconds a stand-in batch stays in progress")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    provider = create_provider(args.provider, model=args.model)
+    if provider.name == "openai" and not args.stand_in:
+        client = provider.client
+    else:
+        client = LocalBatchClient(provider.client, args.stand_in_dir, args.stand_in_delay)
+    worker = BatchFeedbackWorker(args.uri, client, provider.model, json_mode=provider.json_mode)
+
+    while True:
+        try:
+            written, submitted = worker.run_once()
+            print(f"{time.strftime('%H:%M:%S')} wrote {written} reports, submitted {submitted} sessions")
+        except Exception as error:
+            if args.once:
+                raise
+            logging.warning("Pass failed: %s", error)
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,14 @@ import sys
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 
+def bump_identifier_version(db, removed=False):
+    """Tell running app processes to refresh their in-memory identifier set (utils/identifiers.py)"""
+    update = {"version": 1}
+    if removed:
+        # Removals can't be applied incrementally; a new generation forces a full reload
+        update["generation"] = 1
+    db.metadata.update_one({"_id": "valid_identifiers"}, {"$inc": update}, upsert=True)
+
 def setup_identifiers():
     """Set up valid identifiers in MongoDB"""
     
@@ -48,6 +56,7 @@ def setup_identifiers():
             # Insert identifiers
             result = db.valid_identifiers.insert_many(identifiers)
             print(f"✅ Successfully added {len(result.inserted_ids)} identifiers")
+            bump_identifier_version(db)
             
             # Display all identifiers
             print("\nCurrent valid identifiers:")
@@ -121,6 +130,7 @@ def remove_identifier():
         
         if result.deleted_count > 0:
             print(f"✅ Successfully removed identifier: {identifier}")
+            bump_identifier_version(db, removed=True)
         else:
             print(f"❌ Identifier not found: {identifier}")
         
@@ -0,0 +1,33 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+class Browser:
+    """The parts of the streamlit module that utils.session_store reads, for one browser tab."""
+
+    def __init__(self, cookie="browser-a", query_params=None):
+        self.session_state = {}
+        self.query_params = dict(query_params or {})
+        self.context = SimpleNamespace(cookies={"_streamlit_xsrf": cookie}, headers={"User-Agent": "pytest"})
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    """Returns open(cookie="browser-a", query_params=None), which makes a tab the current one."""
+    import utils.session_store
+
+    def open_tab(cookie="browser-a", query_params=None):
+        tab = Browser(cookie, query_params)
+        use(tab)
+        return tab
+
+    def use(tab):
+        monkeypatch.setattr(utils.session_store, "st", tab)
+
+    open_tab.use = use
+    return open_tab
@@ -0,0 +1,111 @@
+import pytest
+
+from utils.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_threshold=2, reset_timeout=10,
+                          is_failure=lambda error: isinstance(error, ConnectionError), clock=clock)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CLOSED
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+    assert breaker.is_open
+
+
+def test_success_resets_the_failure_count(breaker):
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_fails_fast(breaker, clock):
+    trip(breaker)
+    clock.now = 4
+    calls = []
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert error.value.retry_in == pytest.approx(6)
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # The probe is still running, so other callers are refused
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_probe_reopens(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == pytest.approx(10)
+
+
+def test_errors_that_are_not_failures_pass_through(breaker):
+    def bad_request():
+        raise ValueError("invalid")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            breaker.call(bad_request)
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_interrupted_probe_frees_the_slot(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        breaker.call(interrupted)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from utils.idempotency import SingleFlight
+from utils.mongodb import _upsert_once, idempotent_write, new_transcript_document, server_stamped
+from utils.telemetry import REGISTRY
+
+
+def duplicates(phase, caught):
+    return REGISTRY.get("duplicate_submissions_total", phase=phase, caught=caught)
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def submit():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "session-1"
+
+    before = duplicates("test_concurrent", "in_flight")
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", submit, "test_concurrent")))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", submit, "test_concurrent")))
+    follower.start()
+    # Let the follower start waiting on the leader's call
+    deadline = time.monotonic() + 5
+    while duplicates("test_concurrent", "in_flight") == before and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["session-1", "session-1"]
+    assert len(calls) == 1
+
+
+def test_completed_result_is_reused_until_it_expires():
+    flight = SingleFlight(ttl=60)
+    assert flight.do("key", lambda: 1, "test_reuse") == 1
+    assert flight.do("key", lambda: 2, "test_reuse") == 1
+    assert duplicates("test_reuse", "completed") >= 1
+
+    expired = SingleFlight(ttl=-1)
+    assert expired.do("key", lambda: 1) == 1
+    assert expired.do("key", lambda: 2) == 2
+
+
+def test_failures_are_not_remembered():
+    flight = SingleFlight()
+
+    def fail():
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_oldest_results_are_evicted():
+    flight = SingleFlight(max_results=2)
+    for key in ("a", "b", "c"):
+        flight.do(key, lambda: key)
+    assert flight.do("a", lambda: "again") == "again"
+    assert flight.do("c", lambda: "again") == "c"
+
+
+def test_idempotent_insert_is_an_upsert_on_the_key():
+    document = new_transcript_document([], "student", "interview")
+    write = idempotent_write(("insert", document), "k1")
+    assert write[0] == "upsert"
+    assert write[1] == {"idempotency_key": "k1"}
+    assert write[2]["$setOnInsert"] == {**document, "idempotency_key": "k1"}
+
+
+def test_idempotent_update_skips_documents_that_applied_the_key():
+    write = idempotent_write(("update", {"_id": 1}, {"$set": {"status": "feedback"}}), "k1")
+    assert write == ("update", {"_id": 1, "applied_keys": {"$ne": "k1"}},
+                     {"$set": {"status": "feedback"}, "$addToSet": {"applied_keys": "k1"}})
+
+
+def test_server_stamped_sets_updated_at_with_current_date():
+    document = new_transcript_document([], "student", "interview")
+    write = server_stamped(idempotent_write(("insert", document), "k1"))
+    assert "updated_at" not in write[2]["$setOnInsert"]
+    assert write[2]["$currentDate"] == {"updated_at": True}
+
+    write = server_stamped(("insert", document))
+    assert write[:2] == ("upsert", {"_id": document["_id"]})
+    assert "updated_at" in document
+
+
+class Collection:
+    def __init__(self, upserted_id=None, error=None, existing=None):
+        self.upserted_id = upserted_id
+        self.error = error
+        self.existing = existing
+
+    def update_one(self, filter, update, upsert=False):
+        if self.error:
+            raise self.error
+        return type("Result", (), {"upserted_id": self.upserted_id})()
+
+    def find_one(self, filter, projection=None):
+        return self.existing
+
+
+def test_upsert_returns_the_new_document():
+    write = idempotent_write(("insert", new_transcript_document([], "student", "interview")), "k1")
+    assert _upsert_once(Collection(upserted_id="new"), write, "test_upsert") == "new"
+
+
+def test_upsert_of_a_repeated_key_returns_the_first_document():
+    write = idempotent_write(("insert", new_transcript_document([], "student", "interview")), "k1")
+    before = duplicates("test_upsert_repeat", "database")
+    assert _upsert_once(Collection(existing={"_id": "first"}), write, "test_upsert_repeat") == "first"
+    assert duplicates("test_upsert_repeat", "database") == before + 1
+
+
+def test_upsert_that_loses_a_race_returns_the_winner():
+    write = idempotent_write(("insert", new_transcript_document([], "student", "interview")), "k1")
+    collection = Collection(error=DuplicateKeyError("E11000 duplicate key"), existing={"_id": "winner"})
+    assert _upsert_once(collection, write, "test_upsert_race") == "winner"
+    assert duplicates("test_upsert_race", "database") == 1
@@ -0,0 +1,192 @@
+import pytest
+
+from utils.session_store import (
+    SESSION_PARAM,
+    MemorySessionStore,
+    SQLiteSessionStore,
+    session_token,
+    shared_session_state,
+    verify_token,
+)
+from utils.telemetry import REGISTRY
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+class FailingStore:
+    """Wraps a store; load or save raise while the named operation is in failing."""
+
+    name = "failing"
+
+    def __init__(self, store):
+        self.store = store
+        self.failing = set()
+        self.saves = 0
+
+    def load(self, session_key):
+        if "load" in self.failing:
+            raise ConnectionError("store down")
+        return self.store.load(session_key)
+
+    def save(self, session_key, changes, deleted, expected_version):
+        self.saves += 1
+        if "save" in self.failing:
+            raise ConnectionError("store down")
+        return self.store.save(session_key, changes, deleted, expected_version)
+
+
+def test_save_checks_the_expected_version(store):
+    assert store.save("s", {"diagnosis_done": False}, [], 0) == (1, None)
+    assert store.save("s", {"diagnosis_done": True, "session_id": "abc"}, [], 1) == (2, None)
+
+    version, current = store.save("s", {"diagnosis_done": False}, [], 1)
+
+    assert (version, current) == (2, {"diagnosis_done": True, "session_id": "abc"})
+    assert store.load("s") == ({"diagnosis_done": True, "session_id": "abc"}, 2)
+
+
+def test_save_deletes_keys(store):
+    store.save("s", {"diagnosis_done": True, "session_id": "abc"}, [], 0)
+    store.save("s", {}, ["session_id"], 1)
+    assert store.load("s") == ({"diagnosis_done": True}, 2)
+
+
+def test_token_is_bound_to_the_browser(browser):
+    browser(cookie="browser-a")
+    token = session_token("key")
+    assert verify_token(token) == "key"
+    assert verify_token("key.0123456789abcdef0123456789abcdef") is None
+    assert verify_token("other" + token[3:]) is None
+
+    browser(cookie="browser-b")
+    assert verify_token(token) is None
+
+
+def test_reconnect_to_another_replica_loads_the_state(browser, store):
+    first = browser()
+    with shared_session_state(store):
+        first.session_state["session_id"] = "abc"
+
+    # A new Streamlit session, with the token the first one put in the URL
+    second = browser(query_params=first.query_params)
+    with shared_session_state(store):
+        assert second.session_state["session_id"] == "abc"
+    assert second.session_state["_store_session_key"] == first.session_state["_store_session_key"]
+
+
+def test_forged_token_starts_a_new_session(browser, store):
+    first = browser()
+    with shared_session_state(store):
+        first.session_state["session_id"] = "abc"
+
+    stranger = browser(cookie="browser-b", query_params=first.query_params)
+    with shared_session_state(store):
+        assert "session_id" not in stranger.session_state
+    assert stranger.session_state["_store_session_key"] != first.session_state["_store_session_key"]
+
+
+def test_version_conflict_keeps_both_writers_changes(browser, store):
+    first = browser()
+    with shared_session_state(store):
+        first.session_state["session_id"] = "abc"
+    second = browser(query_params=first.query_params)
+    with shared_session_state(store):
+        pass
+
+    # Both tabs hold version 1; the second writes first
+    with shared_session_state(store):
+        second.session_state["diagnosis_done"] = True
+    browser.use(first)
+    with shared_session_state(store):
+        first.session_state["feedback_report"] = "report"
+
+    values, version = store.load(first.session_state["_store_session_key"])
+    assert values == {"session_id": "abc", "diagnosis_done": True, "feedback_report": "report"}
+    assert first.session_state["diagnosis_done"] is True
+    assert first.session_state["_store_version"] == version == 3
+
+
+def test_changes_stay_pending_after_losing_the_retry(browser, store):
+    class Racing:
+        """Another writer gets in before each of this tab's saves."""
+
+        name = "racing"
+
+        def load(self, session_key):
+            return store.load(session_key)
+
+        def save(self, session_key, changes, deleted, expected_version):
+            _, version = store.load(session_key)
+            store.save(session_key, {"assessor_response_counter": version}, [], version)
+            return store.save(session_key, changes, deleted, expected_version)
+
+    tab = browser()
+    with shared_session_state(store):
+        tab.session_state["session_id"] = "abc"
+    with shared_session_state(Racing()):
+        tab.session_state["diagnosis_done"] = True
+
+    values, version = store.load(tab.session_state["_store_session_key"])
+    assert "diagnosis_done" not in values
+    assert tab.session_state["_store_version"] == version
+    assert tab.session_state["diagnosis_done"] is True
+
+    # The next run writes the change that lost the race
+    with shared_session_state(store):
+        pass
+    assert store.load(tab.session_state["_store_session_key"])[0]["diagnosis_done"] is True
+
+
+def test_load_failure_keeps_local_state_and_retries(browser, store):
+    failing = FailingStore(store)
+    failing.failing.add("load")
+    errors = REGISTRY.get("session_store_errors_total", backend="failing", operation="load")
+
+    tab = browser()
+    with shared_session_state(failing):
+        tab.session_state["session_id"] = "abc"
+
+    assert REGISTRY.get("session_store_errors_total", backend="failing", operation="load") == errors + 1
+    # Not synced, so nothing was written over the stored copy
+    assert failing.saves == 0
+    assert tab.session_state["session_id"] == "abc"
+
+    # Once the store is back, the session syncs and its local state is saved
+    failing.failing.clear()
+    with shared_session_state(failing):
+        tab.session_state["diagnosis_done"] = True
+    assert store.load(tab.session_state["_store_session_key"]) == ({"session_id": "abc", "diagnosis_done": True}, 1)
+
+
+def test_save_failure_retries_on_the_next_run(browser, store):
+    failing = FailingStore(store)
+    tab = browser()
+    with shared_session_state(failing):
+        tab.session_state["session_id"] = "abc"
+
+    failing.failing.add("save")
+    with shared_session_state(failing):
+        tab.session_state["diagnosis_done"] = True
+    assert store.load(tab.session_state["_store_session_key"]) == ({"session_id": "abc"}, 1)
+
+    failing.failing.clear()
+    with shared_session_state(failing):
+        pass
+    assert store.load(tab.session_state["_store_session_key"]) == ({"session_id": "abc", "diagnosis_done": True}, 2)
+
+
+def test_nested_scopes_sync_once(browser, store):
+    counting = FailingStore(store)
+    tab = browser()
+    with shared_session_state(counting):
+        with shared_session_state(counting):
+            tab.session_state["session_id"] = "abc"
+        # The inner scope left the write to the outer one
+        assert counting.saves == 0
+    assert counting.saves == 1
+    assert tab.query_params[SESSION_PARAM] == session_token(tab.session_state["_store_session_key"])
@@ -0,0 +1,170 @@
+import json
+import re
+from datetime import datetime
+
+from utils.config import get_setting
+from utils.mongodb import STATUS_COMPLETE, get_mongo_client, read_messages
+
+# Columns of the archived transcript files. Nested data (messages, diagnosis
+# results) is kept as JSON text so the schema stays flat and stable.
+ARCHIVE_COLUMNS = [
+    ("id", "string"),
+    ("identifier", "string"),
+    ("timestamp", "timestamp"),
+    ("updated_at", "timestamp"),
+    ("status", "string"),
+    ("conversation_type", "string"),
+    ("scenario_id", "string"),
+    ("message_count", "int64"),
+    ("user_turns", "int64"),
+    ("assistant_turns", "int64"),
+    ("char_count", "int64"),
+    ("total_correct", "int64"),
+    ("patient_messages", "string"),
+    ("patient_audio_messages", "string"),
+    ("assessor_messages", "string"),
+    ("diagnosis_results", "string"),
+    ("feedback_data", "string"),
+    ("feedback_job", "string"),
+]
+
+# JSON columns and the value an empty one stands for. Files written before
+# the feedback columns existed read back with nulls there.
+_JSON_COLUMNS = {
+    "patient_messages": list,
+    "patient_audio_messages": list,
+    "assessor_messages": list,
+    "diagnosis_results": dict,
+    "feedback_data": dict,
+    "feedback_job": dict,
+}
+
+
+def archive_schema():
+    import pyarrow as pa
+    types = {"string": pa.string(), "int64": pa.int64(), "timestamp": pa.timestamp("ms")}
+    return pa.schema([(name, types[kind]) for name, kind in ARCHIVE_COLUMNS])
+
+
+def archive_row(connection_string, document):
+    """Flatten a transcript document (in any storage form) into an archive row."""
+    patient = read_messages(connection_string, document, "patient_messages")
+    audio = read_messages(connection_string, document, "patient_audio_messages")
+    assessor = read_messages(connection_string, document, "assessor_messages")
+    diagnosis_results = document.get("diagnosis_results") or {}
+    messages = audio if document.get("conversation_type") == "audio" else patient
+    return {
+        "id": str(document["_id"]),
+        "identifier": document.get("identifier"),
+        "timestamp": document.get("timestamp"),
+        "updated_at": document.get("updated_at") or document.get("timestamp"),
+        "status": document.get("status") or STATUS_COMPLETE,
+        "conversation_type": document.get("conversation_type") or "text",
+        "scenario_id": document.get("scenario_id"),
+        "message_count": document.get("message_count", len(messages)),
+        "user_turns": document.get("user_turns", sum(1 for m in messages if m["role"] == "user")),
+        "assistant_turns": document.get("assistant_turns", sum(1 for m in messages if m["role"] == "assistant")),
+        "char_count": document.get("char_count", sum(len(m["content"]) for m in messages)),
+        "total_correct": diagnosis_results.get("total_correct"),
+        "patient_messages": json.dumps(patient, default=str),
+        "patient_audio_messages": json.dumps(audio, default=str),
+        "assessor_messages": json.dumps(assessor, default=str),
+        "diagnosis_results": json.dumps(diagnosis_results, default=str),
+        "feedback_data": json.dumps(document["feedback_data"], default=str) if document.get("feedback_data") else None,
+        "feedback_job": json.dumps(document["feedback_job"], default=str) if document.get("feedback_job") else None,
+    }
+
+
+def row_to_document(row):
+    """Turn an archive row back into the shape of a plain transcript document."""
+    document = dict(row)
+    document["_id"] = document.pop("id")
+    for column, empty in _JSON_COLUMNS.items():
+        document[column] = json.loads(document[column]) if document.get(column) else empty()
+    document["archived"] = True
+    return document
+
+
+def _filter_expression(identifier=None, identifier_prefix=None, since=None, until=None):
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    expression = None
+
+    def add(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+
+    if identifier is not None:
+        add(ds.field("identifier") == identifier)
+    if identifier_prefix is not None:
+        add(pc.starts_with(ds.field("identifier"), identifier_prefix))
+    if since is not None:
+        add(ds.field("timestamp") >= since)
+    if until is not None:
+        add(ds.field("timestamp") < until)
+    return expression
+
+
+def archive_filesystem(location):
+    """(filesystem, path) for a local directory or an object-store URI such as s3://bucket/prefix."""
+    from pyarrow import fs
+    if "://" in location:
+        return fs.FileSystem.from_uri(location)
+    return fs.LocalFileSystem(), location
+
+
+def open_archive(location):
+    """Open every archive file under location as one pyarrow dataset."""
+    import pyarrow.dataset as ds
+    filesystem, path = archive_filesystem(location)
+    return ds.dataset(path, filesystem=filesystem, format="parquet", schema=archive_schema())
+
+
+def read_archive(location, identifier=None, identifier_prefix=None, since=None, until=None, columns=None):
+    """Archived transcripts matching the filters, as transcript-shaped dicts."""
+    try:
+        dataset = open_archive(location)
+    except FileNotFoundError:
+        return []
+    table = dataset.to_table(
+        columns=columns,
+        filter=_filter_expression(identifier, identifier_prefix, since, until)
+    )
+    return [row_to_document(row) for row in table.to_pylist()]
+
+
+def find_transcripts(connection_string, identifier=None, identifier_prefix=None, since=None, until=None,
+                     archive_location=None):
+    """Transcripts from the live collection and the archive, newest first.
+
+    Dashboards and exports use this so that sessions moved out by
+    scripts/archive_transcripts.py keep showing up. Archived documents carry
+    archived=True and plain message arrays.
+    """
+    query = {}
+    if identifier is not None:
+        query["identifier"] = identifier
+    elif identifier_prefix is not None:
+        query["identifier"] = {"$regex": "^" + re.escape(identifier_prefix)}
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+
+    collection = get_mongo_client(connection_string).diss_chatbot.transcripts
+    results = list(collection.find(query))
+
+    archive_location = archive_location or get_setting("ARCHIVE_LOCATION")
+    if archive_location:
+        live_ids = {str(document["_id"]) for document in results}
+        for document in read_archive(archive_location, identifier, identifier_prefix, since, until):
+            # A batch is only deleted after it has been verified, so a session can
+            # briefly exist in both places
+            if document["_id"] not in live_ids:
+                results.append(document)
+
+    results.sort(key=lambda document: document.get("timestamp") or datetime.min, reverse=True)
+    return results
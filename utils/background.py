@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """Return the process-wide event loop used for background work.
+
+    The loop runs forever on a daemon thread, so Streamlit script threads and
+    worker scripts can hand it coroutines without owning a loop themselves.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="background-loop", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def run_in_background(coro):
+    """Schedule a coroutine on the background loop and return a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the background loop and wait for its result."""
+    return run_in_background(coro).result(timeout)
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from utils.config import get_setting
+from utils.profiling import profile_call
+from utils.telemetry import REGISTRY
+
+REGISTRY.describe("circuit_breaker_state", "gauge", "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)")
+REGISTRY.describe("circuit_breaker_failures_total", "counter", "Dependency failures seen by circuit breakers")
+REGISTRY.describe("circuit_breaker_rejections_total", "counter", "Calls failed fast because a circuit breaker was open")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable; retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Fails fast after repeated dependency failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError immediately. Once reset_timeout has passed, a
+    single probe call is let through (half-open): success closes the
+    circuit, failure opens it for another reset_timeout. Only exceptions for
+    which is_failure(error) is true count; others (bad requests, validation
+    errors) pass through untouched.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, is_failure=None, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure or (lambda error: True)
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        REGISTRY.set("circuit_breaker_state", 0, dependency=name)
+
+    def _set_state(self, state):
+        self.state = state
+        REGISTRY.set("circuit_breaker_state", STATE_VALUES[state], dependency=self.name)
+
+    def allow(self):
+        """Whether a call may go ahead now; reserves the probe when half-open."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        REGISTRY.inc("circuit_breaker_failures_total", dependency=self.name)
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._set_state(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            REGISTRY.inc("circuit_breaker_rejections_total", dependency=self.name)
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            result = profile_call(self.name, fn, *args, **kwargs)
+        except Exception as error:
+            if self.is_failure(error):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            # Script-run control flow (e.g. a Streamlit rerun) says nothing about the dependency
+            with self._lock:
+                self._probing = False
+            raise
+        self.record_success()
+        return result
+
+    @property
+    def is_open(self):
+        return self.state == OPEN and self.retry_in() > 0
+
+
+def _is_mongo_failure(error):
+    from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+    return isinstance(error, (ConnectionFailure, ExecutionTimeout, WTimeoutError))
+
+
+def _is_openai_failure(error):
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+FAILURE_THRESHOLD = int(get_setting("BREAKER_FAILURE_THRESHOLD", 3))
+RESET_SECONDS = float(get_setting("BREAKER_RESET_SECONDS", 30))
+
+mongo_breaker = CircuitBreaker("mongodb", FAILURE_THRESHOLD, RESET_SECONDS, _is_mongo_failure)
+
+_llm_breakers = {}
+_llm_breakers_lock = threading.Lock()
+
+
+def llm_breaker(provider):
+    """The breaker for an LLM provider (utils/llm.py); all of them speak the OpenAI API."""
+    with _llm_breakers_lock:
+        if provider not in _llm_breakers:
+            _llm_breakers[provider] = CircuitBreaker(provider, FAILURE_THRESHOLD, RESET_SECONDS, _is_openai_failure)
+        return _llm_breakers[provider]
@@ -0,0 +1,26 @@
+import os
+
+
+def get_setting(name, default=None):
+    """Read an optional setting from Streamlit secrets, falling back to the environment.
+
+    Scripts and background workers run outside Streamlit, so a missing secrets
+    file must not be an error here.
+    """
+    try:
+        import streamlit as st
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(name, default)
+
+
+def get_flag(name, default=False):
+    """Read a boolean setting ("1", "true", "yes", "on" are truthy)."""
+    value = get_setting(name, None)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
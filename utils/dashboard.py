@@ -0,0 +1,403 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+from utils.config import get_setting
+from utils.mongodb import (
+    STATUS_COMPLETE,
+    STATUS_DIAGNOSIS,
+    STATUS_FEEDBACK,
+    STATUS_INTERVIEW,
+    get_mongo_client,
+    read_messages,
+)
+from utils.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("dashboard_events_total", "counter", "Transcript changes applied to instructor dashboards")
+REGISTRY.describe("dashboard_watchers", "gauge", "Cohort watchers running in this process")
+
+# Order in which a session moves through the app
+STAGES = [STATUS_INTERVIEW, STATUS_DIAGNOSIS, STATUS_FEEDBACK, STATUS_COMPLETE]
+
+# Diagnoses to find in results recorded before scenario packs stored total_possible
+LEGACY_CORRECT_DIAGNOSES = 4
+
+# Clinician wording that counts as raising each HEADSS domain. This is a
+# coverage indicator for the class view, not the assessor's judgement.
+HEADSS_KEYWORDS = {
+    "Home": ["home", "family", "live with", "mum", "mom", "dad", "parent", "sibling", "brother", "sister"],
+    "Education": ["school", "class", "teacher", "grades", "study", "work", "job", "bully"],
+    "Activities": ["friend", "hobby", "hobbies", "sport", "weekend", "fun", "online", "social media", "game"],
+    "Drugs": ["drug", "alcohol", "drink", "smok", "vape", "vaping", "weed", "cannabis", "substance"],
+    "Sexuality": ["sex", "relationship", "boyfriend", "girlfriend", "partner", "attracted", "contracept"],
+    "Suicide": ["suicid", "self-harm", "self harm", "hurt yourself", "mood", "depress", "sad", "kill",
+                "safe", "anxious", "worry", "eating", "weight", "body"],
+}
+HEADSS_DOMAINS = list(HEADSS_KEYWORDS)
+
+_PATTERNS = {
+    domain: re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+    for domain, keywords in HEADSS_KEYWORDS.items()
+}
+
+
+def headss_domains(text):
+    """HEADSS domains a clinician message touches on."""
+    return {domain for domain, pattern in _PATTERNS.items() if pattern.search(text)}
+
+
+class CohortAggregate:
+    """Running totals for one cohort, updated per transcript change.
+
+    Each session's contribution is kept so that a change can be applied by
+    removing the old contribution and adding the new one. The cost of an
+    update therefore depends on the change, not on the size of the cohort.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.sessions = {}
+        self.stage_counts = {stage: 0 for stage in STAGES}
+        self.headss_counts = {domain: 0 for domain in HEADSS_DOMAINS}
+        self.diagnosed = 0
+        self.correct_total = 0
+        self.incorrect_total = 0
+        self.possible_total = 0
+        self.events = 0
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def owns(self, identifier):
+        return identifier is not None and identifier.startswith(self.prefix)
+
+    def load(self, documents, read):
+        """Seed the aggregate from full documents; read(document, field) returns a message array."""
+        for document in documents:
+            if not self.owns(document.get("identifier")):
+                continue
+            self.apply(str(document["_id"]), document_change(document, read))
+
+    def apply(self, session_id, change):
+        """Fold one change into the totals.
+
+        change may hold identifier, status, started, updated, diagnosis_results,
+        message_count (absolute), new_messages (count to add) and
+        clinician_messages (texts of newly added clinician messages).
+        """
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                if not self.owns(change.get("identifier")):
+                    return False
+                session = {"identifier": change["identifier"], "status": None, "started": change.get("started"),
+                           "messages": 0, "headss": set(), "diagnosis": None, "updated": None}
+                self.sessions[session_id] = session
+
+            status = change.get("status")
+            if status and status != session["status"]:
+                if session["status"] in self.stage_counts:
+                    self.stage_counts[session["status"]] -= 1
+                self.stage_counts[status] = self.stage_counts.get(status, 0) + 1
+                session["status"] = status
+
+            results = change.get("diagnosis_results")
+            if results:
+                previous = session["diagnosis"]
+                if previous is None:
+                    self.diagnosed += 1
+                else:
+                    self.correct_total -= previous[0]
+                    self.incorrect_total -= previous[1]
+                    self.possible_total -= previous[2]
+                session["diagnosis"] = (
+                    results.get("total_correct", 0),
+                    results.get("total_incorrect", 0),
+                    results.get("total_possible") or LEGACY_CORRECT_DIAGNOSES
+                )
+                self.correct_total += session["diagnosis"][0]
+                self.incorrect_total += session["diagnosis"][1]
+                self.possible_total += session["diagnosis"][2]
+
+            if "message_count" in change:
+                session["messages"] = change["message_count"]
+            session["messages"] += change.get("new_messages", 0)
+
+            for text in change.get("clinician_messages", ()):
+                for domain in headss_domains(text) - session["headss"]:
+                    session["headss"].add(domain)
+                    self.headss_counts[domain] += 1
+
+            session["updated"] = change.get("updated") or datetime.utcnow()
+            self.updated_at = session["updated"]
+            self.events += 1
+        REGISTRY.inc("dashboard_events_total")
+        return True
+
+    def summary(self):
+        """Snapshot of the totals for rendering."""
+        with self._lock:
+            sessions = len(self.sessions)
+            return {
+                "sessions": sessions,
+                "stages": dict(self.stage_counts),
+                "diagnosed": self.diagnosed,
+                "mean_correct": self.correct_total / self.diagnosed if self.diagnosed else None,
+                "mean_possible": self.possible_total / self.diagnosed if self.diagnosed else None,
+                "accuracy": self.correct_total / self.possible_total if self.possible_total else None,
+                "mean_incorrect": self.incorrect_total / self.diagnosed if self.diagnosed else None,
+                "headss_coverage": {
+                    domain: count / sessions if sessions else 0 for domain, count in self.headss_counts.items()
+                },
+                "events": self.events,
+                "updated_at": self.updated_at,
+            }
+
+    def rows(self):
+        """One row per session, most recently active first."""
+        with self._lock:
+            rows = [{
+                "identifier": session["identifier"],
+                "stage": session["status"],
+                "messages": session["messages"],
+                "HEADSS": "".join(domain[0] if domain in session["headss"] else "·" for domain in HEADSS_DOMAINS),
+                "correct": session["diagnosis"][0] if session["diagnosis"] else None,
+                "started": session["started"],
+                "last activity": session["updated"],
+            } for session in self.sessions.values()]
+        rows.sort(key=lambda row: row["last activity"] or datetime.min, reverse=True)
+        return rows
+
+
+def document_change(document, read):
+    """A CohortAggregate change describing a whole transcript document."""
+    field = "patient_audio_messages" if document.get("conversation_type") == "audio" else "patient_messages"
+    messages = read(document, field)
+    return {
+        "identifier": document.get("identifier"),
+        "status": document.get("status") or STATUS_COMPLETE,
+        "started": document.get("timestamp"),
+        "updated": document.get("updated_at") or document.get("timestamp"),
+        "diagnosis_results": document.get("diagnosis_results"),
+        "message_count": document.get("message_count", len(messages)),
+        "clinician_messages": [m["content"] for m in messages if m["role"] == "user"],
+    }
+
+
+def change_from_event(event, read):
+    """Translate a change stream event on transcripts into (session_id, CohortAggregate change)."""
+    if event["operationType"] in ("insert", "replace"):
+        document = event["fullDocument"]
+        return str(document["_id"]), document_change(document, read)
+
+    fields = event.get("updateDescription", {}).get("updatedFields", {})
+    change = {"new_messages": 0, "clinician_messages": []}
+    for key, value in fields.items():
+        if key in ("identifier", "status", "diagnosis_results"):
+            change[key] = value
+        elif key == "message_count":
+            change["message_count"] = value
+        elif key.startswith("patient_messages."):
+            # $push reports each appended element as patient_messages.<index>
+            change["new_messages"] += 1
+            if value.get("role") == "user":
+                change["clinician_messages"].append(value["content"])
+        elif key == "patient_messages":
+            change["clinician_messages"].extend(m["content"] for m in value if m["role"] == "user")
+    if "message_count" in change:
+        change["new_messages"] = 0
+    return str(event["documentKey"]["_id"]), change
+
+
+def change_stream_pipeline(prefix):
+    """Server-side filter: changes to the cohort's transcripts only.
+
+    Most updates don't carry the identifier, so the stream is opened with
+    full_document="updateLookup" and matched on the looked-up document.
+    Updates are applied from their updateDescription, so their copy of the
+    document is dropped before it is sent.
+    """
+    return [
+        {"$match": {
+            "operationType": {"$in": ["insert", "replace", "update"]},
+            "fullDocument.identifier": {"$regex": "^" + re.escape(prefix)},
+        }},
+        {"$set": {"fullDocument": {
+            "$cond": [{"$eq": ["$operationType", "update"]}, "$$REMOVE", "$fullDocument"]
+        }}},
+    ]
+
+
+class CohortWatcher:
+    """Keeps a CohortAggregate current from a background thread.
+
+    Uses a change stream on transcripts. Deployments without a replica set
+    (where change streams are unavailable) fall back to polling for documents
+    whose updated_at moved since the last poll. The watcher stops itself once
+    nobody has viewed it for idle_timeout seconds.
+    """
+
+    def __init__(self, connection_string, prefix, poll_interval=5.0, idle_timeout=60.0):
+        self.connection_string = connection_string
+        self.aggregate = CohortAggregate(prefix)
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.mode = "starting"
+        self.error = None
+        self.last_viewed = time.monotonic()
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"cohort-watch-{prefix}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def touch(self):
+        """Record that a dashboard is showing this cohort."""
+        self.last_viewed = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def _should_stop(self):
+        if time.monotonic() - self.last_viewed > self.idle_timeout:
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _collection(self):
+        return get_mongo_client(self.connection_string).diss_chatbot.transcripts
+
+    def _read(self, document, field):
+        return read_messages(self.connection_string, document, field)
+
+    def _cohort_query(self):
+        return {"identifier": {"$regex": "^" + re.escape(self.aggregate.prefix)}}
+
+    def _run(self):
+        try:
+            self._watch()
+        finally:
+            self.mode = "stopped"
+            _discard(self)
+
+    def _open_stream(self):
+        return self._collection().watch(
+            change_stream_pipeline(self.aggregate.prefix),
+            full_document="updateLookup",
+            resume_after=self._resume_token,
+        )
+
+    def _watch(self):
+        from pymongo.errors import OperationFailure, PyMongoError
+
+        # Open the stream before the snapshot so no change between the two is lost;
+        # applying a change twice is harmless because changes carry absolute values.
+        try:
+            stream = self._open_stream()
+        except OperationFailure as error:
+            logger.info("Change streams unavailable (%s); polling transcripts instead", error)
+            self._poll()
+            return
+        except PyMongoError as error:
+            self.error = str(error)
+            stream = None
+
+        self._load_snapshot()
+        while not self._should_stop():
+            try:
+                if stream is None:
+                    stream = self._open_stream()
+                self.mode = "change stream"
+                self.error = None
+                with stream:
+                    # try_next returns after each empty getMore, so an idle
+                    # cohort notices it should stop within about a second
+                    while not self._should_stop():
+                        event = stream.try_next()
+                        if event is not None:
+                            session_id, change = change_from_event(event, self._read)
+                            self.aggregate.apply(session_id, change)
+                        self._resume_token = stream.resume_token
+                stream = None
+            except PyMongoError as error:
+                self.mode = "reconnecting"
+                self.error = str(error)
+                logger.warning("Cohort change stream interrupted: %s", error)
+                stream = None
+                self._stop.wait(self.poll_interval)
+
+    def _load_snapshot(self):
+        from utils.archive import find_transcripts
+        documents = find_transcripts(self.connection_string, identifier_prefix=self.aggregate.prefix)
+        self.aggregate.load(documents, self._read)
+
+    def _poll(self):
+        from pymongo.errors import PyMongoError
+
+        self.mode = "polling"
+        self._load_snapshot()
+        since = datetime.utcnow()
+        while not self._stop.wait(self.poll_interval) and not self._should_stop():
+            try:
+                polled_at = datetime.utcnow()
+                query = self._cohort_query()
+                query["updated_at"] = {"$gte": since}
+                documents = list(self._collection().find(query))
+                self.aggregate.load(documents, self._read)
+                since = polled_at
+                self.error = None
+            except PyMongoError as error:
+                self.error = str(error)
+                logger.warning("Cohort poll failed: %s", error)
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def min_prefix_length():
+    """Shortest cohort prefix a dashboard may follow (DASHBOARD_MIN_PREFIX, default 4)."""
+    return int(get_setting("DASHBOARD_MIN_PREFIX", 4))
+
+
+def get_cohort_watcher(connection_string, prefix):
+    """Return the process-wide watcher for a cohort prefix, starting it on first use.
+
+    Every instructor viewing the same cohort shares one stream and one aggregate.
+    Each call counts as a view; a watcher nobody has viewed for
+    DASHBOARD_IDLE_SECONDS (default 60) stops and is dropped. Prefixes
+    shorter than min_prefix_length() raise ValueError, since they would hold
+    most of the collection in memory.
+    """
+    if len(prefix) < min_prefix_length():
+        raise ValueError(f"Cohort prefixes need at least {min_prefix_length()} characters")
+    key = (connection_string, prefix)
+    watcher = _watchers.get(key)
+    if watcher is None or watcher.stopped:
+        with _watchers_lock:
+            watcher = _watchers.get(key)
+            if watcher is None or watcher.stopped:
+                watcher = CohortWatcher(
+                    connection_string, prefix, idle_timeout=float(get_setting("DASHBOARD_IDLE_SECONDS", 60))
+                ).start()
+                _watchers[key] = watcher
+                REGISTRY.set("dashboard_watchers", len(_watchers))
+    watcher.touch()
+    return watcher
+
+
+def _discard(watcher):
+    """Drop a stopped watcher, and its aggregate, unless it was already replaced."""
+    with _watchers_lock:
+        key = (watcher.connection_string, watcher.aggregate.prefix)
+        if _watchers.get(key) is watcher:
+            del _watchers[key]
+        REGISTRY.set("dashboard_watchers", len(_watchers))
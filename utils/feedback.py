@@ -0,0 +1,122 @@
+import json
+
+from utils.breaker import CircuitOpenError
+
+
+def format_diagnosis_summary(diagnosis_results, total_possible):
+    """The diagnosis results section of the assessor prompt."""
+    return f"""
+    DIAGNOSTIC ASSESSMENT RESULTS:
+
+    Correctly Identified: {', '.join(diagnosis_results.get('correct_selections', []))}
+    Incorrectly Selected: {', '.join(diagnosis_results.get('incorrect_selections', []))}
+    Missed Diagnoses: {', '.join(diagnosis_results.get('missed_diagnoses', []))}
+
+    Total Correct: {diagnosis_results.get('total_correct', 0)}/{total_possible}
+    Total Incorrect: {diagnosis_results.get('total_incorrect', 0)}
+    Total Missed: {diagnosis_results.get('total_missed', 0)}
+    """
+
+
+def format_transcript(conversation_history):
+    """The conversation as "Role: content" lines, as the assessor reads it."""
+    return "\n".join([f"{message['role'].capitalize()}: {message['content']}" for message in conversation_history])
+
+
+def assessor_prompt(scenario, conversation_history, diagnosis_results, total_possible):
+    """The assessor's system prompt: rubric, transcript and diagnosis results.
+
+    Shared by the Feedback Report page and the batch feedback worker so both
+    ask for feedback in exactly the same way.
+    """
+    formatted_messages = format_transcript(conversation_history)
+    diagnosis_summary = format_diagnosis_summary(diagnosis_results, total_possible)
+
+    # Combine prompts with structured output instructions
+    return f"{scenario.assessor_prompt} \n\n CONVERSATION TRANSCRIPT: \n {formatted_messages} \n\n {diagnosis_summary} \n\n IMPORTANT: Provide your feedback in the exact JSON structure specified. Include specific, actionable items in the strengths, areas_for_improvement, and recommendations arrays. For HEADSS coverage, evaluate each element as true (met) or false (not met) based on the conversation transcript."
+
+
+def request_feedback(provider, systemprompt):
+    """Ask the assessor model for feedback, preferring JSON output.
+
+    Returns (content, used_structured_output, structured_output_error). No
+    Streamlit calls here: it runs under submit_once.
+    """
+    messages = [{"role": "system", "content": systemprompt}]
+    try:
+        response = provider.create(messages, json=True)
+        return response.choices[0].message.content, provider.json_mode, None
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        # Fallback to unstructured output
+        response = provider.create(messages)
+        return response.choices[0].message.content, False, str(e)
+
+
+def feedback_markdown(feedback_data):
+    """Markdown report assembled from structured feedback, for replies without "Detailed Feedback"."""
+    detailed_feedback = f"""
+**Overall Assessment:**
+{feedback_data['overall_assessment']}
+
+**Strengths:**
+{chr(10).join([f"- {strength}" for strength in feedback_data['strengths']])}
+
+**Areas for Improvement:**
+{chr(10).join([f"- {improvement}" for improvement in feedback_data['areas_for_improvement']])}
+
+**HEADSS Coverage Analysis:**
+{chr(10).join([f"- {key}: {'✅' if value else '❌'}" for key, value in feedback_data['headss_coverage'].items()])}
+
+**Recommendations:**
+{chr(10).join([f"- {rec}" for rec in feedback_data['recommendations']])}
+"""
+    return detailed_feedback.strip()
+
+
+def parse_feedback(content, use_structured):
+    """Turn the assessor's reply into (feedback_data, feedback_report, parse_error).
+
+    parse_error is set when structured output was expected but the reply was
+    not valid JSON; the reply is then kept as an unstructured report.
+    """
+    if use_structured:
+        try:
+            feedback_data = json.loads(content)
+        except json.JSONDecodeError as e:
+            # Fallback to unstructured feedback
+            return {
+                "overall_assessment": "Feedback generated successfully but structured parsing failed.",
+                "strengths": ["Review the full report for strengths analysis"],
+                "areas_for_improvement": ["Review the full report for improvement areas"],
+                "headss_coverage": {},
+                "recommendations": ["Review the full report for recommendations"],
+                "detailed_feedback": content
+            }, content, str(e)
+
+        # Map the actual response structure to our expected format
+        mapped_feedback_data = {
+            "overall_assessment": feedback_data.get("Overall Assessment", ""),
+            "strengths": feedback_data.get("Strengths", []),
+            "areas_for_improvement": feedback_data.get("Areas for Improvement", []),
+            "headss_coverage": feedback_data.get("HEADSS Coverage Analysis", {}),
+            "recommendations": feedback_data.get("Recommendations", []),
+            "diagnostic_accuracy": feedback_data.get("Diagnostic Accuracy", {}),
+            "detailed_feedback": feedback_data.get("Detailed Feedback", "")
+        }
+
+        # If no detailed feedback field, create one from the structured data
+        if not mapped_feedback_data["detailed_feedback"]:
+            mapped_feedback_data["detailed_feedback"] = feedback_markdown(mapped_feedback_data)
+        return mapped_feedback_data, mapped_feedback_data["detailed_feedback"], None
+
+    # Create a basic structured format from unstructured text
+    return {
+        "overall_assessment": "Feedback generated using unstructured format.",
+        "strengths": ["Review the full report for strengths analysis"],
+        "areas_for_improvement": ["Review the full report for improvement areas"],
+        "headss_coverage": {},
+        "recommendations": ["Review the full report for recommendations"],
+        "detailed_feedback": content
+    }, content, None
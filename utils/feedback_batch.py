@@ -0,0 +1,241 @@
+import json
+import logging
+from datetime import datetime
+
+from utils.config import get_setting
+from utils.feedback import assessor_prompt, parse_feedback
+from utils.mongodb import (
+    STATUS_COMPLETE,
+    STATUS_FEEDBACK,
+    apply_write,
+    ensure_indexes,
+    get_mongo_client,
+    object_id,
+    packed_message_fields,
+    read_messages,
+)
+from utils.scenarios import LEGACY_SCENARIO, get_scenario
+
+logger = logging.getLogger(__name__)
+
+# feedback_job.status on a transcript, in order
+JOB_QUEUED = "queued"
+JOB_SUBMITTED = "submitted"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Batch API states after which a batch will not change
+FINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+MAX_ATTEMPTS = 3
+MAX_BATCH_SIZE = 1000
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def feedback_deferred(identifier):
+    """Whether this trainee's feedback is generated in batches rather than on the spot.
+
+    DEFERRED_FEEDBACK is "all" or a comma-separated list of identifier
+    prefixes (one per homework cohort); unset, feedback is interactive.
+    """
+    setting = get_setting("DEFERRED_FEEDBACK")
+    if not setting or not identifier:
+        return False
+    if setting.strip() == "all":
+        return True
+    return any(identifier.startswith(prefix.strip()) for prefix in setting.split(",") if prefix.strip())
+
+
+def enqueue_write(session_id):
+    """Write that queues a session for batch feedback; a session already queued is left alone."""
+    now = datetime.utcnow()
+    return ("update", {"_id": object_id(session_id), "feedback_job": {"$exists": False}}, {"$set": {
+        "feedback_job": {"status": JOB_QUEUED, "queued_at": now, "attempts": 0},
+        "updated_at": now
+    }})
+
+
+def feedback_seen_write(session_id):
+    """Write that closes a session once the trainee has opened their batch feedback."""
+    return ("update", {"_id": object_id(session_id)}, {"$set": {
+        "status": STATUS_COMPLETE,
+        "feedback_job.seen_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }})
+
+
+def find_feedback(connection_string, session_id):
+    """A session's feedback_job and, once done, its feedback_data and feedback_report."""
+    collection = get_mongo_client(connection_string).diss_chatbot.transcripts
+    return collection.find_one(
+        {"_id": object_id(session_id)},
+        {"feedback_job": 1, "feedback_data": 1, "feedback_report": 1}
+    )
+
+
+class BatchFeedbackWorker:
+    """Generates queued feedback through a provider's batch interface.
+
+    Each pass collects batches that have finished and writes their feedback
+    back to the transcripts, then submits every queued session as a new
+    batch. client is an OpenAI client or a utils.llm.LocalBatchClient. Run one
+    worker per database.
+    """
+
+    def __init__(self, connection_string, client, model, json_mode=True, max_batch_size=MAX_BATCH_SIZE):
+        self.connection_string = connection_string
+        self.client = client
+        self.model = model
+        self.json_mode = json_mode
+        self.max_batch_size = max_batch_size
+        db = get_mongo_client(connection_string).diss_chatbot
+        self.transcripts = db.transcripts
+        self.batches = db.feedback_batches
+        ensure_indexes(connection_string)
+
+    def run_once(self):
+        """One poll and submit pass; returns (feedback written, sessions submitted)."""
+        return self.poll(), self.submit()
+
+    def _request(self, document):
+        audio = document.get("conversation_type") == "audio"
+        messages = read_messages(
+            self.connection_string, document, "patient_audio_messages" if audio else "patient_messages"
+        )
+        diagnosis_results = document.get("diagnosis_results") or {}
+        scenario = get_scenario(document.get("scenario_id") or LEGACY_SCENARIO)
+        total_possible = diagnosis_results.get("total_possible") or scenario.correct_count
+        body = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": assessor_prompt(scenario, messages, diagnosis_results, total_possible)}],
+        }
+        if self.json_mode:
+            body["response_format"] = {"type": "json_object"}
+        return {"custom_id": str(document["_id"]), "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+    def submit(self):
+        """Submit queued sessions as one batch; returns how many were submitted."""
+        documents = list(self.transcripts.find(
+            {"feedback_job.status": JOB_QUEUED, "status": STATUS_FEEDBACK}
+        ).sort("feedback_job.queued_at", 1).limit(self.max_batch_size))
+        if not documents:
+            return 0
+        lines = []
+        for document in documents:
+            try:
+                lines.append(json.dumps(self._request(document)))
+            except Exception as error:
+                logger.warning("Could not build the feedback request for %s: %s", document["_id"], error)
+                self._retry(document["_id"], f"request: {error}", None)
+        if not lines:
+            return 0
+
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        input_file = self.client.files.create(file=("feedback.jsonl", payload), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"purpose": "diss_feedback"}
+        )
+        session_ids = [json.loads(line)["custom_id"] for line in lines]
+        now = datetime.utcnow()
+        self.batches.insert_one({
+            "_id": batch.id,
+            "status": batch.status,
+            "session_ids": session_ids,
+            "model": self.model,
+            "submitted_at": now
+        })
+        self.transcripts.update_many(
+            {"_id": {"$in": [object_id(session_id) for session_id in session_ids]}},
+            {"$set": {
+                "feedback_job.status": JOB_SUBMITTED,
+                "feedback_job.batch_id": batch.id,
+                "feedback_job.submitted_at": now
+            }}
+        )
+        logger.info("Submitted batch %s with %d sessions", batch.id, len(session_ids))
+        return len(session_ids)
+
+    def poll(self):
+        """Collect every submitted batch that has finished; returns how many reports were written."""
+        written = 0
+        for record in list(self.batches.find({"status": {"$nin": list(FINAL_BATCH_STATUSES)}})):
+            batch = self.client.batches.retrieve(record["_id"])
+            if batch.status not in FINAL_BATCH_STATUSES:
+                if batch.status != record["status"]:
+                    self.batches.update_one({"_id": batch.id}, {"$set": {"status": batch.status}})
+                continue
+            written += self._collect(batch)
+            self.batches.update_one({"_id": batch.id}, {"$set": {
+                "status": batch.status,
+                "completed_at": datetime.utcnow()
+            }})
+        return written
+
+    def _collect(self, batch):
+        written = 0
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") == 200:
+                    content = response["body"]["choices"][0]["message"]["content"]
+                    written += self._write_feedback(result["custom_id"], batch.id, content)
+                else:
+                    self._retry(object_id(result["custom_id"]), json.dumps(result.get("error") or response), batch.id)
+        if batch.error_file_id:
+            for line in self.client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    result = json.loads(line)
+                    self._retry(object_id(result["custom_id"]), json.dumps(result.get("error")), batch.id)
+        # Anything the batch did not answer (failed, expired or cancelled batches) goes round again
+        for document in self.transcripts.find(
+            {"feedback_job.batch_id": batch.id, "feedback_job.status": JOB_SUBMITTED}, {"_id": 1}
+        ):
+            self._retry(document["_id"], f"batch {batch.status}", batch.id)
+        return written
+
+    def _write_feedback(self, session_id, batch_id, content):
+        feedback_data, feedback_report, parse_error = parse_feedback(content, self.json_mode)
+        if parse_error:
+            logger.warning("Unstructured feedback for %s: %s", session_id, parse_error)
+        # Status stays "feedback" until the trainee opens the report, so the
+        # session is still offered for resume on the Home page
+        apply_write(self.connection_string, ("update", {
+            "_id": object_id(session_id),
+            "feedback_job.batch_id": batch_id,
+            "feedback_job.status": JOB_SUBMITTED
+        }, {"$set": {
+            **packed_message_fields("assessor_messages", [{"role": "assistant", "content": content}]),
+            "feedback_data": feedback_data,
+            "feedback_report": feedback_report,
+            "feedback_job.status": JOB_DONE,
+            "feedback_job.completed_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }}), "feedback_batch")
+        return 1
+
+    def _retry(self, document_id, error, batch_id):
+        """Queue a session again, or give up on it after MAX_ATTEMPTS."""
+        query = {"_id": document_id}
+        if batch_id:
+            query["feedback_job.batch_id"] = batch_id
+        document = self.transcripts.find_one(query, {"feedback_job": 1})
+        if document is None:
+            return
+        attempts = document["feedback_job"].get("attempts", 0) + 1
+        status = JOB_QUEUED if attempts < MAX_ATTEMPTS else JOB_FAILED
+        logger.warning("Feedback for %s failed (attempt %d, %s): %s", document_id, attempts, status, error)
+        self.transcripts.update_one(query, {
+            "$set": {
+                "feedback_job.status": status,
+                "feedback_job.attempts": attempts,
+                "feedback_job.error": error[:500]
+            },
+            "$currentDate": {"updated_at": True},
+            "$unset": {"feedback_job.batch_id": ""}
+        })
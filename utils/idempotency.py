@@ -0,0 +1,118 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+from utils.telemetry import REGISTRY
+
+REGISTRY.describe(
+    "duplicate_submissions_total", "counter",
+    "Duplicate phase submissions absorbed, by phase and where they were caught (in_flight, completed, database)"
+)
+
+# Completed results are kept this long so a rerun that lost the original
+# script run (double click, rerun racing a click) still gets the answer
+RESULT_TTL = 10 * 60
+MAX_RESULTS = 1024
+
+
+def record_duplicate(phase, caught):
+    REGISTRY.inc("duplicate_submissions_total", phase=phase, caught=caught)
+
+
+def idempotency_key(phase):
+    """This session's key for submitting a phase.
+
+    The key lives in session state (and so in the shared session store), so
+    it is the same for every rerun and replica until reset_phase() or a restart.
+    """
+    keys = st.session_state.setdefault("idempotency_keys", {})
+    if phase not in keys:
+        keys[phase] = uuid.uuid4().hex
+    return keys[phase]
+
+
+def reset_phase(phase):
+    """Forget a phase's key so that the next submission is a new one (e.g. regenerating feedback)."""
+    keys = st.session_state.get("idempotency_keys", {})
+    if phase in keys:
+        del keys[phase]
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs a function at most once per key at a time, sharing its result.
+
+    Callers arriving while the first call is running wait for it; callers
+    arriving shortly after it finished get the remembered result. Failures
+    are not remembered, so a failed submission can be retried.
+    """
+
+    def __init__(self, ttl=RESULT_TTL, max_results=MAX_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self._calls = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, phase="unknown"):
+        now = time.monotonic()
+        with self._lock:
+            while self._results and next(iter(self._results.values()))[0] < now:
+                self._results.popitem(last=False)
+            if key in self._results:
+                record_duplicate(phase, "completed")
+                return self._results[key][1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            record_duplicate(phase, "in_flight")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None:
+                    self._results[key] = (time.monotonic() + self.ttl, call.result)
+                    while len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result
+
+
+_flights = SingleFlight()
+
+
+def submit_once(phase, fn, variant=None):
+    """Run fn(idempotency_key) once for this session's submission of a phase.
+
+    variant distinguishes submissions of the same phase that are meant to
+    be separate (e.g. a diagnosis form resubmitted with different answers).
+    fn must not call Streamlit commands or read st.session_state: a duplicate
+    rerun may stop the script run that started it, and the call has to finish
+    regardless so the waiting run can use its result. Read what it needs
+    first (e.g. utils.session.transcript_owner()) and pass it in.
+    """
+    key = idempotency_key(phase if variant is None else f"{phase}:{variant}")
+    return _flights.do(key, lambda: fn(key), phase)
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from utils.breaker import mongo_breaker
+from utils.config import get_setting
+from utils.mongodb import check_identifier, get_mongo_client
+from utils.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("identifier_set_size", "gauge", "Identifiers held in the in-memory identifier set")
+REGISTRY.describe("identifier_set_refreshes_total", "counter", "Identifier set refreshes by kind (full, incremental)")
+
+# Document in diss_chatbot.metadata that scripts/setup_identifiers.py bumps:
+# "version" on every change, "generation" when identifiers are removed
+VERSION_DOCUMENT = "valid_identifiers"
+
+REFRESH_SECONDS = float(get_setting("IDENTIFIER_REFRESH_SECONDS", 30))
+
+# Above this many identifiers a Bloom filter is kept instead of the full set
+BLOOM_THRESHOLD = int(get_setting("IDENTIFIER_BLOOM_THRESHOLD", 500_000))
+BLOOM_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives)."""
+
+    __slots__ = ("_bits", "_size", "_hashes")
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self._size for i in range(self._hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class IdentifierSet:
+    """Process-wide copy of valid_identifiers, kept current from the version document.
+
+    Additions are fetched incrementally (by _id, which grows with insertion
+    order); a new generation means identifiers were removed and triggers a
+    full reload. Lookups never touch MongoDB, except to confirm a Bloom filter
+    hit, so validation keeps working while the database is unreachable.
+    """
+
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+        self.loaded = False
+        self._members = frozenset()
+        self._bloom = False
+        self._count = 0
+        self._last_id = None
+        self._version = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        return get_mongo_client(self.connection_string).diss_chatbot
+
+    def __contains__(self, identifier):
+        if identifier not in self._members:
+            return False
+        if self._bloom:
+            try:
+                return mongo_breaker.call(check_identifier, self.connection_string, identifier)
+            except Exception:
+                logger.warning("Could not confirm identifier; accepting the Bloom filter match")
+        return True
+
+    def __len__(self):
+        return self._count
+
+    def refresh(self):
+        """Bring the set up to date with the version document; returns True if anything changed."""
+        state = self._db().metadata.find_one({"_id": VERSION_DOCUMENT}) or {}
+        version, generation = state.get("version", 0), state.get("generation", 0)
+        with self._lock:
+            if self.loaded and version == self._version:
+                return False
+            if not self.loaded or generation != self._generation:
+                self._load_all()
+                kind = "full"
+            else:
+                self._load_new()
+                kind = "incremental"
+            self._version, self._generation = version, generation
+            self.loaded = True
+        REGISTRY.inc("identifier_set_refreshes_total", kind=kind)
+        REGISTRY.set("identifier_set_size", self._count)
+        return True
+
+    def _load_all(self):
+        collection = self._db().valid_identifiers
+        count = collection.estimated_document_count()
+        cursor = collection.find({}, {"identifier": 1}).sort("_id", 1)
+        members = BloomFilter(count) if count > BLOOM_THRESHOLD else set()
+        self._count = 0
+        for document in cursor:
+            members.add(document["identifier"])
+            self._last_id = document["_id"]
+            self._count += 1
+        self._bloom = isinstance(members, BloomFilter)
+        self._members = members if self._bloom else frozenset(members)
+
+    def _load_new(self):
+        query = {"_id": {"$gt": self._last_id}} if self._last_id is not None else {}
+        added = list(self._db().valid_identifiers.find(query, {"identifier": 1}).sort("_id", 1))
+        if added:
+            if self._bloom:
+                for document in added:
+                    self._members.add(document["identifier"])
+            else:
+                # Swap in a new frozenset so concurrent lookups never see a set being mutated
+                self._members = self._members | {document["identifier"] for document in added}
+            self._last_id = added[-1]["_id"]
+            self._count += len(added)
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(REFRESH_SECONDS)
+            try:
+                mongo_breaker.call(self.refresh)
+            except Exception as error:
+                logger.warning("Identifier set refresh failed; keeping the current set: %s", error)
+
+
+_sets = {}
+_sets_lock = threading.Lock()
+
+
+def get_identifier_set(connection_string):
+    """Return the process-wide identifier set, loading it and starting its refresher on first use."""
+    identifiers = _sets.get(connection_string)
+    if identifiers is None:
+        with _sets_lock:
+            identifiers = _sets.get(connection_string)
+            if identifiers is None:
+                identifiers = IdentifierSet(connection_string)
+                try:
+                    identifiers.refresh()
+                except Exception as error:
+                    logger.warning("Could not load identifiers; falling back to per-lookup queries: %s", error)
+                thread = threading.Thread(target=identifiers._refresh_forever, name="identifier-refresh",
+                                          daemon=True)
+                thread.start()
+                _sets[connection_string] = identifiers
+    return identifiers
+
+
+def is_valid_identifier(connection_string, identifier):
+    """Membership test against the in-memory identifier set.
+
+    Until the set has loaded for the first time this loads it (or, failing
+    that, queries MongoDB directly) through the MongoDB circuit breaker, so
+    it raises CircuitOpenError while the database is known to be down.
+    """
+    identifiers = get_identifier_set(connection_string)
+    if not identifiers.loaded:
+        try:
+            mongo_breaker.call(identifiers.refresh)
+        except Exception:
+            return mongo_breaker.call(check_identifier, connection_string, identifier)
+    return identifier in identifiers
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from utils.config import get_flag, get_setting
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Roles that talk to a model; each can use its own provider, model and endpoint
+ROLES = ("patient", "assessor")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_LOCAL_BASE_URL = "http://localhost:8080/v1"
+
+
+def get_openai_client(api_key, base_url=None):
+    """Return the process-wide OpenAI client for these credentials.
+
+    openai is imported on first use so pages that never call the model do not
+    pay for the import.
+    """
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                from openai import OpenAI
+                # A bounded timeout (the SDK default is 10 minutes) lets the
+                # circuit breaker in utils/breaker.py see an outage quickly
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=float(get_setting("OPENAI_TIMEOUT_SECONDS", 60)),
+                    max_retries=1
+                )
+                _clients[key] = client
+    return client
+
+
+class Provider:
+    """A chat model behind an OpenAI-compatible API.
+
+    Pages call create() instead of the client directly, so the model, the
+    options the backend supports and the circuit breaker come with the
+    provider rather than being repeated at each call site.
+    """
+
+    def __init__(self, name, client, model, stream_usage=True, json_mode=True):
+        from utils.breaker import llm_breaker
+        self.name = name
+        self.client = client
+        self.model = model
+        self.stream_usage = stream_usage
+        self.json_mode = json_mode
+        self.breaker = llm_breaker(name)
+
+    def create(self, messages, stream=False, json=False, **options):
+        """chat.completions.create with this provider's model, through its circuit breaker.
+
+        stream=True asks for token usage in the final chunk where the backend
+        supports it; json=True asks for a JSON object response where supported.
+        """
+        if stream:
+            options["stream"] = True
+            if self.stream_usage:
+                options["stream_options"] = {"include_usage": True}
+        if json and self.json_mode:
+            options["response_format"] = {"type": "json_object"}
+        return self.breaker.call(self.client.chat.completions.create, model=self.model, messages=messages, **options)
+
+    def __repr__(self):
+        return f"Provider({self.name!r}, model={self.model!r})"
+
+
+MOCK_REPLIES = (
+    "Yeah, I guess.",
+    "Um, it's fine I suppose. Mum's been working a lot so I'm on my own most nights.",
+    "School's ok. I don't really talk to many people there, I mostly just draw in the library at lunch.",
+    "Not really. I stay up pretty late on my phone and then I'm tired in the morning, so I skip breakfast.",
+    "I dunno. Some of the kids in my year vape but I haven't really. Maybe once at a party.",
+    "Sometimes. It's like everything is a bit much and I just want to be in my room with the lights off. "
+    "I haven't told anyone that before.",
+)
+
+
+class MockClient:
+    """Offline stand-in for the OpenAI client, for benchmarks and development.
+
+    The reply depends only on the last message, so replays are repeatable;
+    streams wait ttft seconds, then emit one word per 1/tokens_per_second.
+    """
+
+    def __init__(self, ttft=0.2, tokens_per_second=50.0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def reply(self, messages):
+        digest = hashlib.sha1(messages[-1]["content"].encode("utf-8")).digest()
+        return MOCK_REPLIES[digest[0] % len(MOCK_REPLIES)]
+
+    def _create(self, model, messages, stream=False, stream_options=None, **options):
+        words = self.reply(messages).split(" ")
+        if not stream:
+            time.sleep(self.ttft + len(words) / self.tokens_per_second)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=" ".join(words)))],
+                usage=SimpleNamespace(completion_tokens=len(words))
+            )
+        return self._stream(words, stream_options)
+
+    def _stream(self, words, stream_options):
+        time.sleep(self.ttft)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            content = word if i == len(words) - 1 else word + " "
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+        if stream_options and stream_options.get("include_usage"):
+            yield SimpleNamespace(choices=[], usage=SimpleNamespace(completion_tokens=len(words)))
+
+
+class LocalBatchClient:
+    """Stand-in for the OpenAI Batch API (files and batches) over any chat client.
+
+    For development and for backends without a batch interface: each request
+    in a batch's input file is sent to client.chat.completions.create. Files
+    and batches are kept as JSON files under directory, so a worker restart
+    finds them again. A batch reports in_progress until delay seconds after it
+    was created; the retrieve() after that runs its requests and completes it.
+    """
+
+    def __init__(self, client, directory, delay=0.0):
+        self.client = client
+        self.directory = directory
+        self.delay = delay
+        os.makedirs(directory, exist_ok=True)
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _path(self, object_id):
+        return os.path.join(self.directory, f"{object_id}.json" if object_id.startswith("batch") else object_id)
+
+    def _write_file(self, data):
+        file_id = f"file-local-{uuid.uuid4().hex[:24]}"
+        with open(self._path(file_id), "wb") as file:
+            file.write(data)
+        return file_id
+
+    def _create_file(self, file, purpose):
+        # The SDK accepts bytes, a file object or a (name, content) tuple
+        if isinstance(file, tuple):
+            file = file[1]
+        data = file if isinstance(file, bytes) else file.read()
+        return SimpleNamespace(id=self._write_file(data), purpose=purpose, bytes=len(data))
+
+    def _file_content(self, file_id):
+        with open(self._path(file_id), "rb") as file:
+            return SimpleNamespace(text=file.read().decode("utf-8"))
+
+    def _create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        batch = {
+            "id": f"batch_local_{uuid.uuid4().hex[:24]}",
+            "status": "in_progress",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": time.time(),
+            "completed_at": None,
+            "metadata": metadata,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self._save(batch)
+        return self._namespace(batch)
+
+    def _retrieve_batch(self, batch_id):
+        with open(self._path(batch_id), "r") as file:
+            batch = json.load(file)
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.delay:
+            self._run(batch)
+        return self._namespace(batch)
+
+    def _run(self, batch):
+        outputs, errors = [], []
+        for line in self._file_content(batch["input_file_id"]).text.splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                response = self.client.chat.completions.create(**request["body"])
+            except Exception as error:
+                errors.append({"custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "local_error", "message": str(error)}})
+                continue
+            outputs.append({"custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"role": "assistant", "content": response.choices[0].message.content}}]},
+            }})
+        if outputs:
+            batch["output_file_id"] = self._write_file("".join(json.dumps(o) + "\n" for o in outputs).encode("utf-8"))
+        if errors:
+            batch["error_file_id"] = self._write_file("".join(json.dumps(e) + "\n" for e in errors).encode("utf-8"))
+        batch["status"] = "completed"
+        batch["completed_at"] = time.time()
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        self._save(batch)
+
+    def _save(self, batch):
+        with open(self._path(batch["id"]), "w") as file:
+            json.dump(batch, file)
+
+    @staticmethod
+    def _namespace(batch):
+        return SimpleNamespace(**{**batch, "request_counts": SimpleNamespace(**batch["request_counts"])})
+
+
+def create_provider(name, model=None, base_url=None):
+    """Build a provider by name: "openai", "local" (any OpenAI-compatible server) or "mock" (offline)."""
+    if name == "openai":
+        client = get_openai_client(get_setting("OPENAI_API_KEY"), base_url or get_setting("OPENAI_BASE_URL"))
+        return Provider("openai", client, model or get_setting("MODEL_NAME", DEFAULT_MODEL))
+    if name == "local":
+        # llama.cpp server, vLLM, Ollama and similar expose the same API; the
+        # key is usually ignored but the SDK requires one
+        client = get_openai_client(
+            get_setting("LOCAL_LLM_API_KEY", "local"),
+            base_url or get_setting("LOCAL_LLM_BASE_URL", DEFAULT_LOCAL_BASE_URL)
+        )
+        return Provider(
+            "local",
+            client,
+            model or get_setting("LOCAL_LLM_MODEL", "local-model"),
+            stream_usage=get_flag("LOCAL_LLM_STREAM_USAGE", False),
+            json_mode=get_flag("LOCAL_LLM_JSON_MODE", True)
+        )
+    if name == "mock":
+        client = MockClient(
+            ttft=float(get_setting("MOCK_LLM_TTFT_SECONDS", 0.2)),
+            tokens_per_second=float(get_setting("MOCK_LLM_TOKENS_PER_SECOND", 50))
+        )
+        return Provider("mock", client, model or "mock", json_mode=False)
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(role):
+    """Return the process-wide provider for a role ("patient" or "assessor").
+
+    Configured with <ROLE>_PROVIDER ("openai" by default), <ROLE>_MODEL and
+    <ROLE>_BASE_URL, e.g. PATIENT_PROVIDER = "local".
+    """
+    provider = _providers.get(role)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(role)
+            if provider is None:
+                prefix = role.upper()
+                provider = create_provider(
+                    get_setting(f"{prefix}_PROVIDER", "openai"),
+                    model=get_setting(f"{prefix}_MODEL"),
+                    base_url=get_setting(f"{prefix}_BASE_URL")
+                )
+                _providers[role] = provider
+    return provider
@@ -1,71 +1,434 @@
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
-from bson.objectid import ObjectId
+import copy
 from datetime import datetime
-import streamlit as st
+import threading
+from utils.config import get_setting
+from utils.idempotency import record_duplicate
+from utils.transcript_codec import OFFLOAD_THRESHOLD, pack_messages, packed_field, summarise_messages, unpack_messages
+
+# pymongo and bson are imported on first use so that pages which never touch
+# the database start faster. These mirror pymongo.ASCENDING / DESCENDING.
+ASCENDING = 1
+DESCENDING = -1
+
+# Session progress stored on each transcript document. Anything other than
+# STATUS_COMPLETE can be resumed after a disconnect or redeploy.
+STATUS_INTERVIEW = "interview"
+STATUS_DIAGNOSIS = "diagnosis"
+STATUS_FEEDBACK = "feedback"
+STATUS_COMPLETE = "complete"
+RESUMABLE_STATUSES = [STATUS_INTERVIEW, STATUS_DIAGNOSIS, STATUS_FEEDBACK]
+
+# GridFS bucket for packed message arrays too large to keep in the document
+MESSAGES_BUCKET = "transcript_messages"
+
+_clients = {}
+_clients_lock = threading.Lock()
+_indexed = set()
+
 
 def get_mongo_client(connection_string):
-    return MongoClient(connection_string, server_api=ServerApi('1'))
+    """Return the process-wide pooled client for a connection string."""
+    client = _clients.get(connection_string)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(connection_string)
+            if client is None:
+                from pymongo import MongoClient
+                from pymongo.server_api import ServerApi
+                # Fail within seconds rather than pymongo's 30s default, so the
+                # circuit breaker (utils/breaker.py) notices an outage quickly
+                client = MongoClient(
+                    connection_string,
+                    server_api=ServerApi('1'),
+                    serverSelectionTimeoutMS=int(get_setting("MONGODB_TIMEOUT_MS", 5000))
+                )
+                _clients[connection_string] = client
+    return client
+
+
+# (collection, keys, options) for every index the app's queries rely on
+INDEXES = [
+    ("valid_identifiers", [("identifier", ASCENDING)], {}),
+    # Equality on identifier, sort on timestamp, range on status
+    ("transcripts", [("identifier", ASCENDING), ("timestamp", DESCENDING), ("status", ASCENDING)],
+     {"name": "identifier_timestamp_status"}),
+    # One document per idempotent insert (see idempotent_write)
+    ("transcripts", [("idempotency_key", ASCENDING)],
+     {"name": "idempotency_key", "unique": True, "partialFilterExpression": {"idempotency_key": {"$exists": True}}}),
+    # Changes since a watermark, for the search indexer (utils/search.py)
+    ("transcripts", [("updated_at", ASCENDING)], {"name": "updated_at"}),
+    # Sessions waiting for batch feedback (utils/feedback_batch.py)
+    ("transcripts", [("feedback_job.status", ASCENDING), ("feedback_job.queued_at", ASCENDING)],
+     {"name": "feedback_job", "partialFilterExpression": {"feedback_job.status": {"$exists": True}}}),
+]
+
+
+def ensure_indexes(connection_string):
+    """Create the indexes the app queries rely on (once per process)."""
+    if connection_string in _indexed:
+        return
+    db = get_mongo_client(connection_string).diss_chatbot
+    for collection, keys, options in INDEXES:
+        db[collection].create_index(keys, **options)
+    _indexed.add(connection_string)
+
+
+def object_id(value):
+    from bson.objectid import ObjectId
+    return ObjectId(value)
+
+
+def new_object_id():
+    from bson.objectid import ObjectId
+    return ObjectId()
+
 
 def check_identifier(connection_string, identifier):
     """Check if the identifier exists in the valid_identifiers collection."""
-    client = get_mongo_client(connection_string)
-    db = client.diss_chatbot
-    try:
-        result = db.valid_identifiers.find_one({"identifier": identifier})
-        return bool(result)
-    finally:
-        client.close()
+    db = get_mongo_client(connection_string).diss_chatbot
+    result = db.valid_identifiers.find_one({"identifier": identifier}, {"_id": 1})
+    return bool(result)
+
+
+def packed_message_fields(field, messages, offload=False):
+    """Fields storing a finished message array compressed, plus its plain summary.
+
+    The array is packed with utils.transcript_codec. The packed entry keeps its
+    bytes under "data" until the writer decides (see offload_packed) whether to
+    move them to GridFS.
+    """
+    messages = list(messages)
+    codec, payload = pack_messages(messages)
+    fields = {
+        packed_field(field): {
+            "codec": codec,
+            "count": len(messages),
+            "data": payload,
+            "offload": offload or len(payload) > OFFLOAD_THRESHOLD
+        }
+    }
+    if field != "assessor_messages":
+        fields.update(summarise_messages(messages))
+    return fields
+
+
+def new_transcript_document(messages, identifier, status, conversation_type=None, scenario_id=None):
+    """Build a fresh transcript document.
+
+    Interviews still in progress keep a plain array so turns can be $pushed;
+    finished ones are stored packed.
+    """
+    messages = list(messages)
+    field = "patient_audio_messages" if conversation_type == "audio" else "patient_messages"
+    now = datetime.utcnow()
+    document = {
+        # Assigned here so the id is known even if the write has to be queued
+        "_id": new_object_id(),
+        "timestamp": now,
+        "updated_at": now,
+        "status": status,
+        "message_count": len(messages),
+        "assessor_messages": [],
+        "diagnosis_results": {},
+        "identifier": identifier
+    }
+    if scenario_id:
+        document["scenario_id"] = scenario_id
+    if status == STATUS_INTERVIEW:
+        document[field] = messages
+    else:
+        # Audio-derived transcripts are always offloaded
+        document.update(packed_message_fields(field, messages, offload=conversation_type == "audio"))
+    if conversation_type:
+        document["conversation_type"] = conversation_type
+    return document
+
+
+def append_messages_update(messages):
+    """Update that appends interview turns to an in-progress transcript."""
+    return {
+        "$push": {"patient_messages": {"$each": messages}},
+        "$inc": {"message_count": len(messages)},
+        "$set": {"updated_at": datetime.utcnow()}
+    }
+
+
+def transcript_write(conversation_type, messages, identifier, session_id, diagnosis_results=None, scenario_id=None):
+    """Describe the write log_transcript performs for a phase.
+
+    Returns ("insert", document), ("update", filter, update) or None, so the sync
+    and async data-access layers share the same semantics.
+    """
+    if conversation_type == "patient":
+        if session_id:
+            # Close the in-progress document with the final, packed history
+            return ("update", {"_id": object_id(session_id)}, {
+                "$set": {
+                    **packed_message_fields("patient_messages", messages),
+                    "status": STATUS_DIAGNOSIS,
+                    "updated_at": datetime.utcnow(),
+                    "identifier": identifier
+                },
+                "$unset": {"patient_messages": ""}
+            })
+        # Create new document for patient conversation
+        return ("insert", new_transcript_document(messages, identifier, STATUS_DIAGNOSIS, scenario_id=scenario_id))
+
+    elif conversation_type == "diagnosis" and session_id:
+        # Update existing document with diagnosis results
+        return ("update", {"_id": object_id(session_id)}, {"$set": {
+            "diagnosis_results": diagnosis_results,
+            "status": STATUS_FEEDBACK,
+            "updated_at": datetime.utcnow(),
+            "identifier": identifier
+        }})
+
+    elif conversation_type == "assessor" and session_id:
+        # Update existing document with assessor messages
+        return ("update", {"_id": object_id(session_id)}, {"$set": {
+            **packed_message_fields("assessor_messages", messages),
+            "status": STATUS_COMPLETE,
+            "updated_at": datetime.utcnow(),
+            "identifier": identifier
+        }})
+
+    elif conversation_type == "patient_audio":
+        # Create new document for audio patient conversation
+        return ("insert", new_transcript_document(messages, identifier, STATUS_DIAGNOSIS, "audio", scenario_id))
+
+    return None
+
+
+def idempotent_write(write, key):
+    """Make a transcript_write plan safe to apply more than once.
+
+    An insert becomes an upsert on the idempotency key, so a repeated
+    submission finds the first document instead of creating another. An
+    update records the key it applied and skips documents that already have it.
+    """
+    if write[0] == "insert":
+        return ("upsert", {"idempotency_key": key}, {"$setOnInsert": {**write[1], "idempotency_key": key}})
+    filter, update = write[1], write[2]
+    return ("update", {**filter, "applied_keys": {"$ne": key}}, {**update, "$addToSet": {"applied_keys": key}})
+
+
+def packed_entries(write):
+    """Packed message entries in a transcript_write plan."""
+    if write[0] == "insert":
+        fields = write[1]
+    elif write[0] == "upsert":
+        fields = write[2]["$setOnInsert"]
+    else:
+        fields = write[2].get("$set", {})
+    return [value for key, value in fields.items() if key.endswith("_packed")]
+
 
-def log_transcript(connection_string, conversation_type, messages, diagnosis_results=None):
-    client = get_mongo_client(connection_string)
-    db = client.diss_chatbot
-    collection = db.transcripts
+def offload_packed(write, put):
+    """Copy of a transcript_write plan with flagged payloads moved to GridFS via put(bytes) -> file id.
 
+    The plan passed in is left untouched, so a write whose upload fails can be
+    queued and retried in full.
+    """
+    if not packed_entries(write):
+        return write
+    write = copy.deepcopy(write)
+    for entry in packed_entries(write):
+        if entry.pop("offload", False):
+            entry["file_id"] = put(entry["data"])
+            del entry["data"]
+    return write
+
+
+def read_messages(connection_string, document, field):
+    """Return a message array from a transcript document, whatever its storage form."""
+    packed = document.get(packed_field(field))
+    if packed is None:
+        return document.get(field, [])
+    payload = packed.get("data")
+    if payload is None:
+        from gridfs import GridFSBucket
+        bucket = GridFSBucket(get_mongo_client(connection_string).diss_chatbot, bucket_name=MESSAGES_BUCKET)
+        payload = bucket.open_download_stream(packed["file_id"]).read()
+    return unpack_messages(packed["codec"], payload)
+
+
+RESUMABLE_PROJECTION = {
+    "patient_messages": 1,
+    "patient_audio_messages": 1,
+    "patient_messages_packed": 1,
+    "patient_audio_messages_packed": 1,
+    "conversation_type": 1,
+    "scenario_id": 1,
+    "message_count": 1,
+    "status": 1,
+    "diagnosis_results": 1,
+    "feedback_job": 1,
+    "timestamp": 1,
+    "updated_at": 1
+}
+
+
+def resumable_query(identifier, tail):
+    """Filter, projection and sort for the latest unfinished session of an identifier."""
+    projection = dict(RESUMABLE_PROJECTION)
+    projection["patient_messages"] = {"$slice": -tail}
+    projection["patient_audio_messages"] = {"$slice": -tail}
+    return (
+        {"identifier": identifier, "status": {"$in": RESUMABLE_STATUSES}},
+        projection,
+        [("timestamp", DESCENDING)]
+    )
+
+
+def start_patient_session(connection_string, messages, identifier="anonymous", idempotency_key=None,
+                          scenario_id=None):
+    """Create the transcript document for an interview that is still in progress."""
+    document = new_transcript_document(messages, identifier, STATUS_INTERVIEW, scenario_id=scenario_id)
+    write = ("insert", document)
+    if idempotency_key:
+        write = idempotent_write(write, idempotency_key)
+    return execute_write(connection_string, write, "interview_start") or str(document["_id"])
+
+
+def append_patient_messages(connection_string, session_id, messages):
+    """Append new interview turns to an in-progress transcript."""
+    execute_write(
+        connection_string,
+        ("update", {"_id": object_id(session_id)}, append_messages_update(messages)),
+        "interview_turn"
+    )
+
+
+def find_resumable_session(connection_string, identifier, tail=20):
+    """Return the latest unfinished session for an identifier, or None.
+
+    Only the last `tail` interview messages are loaded; use
+    load_patient_messages for the rest.
+    """
+    ensure_indexes(connection_string)
+    collection = get_mongo_client(connection_string).diss_chatbot.transcripts
+    query, projection, sort = resumable_query(identifier, tail)
+    document = collection.find_one(query, projection, sort=sort)
+    return unpack_resumable(document, tail, lambda field: read_messages(connection_string, document, field))
+
+
+def unpack_resumable(document, tail, read):
+    """Replace packed message arrays of a resumable session with their last `tail` messages."""
+    if document is None:
+        return None
+    for field in ("patient_messages", "patient_audio_messages"):
+        if packed_field(field) in document:
+            document[field] = read(field)[-tail:]
+            del document[packed_field(field)]
+    return document
+
+
+def load_patient_messages(connection_string, session_id, field="patient_messages"):
+    """Load the full interview history of a session."""
+    collection = get_mongo_client(connection_string).diss_chatbot.transcripts
+    document = collection.find_one({"_id": object_id(session_id)}, {field: 1, packed_field(field): 1})
+    return read_messages(connection_string, document, field) if document else []
+
+
+def log_transcript(connection_string, conversation_type, messages, diagnosis_results=None,
+                   identifier="anonymous", session_id=None, idempotency_key=None, scenario_id=None):
+    """Write a phase to the session's transcript.
+
+    The session's identifier, id and scenario are passed in rather than read
+    from st.session_state, so the call can run under submit_once. With an
+    idempotency key, repeating the call for the same submission changes
+    nothing and returns the same session id. While MongoDB is unavailable the
+    write is queued locally and applied once it recovers.
+    """
+    write = transcript_write(conversation_type, messages, identifier, session_id, diagnosis_results, scenario_id)
+    if write is None:
+        return None
+    if idempotency_key:
+        write = idempotent_write(write, idempotency_key)
+    result = execute_write(connection_string, write, conversation_type)
+    if write[0] != "update":
+        # A queued insert returns nothing; its id was assigned up front
+        return result or str(_inserted_document(write)["_id"])
+    if conversation_type == "patient":
+        return session_id
+
+
+def execute_write(connection_string, write, phase):
+    """Apply a transcript write now, or queue it locally if MongoDB is unavailable.
+
+    Returns what apply_write returns, or None if the write was queued.
+    """
+    from utils.breaker import CircuitOpenError, mongo_breaker
+    from utils.write_queue import get_write_queue
+
+    queue = get_write_queue(connection_string, lambda queued, queued_phase: apply_write(
+        connection_string, queued, queued_phase
+    ))
+    if not queue.pending():
+        try:
+            return mongo_breaker.call(apply_write, connection_string, write, phase)
+        except CircuitOpenError:
+            pass
+        except Exception as error:
+            if not mongo_breaker.is_failure(error):
+                raise
+    queue.put(write, phase)
+    return None
+
+
+def server_stamped(write):
+    """Copy of a transcript_write plan whose updated_at is set by the server when applied.
+
+    Plans are built, and may sit in the write queue, long before they are
+    applied, and app processes' clocks differ; the search indexer and the
+    dashboard's polling fallback need updated_at in the order MongoDB saw
+    the writes. An insert becomes an upsert on its _id, so the document can
+    use $currentDate too.
+    """
+    stamp = {"updated_at": True}
+    if write[0] == "insert":
+        document = {key: value for key, value in write[1].items() if key != "updated_at"}
+        return ("upsert", {"_id": document["_id"]}, {"$setOnInsert": document, "$currentDate": stamp})
+    operator = "$setOnInsert" if write[0] == "upsert" else "$set"
+    update = dict(write[2])
+    if "updated_at" in update.get(operator, {}):
+        update[operator] = {key: value for key, value in update[operator].items() if key != "updated_at"}
+        update["$currentDate"] = stamp
+    return (write[0], write[1], update)
+
+
+def apply_write(connection_string, write, phase):
+    """Perform a transcript_write plan; returns the document id for inserts and upserts."""
+    collection = get_mongo_client(connection_string).diss_chatbot.transcripts
+    write = offload_packed(write, lambda payload: _put_messages(connection_string, payload))
+    write = server_stamped(write)
+    if write[0] == "upsert":
+        return _upsert_once(collection, write, phase)
+    result = collection.update_one(write[1], write[2])
+    if "applied_keys" in write[1] and result.matched_count == 0:
+        record_duplicate(phase, "database")
+    return None
+
+
+def _inserted_document(write):
+    return write[1] if write[0] == "insert" else write[2]["$setOnInsert"]
+
+
+def _upsert_once(collection, write, phase):
+    """Apply an idempotent insert and return the id of the one document it maps to."""
+    from pymongo.errors import DuplicateKeyError
     try:
-        if conversation_type == "patient":
-            # Create new document for patient conversation
-            document = {
-                "timestamp": datetime.utcnow(),
-                "patient_messages": messages,
-                "assessor_messages": [],
-                "diagnosis_results": {},
-                "identifier": st.session_state.get("user_identifier", "anonymous")
-            }
-            result = collection.insert_one(document)
-            return str(result.inserted_id)
-        
-        elif conversation_type == "diagnosis" and st.session_state.get("session_id"):
-            # Update existing document with diagnosis results
-            collection.update_one(
-                {"_id": ObjectId(st.session_state.session_id)},
-                {"$set": {
-                    "diagnosis_results": diagnosis_results,
-                    "identifier": st.session_state.get("user_identifier", "anonymous")
-                }}
-            )
-        
-        elif conversation_type == "assessor" and st.session_state.get("session_id"):
-            # Update existing document with assessor messages
-            collection.update_one(
-                {"_id": ObjectId(st.session_state.session_id)},
-                {"$set": {
-                    "assessor_messages": messages,
-                    "identifier": st.session_state.get("user_identifier", "anonymous")
-                }}
-            )
-        
-        elif conversation_type == "patient_audio":
-            # Create new document for audio patient conversation
-            document = {
-                "timestamp": datetime.utcnow(),
-                "patient_audio_messages": messages,
-                "assessor_messages": [],
-                "diagnosis_results": {},
-                "identifier": st.session_state.get("user_identifier", "anonymous"),
-                "conversation_type": "audio"
-            }
-            result = collection.insert_one(document)
-            return str(result.inserted_id)
-    finally:
-        client.close()
+        result = collection.update_one(write[1], write[2], upsert=True)
+        if result.upserted_id is not None:
+            return str(result.upserted_id)
+    except DuplicateKeyError:
+        # A concurrent upsert with the same key created the document first
+        pass
+    record_duplicate(phase, "database")
+    return str(collection.find_one(write[1], {"_id": 1})["_id"])
+
+
+def _put_messages(connection_string, payload):
+    from gridfs import GridFSBucket
+    bucket = GridFSBucket(get_mongo_client(connection_string).diss_chatbot, bucket_name=MESSAGES_BUCKET)
+    return bucket.upload_from_stream("messages", payload)
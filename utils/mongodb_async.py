@@ -0,0 +1,149 @@
+"""Asyncio variants of the utils.mongodb data-access functions.
+
+These take the identifier and session id explicitly instead of reading
+st.session_state, so background jobs (feedback generation, re-grading,
+analytics) can run them on the shared background loop from utils.background.
+Document shapes and phase semantics are shared with the sync module.
+"""
+import threading
+
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+
+from utils.mongodb import (
+    INDEXES,
+    MESSAGES_BUCKET,
+    STATUS_INTERVIEW,
+    append_messages_update,
+    idempotent_write,
+    new_transcript_document,
+    object_id,
+    packed_entries,
+    resumable_query,
+    server_stamped,
+    transcript_write,
+    unpack_resumable,
+)
+from utils.idempotency import record_duplicate
+from utils.transcript_codec import packed_field, unpack_messages
+
+_clients = {}
+_clients_lock = threading.Lock()
+_indexed = set()
+
+
+def get_async_mongo_client(connection_string):
+    """Return the process-wide async client for a connection string.
+
+    Async clients are bound to the event loop they first run on, so use them
+    from the shared background loop only.
+    """
+    client = _clients.get(connection_string)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(connection_string)
+            if client is None:
+                client = AsyncMongoClient(connection_string, server_api=ServerApi('1'))
+                _clients[connection_string] = client
+    return client
+
+
+async def ensure_indexes(connection_string):
+    if connection_string in _indexed:
+        return
+    db = get_async_mongo_client(connection_string).diss_chatbot
+    for collection, keys, options in INDEXES:
+        await db[collection].create_index(keys, **options)
+    _indexed.add(connection_string)
+
+
+async def check_identifier(connection_string, identifier):
+    """Check if the identifier exists in the valid_identifiers collection."""
+    db = get_async_mongo_client(connection_string).diss_chatbot
+    result = await db.valid_identifiers.find_one({"identifier": identifier}, {"_id": 1})
+    return bool(result)
+
+
+async def start_patient_session(connection_string, messages, identifier="anonymous", idempotency_key=None,
+                                scenario_id=None):
+    collection = get_async_mongo_client(connection_string).diss_chatbot.transcripts
+    write = ("insert", new_transcript_document(messages, identifier, STATUS_INTERVIEW, scenario_id=scenario_id))
+    if idempotency_key:
+        write = idempotent_write(write, idempotency_key)
+    return await _upsert_once(collection, server_stamped(write), "interview_start")
+
+
+async def append_patient_messages(connection_string, session_id, messages):
+    collection = get_async_mongo_client(connection_string).diss_chatbot.transcripts
+    write = server_stamped(("update", {"_id": object_id(session_id)}, append_messages_update(messages)))
+    await collection.update_one(write[1], write[2])
+
+
+def _bucket(connection_string):
+    from gridfs import AsyncGridFSBucket
+    return AsyncGridFSBucket(get_async_mongo_client(connection_string).diss_chatbot, bucket_name=MESSAGES_BUCKET)
+
+
+async def read_messages(connection_string, document, field):
+    packed = document.get(packed_field(field))
+    if packed is None:
+        return document.get(field, [])
+    payload = packed.get("data")
+    if payload is None:
+        stream = await _bucket(connection_string).open_download_stream(packed["file_id"])
+        payload = await stream.read()
+    return unpack_messages(packed["codec"], payload)
+
+
+async def find_resumable_session(connection_string, identifier, tail=20):
+    await ensure_indexes(connection_string)
+    collection = get_async_mongo_client(connection_string).diss_chatbot.transcripts
+    query, projection, sort = resumable_query(identifier, tail)
+    document = await collection.find_one(query, projection, sort=sort)
+    if document is None:
+        return None
+    messages = {}
+    for field in ("patient_messages", "patient_audio_messages"):
+        if packed_field(field) in document:
+            messages[field] = await read_messages(connection_string, document, field)
+    return unpack_resumable(document, tail, messages.get)
+
+
+async def load_patient_messages(connection_string, session_id, field="patient_messages"):
+    collection = get_async_mongo_client(connection_string).diss_chatbot.transcripts
+    document = await collection.find_one({"_id": object_id(session_id)}, {field: 1, packed_field(field): 1})
+    return await read_messages(connection_string, document, field) if document else []
+
+
+async def log_transcript(connection_string, conversation_type, messages, diagnosis_results=None,
+                         identifier="anonymous", session_id=None, idempotency_key=None, scenario_id=None):
+    collection = get_async_mongo_client(connection_string).diss_chatbot.transcripts
+    write = transcript_write(conversation_type, messages, identifier, session_id, diagnosis_results, scenario_id)
+    if write is None:
+        return None
+    if idempotency_key:
+        write = idempotent_write(write, idempotency_key)
+    for entry in packed_entries(write):
+        if entry.pop("offload", False):
+            entry["file_id"] = await _bucket(connection_string).upload_from_stream("messages", entry.pop("data"))
+    write = server_stamped(write)
+    if write[0] == "upsert":
+        return await _upsert_once(collection, write, conversation_type)
+    result = await collection.update_one(write[1], write[2])
+    if idempotency_key and result.matched_count == 0:
+        record_duplicate(conversation_type, "database")
+    if conversation_type == "patient":
+        return session_id
+
+
+async def _upsert_once(collection, write, phase):
+    from pymongo.errors import DuplicateKeyError
+    try:
+        result = await collection.update_one(write[1], write[2], upsert=True)
+        if result.upserted_id is not None:
+            return str(result.upserted_id)
+    except DuplicateKeyError:
+        pass
+    record_duplicate(phase, "database")
+    document = await collection.find_one(write[1], {"_id": 1})
+    return str(document["_id"])
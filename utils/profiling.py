@@ -0,0 +1,232 @@
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from utils.config import get_flag, get_setting
+
+# Read once: with profiling off, every hook below is a single boolean check
+ENABLED = get_flag("PROFILING", False)
+SAMPLE_EVERY = int(get_setting("PROFILING_SAMPLE_EVERY", 20))
+SAMPLE_INTERVAL = float(get_setting("PROFILING_SAMPLE_INTERVAL_MS", 5)) / 1000
+PROFILE_DIR = get_setting("PROFILING_DIR", ".profiles")
+WINDOW = int(get_setting("PROFILING_WINDOW", 1000))
+
+_local = threading.local()
+
+
+class Run:
+    """Timings collected during one page script or fragment run."""
+
+    __slots__ = ("name", "sections", "calls", "sampler")
+
+    def __init__(self, name):
+        self.name = name
+        self.sections = defaultdict(lambda: [0, 0.0, 0.0])
+        self.calls = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        self.sampler = None
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer into folded-stack counts.
+
+    The output ("frame;frame;frame count" per line) is what flamegraph.pl,
+    speedscope and inferno read.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileStore:
+    """Per-process aggregate of run, section and external-call timings.
+
+    Rerun latencies are kept per run name in a window of the last `window`
+    runs for percentiles; section and call timings are running totals.
+    """
+
+    def __init__(self, window=WINDOW, profile_dir=PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self.window = window
+        self._lock = threading.Lock()
+        self._runs = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._sections = defaultdict(lambda: [0, 0.0, 0.0])
+        self._calls = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        self.profiles = deque(maxlen=50)
+        self._profile_numbers = itertools.count(1)
+
+    def should_sample(self, name):
+        with self._lock:
+            self._counts[name] += 1
+            # The first run of each page is always sampled; PROFILING_SAMPLE_EVERY = 0 turns sampling off
+            return SAMPLE_EVERY > 0 and (self._counts[name] - 1) % SAMPLE_EVERY == 0
+
+    def record(self, run, wall, cpu):
+        with self._lock:
+            self._runs[run.name].append((wall, cpu))
+            for section, (count, section_wall, section_cpu) in run.sections.items():
+                totals = self._sections[(run.name, section)]
+                totals[0] += count
+                totals[1] += section_wall
+                totals[2] += section_cpu
+            for dependency, (count, call_wall, call_cpu, errors) in run.calls.items():
+                totals = self._calls[(run.name, dependency)]
+                totals[0] += count
+                totals[1] += call_wall
+                totals[2] += call_cpu
+                totals[3] += errors
+
+    def write_profile(self, name, stacks):
+        if not stacks:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stem = re.sub(r"[^\w-]", "_", name)
+        path = os.path.join(self.profile_dir, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._profile_numbers)}.folded")
+        with open(path, "w") as file:
+            for stack, count in sorted(stacks.items()):
+                file.write(f"{stack} {count}\n")
+        with self._lock:
+            self.profiles.appendleft(path)
+        return path
+
+    def rerun_latencies(self):
+        """Rows of wall-time percentiles (seconds) and mean CPU per page or fragment."""
+        with self._lock:
+            runs = {name: list(samples) for name, samples in self._runs.items()}
+        rows = []
+        for name, samples in sorted(runs.items()):
+            walls = sorted(wall for wall, _ in samples)
+            rows.append({
+                "run": name,
+                "runs": len(walls),
+                "p50": _percentile(walls, 0.50),
+                "p90": _percentile(walls, 0.90),
+                "p99": _percentile(walls, 0.99),
+                "max": walls[-1],
+                "cpu_mean": sum(cpu for _, cpu in samples) / len(samples),
+            })
+        return rows
+
+    def section_totals(self):
+        with self._lock:
+            return [
+                {"run": run, "section": section, "count": count, "wall": wall, "cpu": cpu,
+                 "wall_mean": wall / count}
+                for (run, section), (count, wall, cpu) in sorted(self._sections.items())
+            ]
+
+    def call_totals(self):
+        with self._lock:
+            return [
+                {"run": run, "dependency": dependency, "count": count, "errors": errors, "wall": wall, "cpu": cpu,
+                 "wall_mean": wall / count}
+                for (run, dependency), (count, wall, cpu, errors) in sorted(self._calls.items())
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._runs.clear()
+            self._sections.clear()
+            self._calls.clear()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+STORE = ProfileStore()
+
+
+def begin_run(page, section):
+    """Start timing a measured block; the outermost one on a thread owns the run.
+
+    Returns the run and whether this block owns it, for end_run(). Called by
+    utils.telemetry.measure_interaction only when profiling is enabled.
+    """
+    run = getattr(_local, "run", None)
+    if run is not None:
+        return run, False
+    # A fragment rerun on its own is reported separately from the full page
+    run = Run(page if section == "page" else f"{page}/{section}")
+    if STORE.should_sample(run.name):
+        run.sampler = StackSampler(threading.get_ident(), SAMPLE_INTERVAL)
+    _local.run = run
+    return run, True
+
+
+def end_run(token, section, wall, cpu):
+    run, owner = token
+    if not owner:
+        _add(run.sections[section], wall, cpu)
+        return
+    _local.run = None
+    if run.sampler is not None:
+        STORE.write_profile(run.name, run.sampler.stop())
+    STORE.record(run, wall, cpu)
+
+
+def _add(totals, wall, cpu):
+    totals[0] += 1
+    totals[1] += wall
+    totals[2] += cpu
+
+
+@contextmanager
+def profile_section(name):
+    """Time a named part of the current run (e.g. "setup", "history").
+
+    A no-op outside a profiled run. Usable as a decorator.
+    """
+    run = getattr(_local, "run", None) if ENABLED else None
+    if run is None:
+        yield
+        return
+    cpu_started = time.thread_time()
+    wall_started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(run.sections[name], time.perf_counter() - wall_started, time.thread_time() - cpu_started)
+
+
+def profile_call(dependency, fn, *args, **kwargs):
+    """fn(*args, **kwargs), timed against the current run as a call to dependency."""
+    run = getattr(_local, "run", None) if ENABLED else None
+    if run is None:
+        return fn(*args, **kwargs)
+    cpu_started = time.thread_time()
+    wall_started = time.perf_counter()
+    totals = run.calls[dependency]
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        totals[3] += 1
+        raise
+    finally:
+        _add(totals, time.perf_counter() - wall_started, time.thread_time() - cpu_started)
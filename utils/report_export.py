@@ -0,0 +1,341 @@
+import hashlib
+import html
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.config import get_setting
+from utils.telemetry import REGISTRY
+
+REGISTRY.describe("report_exports_total", "counter", "Feedback report exports by format and result (cached, rendered, error)")
+REGISTRY.describe("report_export_seconds", "histogram", "Time to render a feedback report export, by format",
+                  buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+# Bump when the template changes, so cached exports are rendered again
+TEMPLATE_VERSION = 1
+
+HEADSS_ELEMENTS = (
+    "Greeting & Rapport",
+    "Confidentiality & Rights",
+    "Cultural & Priority-Group Safety",
+    "Youth-Friendly / Normalising Language",
+    "Sensitivity to Cues & Pacing",
+    "Home & Family",
+    "Education / Learning Needs",
+    "Activities, Peers & Strengths",
+    "Drugs, Alcohol & Risk Behaviours",
+    "Sexual Health & Relationships",
+    "Mental Health & Suicide",
+    "Personal Safety / Violence",
+    "Summary & Follow-Up Plan",
+)
+
+MIME_TYPES = {"html": "text/html", "pdf": "application/pdf"}
+
+# A failed export is reported for this long (or until retry()) before it is rendered again
+ERROR_TTL = 5 * 60
+
+_STYLE = """
+body { font-family: Helvetica, Arial, sans-serif; font-size: 11pt; color: #222; margin: 24px; }
+h1 { font-size: 18pt; margin-bottom: 2px; }
+h2 { font-size: 13pt; border-bottom: 1px solid #ccc; padding-bottom: 2px; margin-top: 18px; }
+.meta { color: #666; font-size: 9pt; }
+table { width: 100%; }
+td, th { border: 1px solid #ddd; padding: 4px 6px; text-align: left; vertical-align: top; }
+.met { color: #1a7f37; font-weight: bold; }
+.missed { color: #b42318; font-weight: bold; }
+"""
+
+
+def available_formats():
+    """Export formats this install can produce; PDF needs the optional xhtml2pdf package."""
+    if importlib.util.find_spec("xhtml2pdf") is not None:
+        return ("html", "pdf")
+    return ("html",)
+
+
+def build_report(feedback_data, diagnosis_results, total_possible, identifier, session_id, scenario):
+    """Everything a rendered report shows, as plain data (picklable for the worker processes)."""
+    return {
+        "identifier": identifier,
+        "session_id": session_id,
+        "scenario_title": scenario.title,
+        "patient_name": scenario.patient_full_name,
+        "total_possible": total_possible,
+        "feedback_data": feedback_data,
+        "diagnosis_results": diagnosis_results,
+    }
+
+
+def report_from_document(document, scenario, read):
+    """build_report for a stored transcript; read(field) returns a message array.
+
+    Batch feedback stores feedback_data on the transcript. Otherwise it is
+    recovered from the assessor's reply, which is JSON whenever structured
+    output was used. Returns None for sessions without feedback.
+    """
+    from utils.feedback import parse_feedback
+
+    feedback_data = document.get("feedback_data")
+    if not feedback_data:
+        replies = [message["content"] for message in read("assessor_messages") if message["role"] == "assistant"]
+        if not replies:
+            return None
+        feedback_data = parse_feedback(replies[-1], replies[-1].lstrip().startswith("{"))[0]
+    diagnosis_results = document.get("diagnosis_results") or {}
+    total_possible = diagnosis_results.get("total_possible") or scenario.correct_count
+    return build_report(feedback_data, diagnosis_results, total_possible, document.get("identifier"),
+                        str(document["_id"]), scenario)
+
+
+def report_digest(report):
+    """Short hash of a report's content; with the session id it names the cached exports."""
+    canonical = json.dumps([TEMPLATE_VERSION, report], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+# The PDF fonts have no emoji; the generated narrative uses these two
+_MARKS = {"✅": "(covered)", "❌": "(not covered)"}
+
+
+def _narrative(text):
+    """Assessor prose (light markdown) as HTML paragraphs."""
+    text = html.escape(str(text or ""))
+    for mark, replacement in _MARKS.items():
+        text = text.replace(mark, replacement)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", text)
+    return "".join(f"<p>{paragraph.replace(chr(10), '<br>')}</p>" for paragraph in re.split(r"\n\s*\n", text.strip()))
+
+
+def _items(values):
+    if not values:
+        return "<p>None noted.</p>"
+    return "<ul>" + "".join(f"<li>{html.escape(str(value))}</li>" for value in values) + "</ul>"
+
+
+def render_html(report):
+    """The full feedback report as a self-contained HTML page."""
+    feedback = report["feedback_data"]
+    results = report["diagnosis_results"]
+    accuracy = feedback.get("diagnostic_accuracy") or {}
+    coverage = feedback.get("headss_coverage") or {}
+    total_correct = accuracy.get("Total Correct", results.get("total_correct", 0))
+    total_possible = report["total_possible"]
+    escape = html.escape
+
+    headss_rows = "".join(
+        f"<tr><td>{escape(element)}</td>"
+        + ('<td class="met">Covered</td>' if coverage.get(element) else '<td class="missed">Not covered</td>')
+        + "</tr>"
+        for element in HEADSS_ELEMENTS
+    )
+    diagnosis_rows = "".join(
+        f"<tr><th>{label}</th><td>{escape(', '.join(names)) if names else '-'}</td></tr>"
+        for label, names in (
+            ("Correctly identified", results.get("correct_selections", [])),
+            ("Incorrectly selected", results.get("incorrect_selections", [])),
+            ("Missed", results.get("missed_diagnoses", [])),
+        )
+    )
+    recommendations = feedback.get("recommendations") or []
+    recommendation_items = "".join(f"<li>{escape(str(item))}</li>" for item in recommendations)
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>DiSS Feedback Report - {escape(str(report['identifier']))}</title>
+<style>{_STYLE}</style>
+</head>
+<body>
+<h1>DiSS Adolescent Interview Practice - Feedback Report</h1>
+<p class="meta">Identifier {escape(str(report['identifier']))} &middot; Session {escape(str(report['session_id']))}
+&middot; {escape(report['scenario_title'])} ({escape(report['patient_name'])})</p>
+
+<h2>Overall Assessment</h2>
+{_narrative(feedback.get('overall_assessment'))}
+
+<h2>Strengths</h2>
+{_items(feedback.get('strengths'))}
+
+<h2>Areas for Improvement</h2>
+{_items(feedback.get('areas_for_improvement'))}
+
+<h2>HEADSS Coverage</h2>
+<table>{headss_rows}</table>
+
+<h2>Diagnostic Results</h2>
+<p><strong>{total_correct} of {total_possible}</strong> diagnoses correctly identified,
+{results.get('total_incorrect', 0)} incorrect, {results.get('total_missed', 0)} missed.</p>
+<table>{diagnosis_rows}</table>
+
+<h2>Recommendations</h2>
+{f"<ol>{recommendation_items}</ol>" if recommendations else "<p>None noted.</p>"}
+
+<h2>Detailed Feedback</h2>
+{_narrative(feedback.get('detailed_feedback'))}
+</body>
+</html>
+"""
+
+
+def render_pdf(document):
+    """PDF bytes for an HTML document (requires xhtml2pdf)."""
+    try:
+        from xhtml2pdf import pisa
+    except ImportError:
+        raise RuntimeError("PDF export needs the xhtml2pdf package; install it or export HTML instead") from None
+    output = io.BytesIO()
+    status = pisa.CreatePDF(document, dest=output, encoding="utf-8")
+    if status.err:
+        raise RuntimeError(f"PDF rendering failed with {status.err} errors")
+    return output.getvalue()
+
+
+def render_to_file(report, fmt, path):
+    """Render one export to path (atomically). Runs in a worker process."""
+    document = render_html(report)
+    data = render_pdf(document) if fmt == "pdf" else document.encode("utf-8")
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+    return path
+
+
+class ReportExporter:
+    """Renders feedback report exports in worker processes and caches them on disk.
+
+    Exports are files named by session id, report digest and format, so a
+    repeated download, a rerun or another process on the same host is served
+    from the cache. Rendering runs in a process pool: PDF layout is CPU-bound
+    and would otherwise hold the GIL against every session's script thread.
+    """
+
+    def __init__(self, cache_dir, workers=2, max_files=2000):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = {}
+        self._errors = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, report, fmt):
+        return os.path.join(self.cache_dir, f"{report['session_id']}-{report_digest(report)}.{fmt}")
+
+    def request(self, report, formats=None):
+        """{format: (status, path or error)} with status "ready", "pending" or "error".
+
+        Formats not yet cached are queued for rendering; ask again later. A
+        failure is returned as an error until retry() or ERROR_TTL passes.
+        """
+        states = {}
+        submit = []
+        now = time.monotonic()
+        for fmt in formats or available_formats():
+            path = self.path(report, fmt)
+            with self._lock:
+                if path in self._errors and self._errors[path][0] < now:
+                    del self._errors[path]
+                if path in self._errors:
+                    states[fmt] = ("error", self._errors[path][1])
+                elif path in self._pending:
+                    states[fmt] = ("pending", None)
+                elif os.path.exists(path):
+                    REGISTRY.inc("report_exports_total", format=fmt, result="cached")
+                    states[fmt] = ("ready", path)
+                else:
+                    # Claimed under the lock, submitted after it: a future that
+                    # is already done runs _finished on this thread
+                    self._pending[path] = None
+                    submit.append((fmt, path))
+                    states[fmt] = ("pending", None)
+        for fmt, path in submit:
+            self._submit(report, fmt, path)
+        return states
+
+    def retry(self, report, fmt):
+        """Forget a failed export so that the next request renders it again."""
+        with self._lock:
+            self._errors.pop(self.path(report, fmt), None)
+
+    def _get_pool(self, broken=None):
+        with self._lock:
+            if self._pool is None or self._pool is broken:
+                if broken is not None:
+                    # A worker died (e.g. killed for memory); start a fresh pool
+                    broken.shutdown(wait=False)
+                # spawn: forking a threaded Streamlit server is unsafe
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _submit(self, report, fmt, path):
+        started = time.perf_counter()
+        pool = self._get_pool()
+        try:
+            try:
+                future = pool.submit(render_to_file, report, fmt, path)
+            except BrokenProcessPool:
+                future = self._get_pool(broken=pool).submit(render_to_file, report, fmt, path)
+        except Exception as error:
+            with self._lock:
+                self._pending.pop(path, None)
+                self._errors[path] = (time.monotonic() + ERROR_TTL, str(error))
+            REGISTRY.inc("report_exports_total", format=fmt, result="error")
+            return
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(done, fmt, path, started))
+
+    def _finished(self, future, fmt, path, started):
+        error = future.exception()
+        with self._lock:
+            self._pending.pop(path, None)
+            if error is not None:
+                self._errors[path] = (time.monotonic() + ERROR_TTL, str(error))
+        REGISTRY.inc("report_exports_total", format=fmt, result="error" if error else "rendered")
+        if error is None:
+            REGISTRY.observe("report_export_seconds", time.perf_counter() - started, format=fmt)
+            self._prune()
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.is_file()]
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """Return the process-wide exporter.
+
+    EXPORT_CACHE_DIR (default .report_cache), EXPORT_WORKERS (default 2) and
+    EXPORT_CACHE_MAX_FILES (default 2000) configure it.
+    """
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = ReportExporter(
+                    get_setting("EXPORT_CACHE_DIR", ".report_cache"),
+                    workers=int(get_setting("EXPORT_WORKERS", 2)),
+                    max_files=int(get_setting("EXPORT_CACHE_MAX_FILES", 2000))
+                )
+    return _exporter
@@ -0,0 +1,110 @@
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import get_flag, get_setting
+from utils.telemetry import REGISTRY, prompt_version
+
+REGISTRY.describe("response_cache_lookups_total", "counter", "Opening-turn response cache lookups by result (hit, miss)")
+REGISTRY.describe("response_cache_hit_ratio", "gauge", "Share of opening-turn lookups served from the response cache")
+REGISTRY.describe("response_cache_entries", "gauge", "Conversation prefixes held in the opening-turn response cache")
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalise(text):
+    """Case, punctuation and spacing differences don't make a different question."""
+    return _SPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+class ResponseCache:
+    """Patient replies to the opening turns that nearly every interview shares.
+
+    Keyed by model, prompt version and the normalised conversation so far;
+    a lookup only hits when the whole prefix matches. Each key collects up
+    to `variants` distinct model replies before it starts serving, and a hit
+    samples among them so repeat trainees don't all get the same words.
+    Entries are evicted least-recently-used beyond max_entries and after ttl
+    seconds.
+    """
+
+    def __init__(self, max_turns=2, variants=3, max_entries=500, ttl=24 * 60 * 60, clock=time.monotonic):
+        self.max_turns = max_turns
+        self.variants = variants
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, model, prompt, transcript):
+        """Cache key for the reply to this conversation, or None when it is past the opening turns."""
+        if sum(1 for i in range(len(transcript)) if transcript.role(i) == "user") > self.max_turns:
+            return None
+        conversation = "\n".join(
+            f"{transcript.role(i)[0]}:{normalise(transcript.content(i))}" for i in range(len(transcript))
+        )
+        return (model, prompt_version(prompt), conversation)
+
+    def get(self, key):
+        """A cached reply for this key, or None if it has too few variants yet."""
+        if key is None:
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry[1]) < self.variants:
+                self._record("miss")
+                return None
+            self._entries.move_to_end(key)
+            self._record("hit")
+            return random.choice(entry[1])
+
+    def put(self, key, reply):
+        """Remember a model reply as one of the variants for this key."""
+        if key is None or not reply:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (self.clock() + self.ttl, [])
+            if len(entry[1]) < self.variants and reply not in entry[1]:
+                entry[1].append(reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            REGISTRY.set("response_cache_entries", len(self._entries))
+
+    @staticmethod
+    def _record(result):
+        REGISTRY.inc("response_cache_lookups_total", result=result)
+        hits = REGISTRY.get("response_cache_lookups_total", result="hit")
+        misses = REGISTRY.get("response_cache_lookups_total", result="miss")
+        REGISTRY.set("response_cache_hit_ratio", hits / (hits + misses))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """The process-wide opening-turn cache, or None unless RESPONSE_CACHE is enabled."""
+    global _cache
+    if not get_flag("RESPONSE_CACHE", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_turns=int(get_setting("RESPONSE_CACHE_MAX_TURNS", 2)),
+                    variants=int(get_setting("RESPONSE_CACHE_VARIANTS", 3)),
+                    max_entries=int(get_setting("RESPONSE_CACHE_MAX_ENTRIES", 500)),
+                    ttl=float(get_setting("RESPONSE_CACHE_TTL_SECONDS", 24 * 60 * 60))
+                )
+    return _cache
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+
+from utils.config import get_setting
+from utils.telemetry import prompt_version
+
+SCENARIOS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios")
+
+MANIFEST = "scenario.json"
+PATIENT_PROMPT = "patient_prompt.txt"
+ASSESSOR_PROMPT = "assessor_prompt.txt"
+
+# The original (and, for transcripts written before packs existed, implied) scenario
+LEGACY_SCENARIO = "jai"
+
+_scenarios = {}
+_catalog = None
+_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """Token count of text for the default model; estimated at ~4 characters per token without tiktoken."""
+    try:
+        import tiktoken
+    except ImportError:
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding("o200k_base").encode(text))
+
+
+class Scenario:
+    """A loaded scenario pack: persona prompt, patient details, answer key and assessor rubric.
+
+    One instance per pack and process, shared by every session that uses it;
+    sessions hold only the scenario id. Treat it as read-only.
+    """
+
+    __slots__ = ("id", "title", "patient_name", "patient_full_name", "patient_summary", "patient_info",
+                 "considerations", "diagnoses", "answer_explanation", "correct_count",
+                 "patient_prompt", "assessor_prompt", "prompt_version", "token_counts")
+
+    def __init__(self, scenario_id, manifest, patient_prompt, assessor_prompt):
+        patient = manifest["patient"]
+        self.id = scenario_id
+        self.title = manifest.get("title", scenario_id)
+        self.patient_name = patient["name"]
+        self.patient_full_name = patient.get("full_name", patient["name"])
+        self.patient_summary = patient.get("summary", "")
+        self.patient_info = patient.get("info", "")
+        self.considerations = manifest.get("considerations", "")
+        # Name -> {"correct", "description"}, in the order the form lists them
+        self.diagnoses = {
+            diagnosis["name"]: {"correct": diagnosis["correct"], "description": diagnosis.get("description", "")}
+            for diagnosis in manifest["diagnoses"]
+        }
+        self.answer_explanation = manifest.get("answer_explanation", "")
+        self.correct_count = sum(1 for info in self.diagnoses.values() if info["correct"])
+        self.patient_prompt = patient_prompt
+        self.assessor_prompt = assessor_prompt
+        self.prompt_version = prompt_version(patient_prompt)
+        self.token_counts = {
+            "patient_prompt": count_tokens(patient_prompt),
+            "assessor_prompt": count_tokens(assessor_prompt),
+        }
+
+    def score(self, selections):
+        """Diagnosis results for a {diagnosis: selected} mapping, as stored and shown after the form."""
+        correct_selections = []
+        incorrect_selections = []
+        missed_diagnoses = []
+
+        for diagnosis, info in self.diagnoses.items():
+            selected = selections[diagnosis]
+            if selected and info["correct"]:
+                correct_selections.append(diagnosis)
+            elif selected and not info["correct"]:
+                incorrect_selections.append(diagnosis)
+            elif not selected and info["correct"]:
+                missed_diagnoses.append(diagnosis)
+
+        return {
+            "correct_selections": correct_selections,
+            "incorrect_selections": incorrect_selections,
+            "missed_diagnoses": missed_diagnoses,
+            "total_correct": len(correct_selections),
+            "total_incorrect": len(incorrect_selections),
+            "total_missed": len(missed_diagnoses),
+            "total_possible": self.correct_count,
+            "scenario_id": self.id,
+            "selections": selections
+        }
+
+    def __repr__(self):
+        return f"Scenario({self.id!r})"
+
+
+def load_scenario(scenario_id, directory=SCENARIOS_DIR):
+    """Read and compile a scenario pack from <directory>/<scenario_id>/."""
+    path = os.path.join(directory, scenario_id)
+    try:
+        with open(os.path.join(path, MANIFEST), "r") as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        raise KeyError(f"Unknown scenario: {scenario_id}") from None
+    with open(os.path.join(path, PATIENT_PROMPT), "r") as file:
+        patient_prompt = file.read()
+    with open(os.path.join(path, ASSESSOR_PROMPT), "r") as file:
+        assessor_prompt = file.read()
+    return Scenario(scenario_id, manifest, patient_prompt, assessor_prompt)
+
+
+def get_scenario(scenario_id=None):
+    """Return a scenario pack, loaded on first use and shared by all sessions.
+
+    scenario_id defaults to default_scenario_id().
+    """
+    scenario_id = scenario_id or default_scenario_id()
+    scenario = _scenarios.get(scenario_id)
+    if scenario is None:
+        with _lock:
+            scenario = _scenarios.get(scenario_id)
+            if scenario is None:
+                scenario = load_scenario(scenario_id)
+                _scenarios[scenario_id] = scenario
+    return scenario
+
+
+def default_scenario_id():
+    return get_setting("DEFAULT_SCENARIO", LEGACY_SCENARIO)
+
+
+def list_scenarios():
+    """(id, title) of each scenario on offer, read once per process.
+
+    SCENARIOS (comma-separated ids) limits the catalog; by default every pack
+    under scenarios/ is offered. Only manifests are read here; prompts load
+    when a scenario is first used.
+    """
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                enabled = get_setting("SCENARIOS")
+                if enabled:
+                    ids = [scenario_id.strip() for scenario_id in enabled.split(",") if scenario_id.strip()]
+                else:
+                    ids = sorted(
+                        name for name in os.listdir(SCENARIOS_DIR)
+                        if os.path.isfile(os.path.join(SCENARIOS_DIR, name, MANIFEST))
+                    )
+                catalog = []
+                for scenario_id in ids:
+                    with open(os.path.join(SCENARIOS_DIR, scenario_id, MANIFEST), "r") as file:
+                        catalog.append((scenario_id, json.load(file).get("title", scenario_id)))
+                _catalog = catalog
+    return _catalog
@@ -0,0 +1,425 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from utils.config import get_setting
+from utils.scenarios import LEGACY_SCENARIO
+from utils.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("search_index_sessions", "gauge", "Transcripts in the local search index")
+REGISTRY.describe("search_index_lag_seconds", "gauge", "Age of the newest transcript change the search index has seen")
+REGISTRY.describe("search_query_seconds", "histogram", "Transcript search query time",
+                  buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+# Diagnosis outcome filters: a session-level summary, or one diagnosis' result
+OUTCOMES = ("all_correct", "missed", "incorrect")
+DIAGNOSIS_RESULTS = ("correct", "incorrect", "missed")
+
+INDEX_INTERVAL = 15.0
+BATCH_SIZE = 500
+# How far behind the watermark each pass looks again: updated_at is set by
+# the server when a write is applied, but writes applied at nearly the same
+# time can become visible out of order
+INDEX_OVERLAP = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    doc INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    identifier TEXT,
+    scenario_id TEXT,
+    started REAL,
+    status TEXT,
+    total_correct INTEGER,
+    total_incorrect INTEGER,
+    total_missed INTEGER,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    messages TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_identifier ON sessions (identifier);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE INDEX IF NOT EXISTS sessions_scenario ON sessions (scenario_id, started);
+CREATE TABLE IF NOT EXISTS diagnoses (
+    doc INTEGER,
+    diagnosis TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS diagnoses_lookup ON diagnoses (diagnosis, result, doc);
+CREATE INDEX IF NOT EXISTS diagnoses_doc ON diagnoses (doc);
+CREATE VIRTUAL TABLE IF NOT EXISTS session_text USING fts5(
+    clinician, patient, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Text column searched for each role filter
+ROLE_COLUMNS = {"user": "clinician", "assistant": "patient"}
+
+_TERM = re.compile(r'"[^"]*"|\S+')
+
+
+def match_expression(text, role=None):
+    """An FTS5 query for free text: every term must appear, "quoted phrases" and trailing * allowed.
+
+    Terms are quoted so that punctuation ("self-harm") and FTS5 operators in
+    user input are taken literally. role ("user" or "assistant") limits the
+    match to one side of the conversation.
+    """
+    terms = []
+    for term in _TERM.findall(text):
+        prefix = term.endswith("*") and not term.startswith('"')
+        term = term.strip('"').rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    if not terms:
+        return ""
+    expression = " ".join(terms)
+    return f"{ROLE_COLUMNS[role]} : ({expression})" if role else expression
+
+
+def _timestamp(value):
+    """Seconds since the epoch for a naive UTC datetime (as stored by the app)."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+    return value
+
+
+class SearchIndex:
+    """Local full-text index of transcripts with session facets.
+
+    Each session is one SQLite FTS5 document with the clinician's and the
+    patient's messages in separate columns, porter-stemmed so that
+    "contraception" also finds "contraceptive". A sessions table holds the
+    filterable fields and a diagnoses table each diagnosis' result. Indexing
+    is incremental: a document whose message count hasn't changed only has
+    its facets refreshed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        REGISTRY.set("search_index_sessions", self.session_count())
+
+    def session_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def get_state(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def index_documents(self, documents, read):
+        """Index transcript documents; read(document, field) returns a message array."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for document in documents:
+                    self._index(document, read)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        REGISTRY.set("search_index_sessions", self.session_count())
+
+    def _index(self, document, read):
+        session_id = str(document["_id"])
+        results = document.get("diagnosis_results") or {}
+        facets = (document.get("identifier"), document.get("scenario_id") or LEGACY_SCENARIO,
+                  _timestamp(document.get("timestamp")), document.get("status"), results.get("total_correct"),
+                  results.get("total_incorrect"), results.get("total_missed"))
+        row = self._conn.execute("SELECT doc, message_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        count = document.get("message_count")
+        if row is not None and count is not None and count == row[1]:
+            doc = row[0]
+            self._conn.execute(
+                "UPDATE sessions SET identifier = ?, scenario_id = ?, started = ?, status = ?, total_correct = ?, "
+                "total_incorrect = ?, total_missed = ? WHERE doc = ?", facets + (doc,)
+            )
+        else:
+            field = "patient_audio_messages" if document.get("conversation_type") == "audio" else "patient_messages"
+            messages = [{"role": m["role"], "content": m["content"]} for m in read(document, field)]
+            doc = self._conn.execute(
+                "INSERT INTO sessions (id, identifier, scenario_id, started, status, total_correct, total_incorrect, "
+                "total_missed, message_count, messages) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET identifier = excluded.identifier, scenario_id = excluded.scenario_id, "
+                "started = excluded.started, status = excluded.status, total_correct = excluded.total_correct, "
+                "total_incorrect = excluded.total_incorrect, total_missed = excluded.total_missed, "
+                "message_count = excluded.message_count, messages = excluded.messages RETURNING doc",
+                (session_id,) + facets + (len(messages), json.dumps(messages))
+            ).fetchone()[0]
+            self._conn.execute("DELETE FROM session_text WHERE rowid = ?", (doc,))
+            self._conn.execute(
+                "INSERT INTO session_text (rowid, clinician, patient) VALUES (?, ?, ?)",
+                (doc, "\n".join(m["content"] for m in messages if m["role"] == "user"),
+                 "\n".join(m["content"] for m in messages if m["role"] == "assistant"))
+            )
+        if results:
+            self._conn.execute("DELETE FROM diagnoses WHERE doc = ?", (doc,))
+            self._conn.executemany(
+                "INSERT INTO diagnoses (doc, diagnosis, result) VALUES (?, ?, ?)",
+                [(doc, diagnosis, result)
+                 for result, key in (("correct", "correct_selections"), ("incorrect", "incorrect_selections"),
+                                     ("missed", "missed_diagnoses"))
+                 for diagnosis in results.get(key, [])]
+            )
+
+    def search(self, query="", identifier=None, identifier_prefix=None, since=None, until=None, scenario_id=None,
+               outcome=None, diagnosis=None, role="user", page=1, page_size=20):
+        """Sessions matching a full-text query and filters, best match first.
+
+        query matches what the clinician said by default; role="assistant"
+        searches the patient's replies and role=None both. outcome is one of
+        OUTCOMES; diagnosis is a (name, result) pair with result one of
+        DIAGNOSIS_RESULTS. Without a query, sessions are listed newest first.
+        Returns {"total", "page", "page_size", "scenarios", "hits"}, where
+        scenarios counts all matching sessions per scenario and each hit
+        carries a highlighted snippet.
+        """
+        started = time.perf_counter()
+        where, params = self._filters(identifier, identifier_prefix, since, until, scenario_id, outcome, diagnosis)
+        expression = match_expression(query, role) if query else ""
+        page = max(page, 1)
+        columns = "s.doc, s.id, s.identifier, s.scenario_id, s.started, s.status, s.total_correct, s.total_missed"
+
+        with self._lock:
+            if expression:
+                source = "FROM session_text CROSS JOIN sessions s ON s.doc = session_text.rowid WHERE session_text MATCH ?"
+                params = [expression] + params
+                order = "session_text.rank"
+            else:
+                source = "FROM sessions s WHERE 1"
+                order = "s.started DESC"
+            if where:
+                source += " AND " + " AND ".join(where)
+            scenarios = self._conn.execute(f"SELECT s.scenario_id, COUNT(*) {source} GROUP BY s.scenario_id",
+                                           params).fetchall()
+            rows = self._conn.execute(f"SELECT {columns} {source} ORDER BY {order} LIMIT ? OFFSET ?",
+                                      params + [page_size, (page - 1) * page_size]).fetchall()
+            snippets = self._snippets([row[0] for row in rows], expression) if expression and rows else {}
+
+        hits = [{
+            "session_id": row[1],
+            "identifier": row[2],
+            "scenario_id": row[3],
+            "started": datetime.utcfromtimestamp(row[4]) if row[4] is not None else None,
+            "status": row[5],
+            "total_correct": row[6],
+            "total_missed": row[7],
+            "snippet": snippets.get(row[0]),
+        } for row in rows]
+        REGISTRY.observe("search_query_seconds", time.perf_counter() - started)
+        return {
+            "total": sum(count for _, count in scenarios),
+            "page": page,
+            "page_size": page_size,
+            "scenarios": dict(scenarios),
+            "hits": hits,
+        }
+
+    def _filters(self, identifier, identifier_prefix, since, until, scenario_id, outcome, diagnosis):
+        where, params = [], []
+        if identifier:
+            where.append("s.identifier = ?")
+            params.append(identifier)
+        elif identifier_prefix:
+            # A range scan on the identifier index rather than LIKE
+            where.append("s.identifier >= ? AND s.identifier < ?")
+            params += [identifier_prefix, identifier_prefix + "\U0010ffff"]
+        if since is not None:
+            where.append("s.started >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            where.append("s.started < ?")
+            params.append(_timestamp(until))
+        if scenario_id:
+            where.append("s.scenario_id = ?")
+            params.append(scenario_id)
+        if outcome == "all_correct":
+            where.append("s.total_missed = 0 AND s.total_incorrect = 0")
+        elif outcome == "missed":
+            where.append("s.total_missed > 0")
+        elif outcome == "incorrect":
+            where.append("s.total_incorrect > 0")
+        elif outcome is not None:
+            raise ValueError(f"Unknown outcome filter: {outcome}")
+        if diagnosis:
+            name, result = diagnosis
+            if result not in DIAGNOSIS_RESULTS:
+                raise ValueError(f"Unknown diagnosis result: {result}")
+            where.append("s.doc IN (SELECT doc FROM diagnoses WHERE diagnosis = ? AND result = ?)")
+            params += [name, result]
+        return where, params
+
+    def _snippets(self, docs, expression):
+        # Only for the page being shown; highlighting every match would dominate the query time
+        placeholders = ",".join("?" * len(docs))
+        rows = self._conn.execute(
+            f"SELECT rowid, snippet(session_text, -1, '**', '**', '…', 16) FROM session_text "
+            f"WHERE session_text MATCH ? AND rowid IN ({placeholders})",
+            [expression] + docs
+        ).fetchall()
+        return dict(rows)
+
+    def messages(self, session_id):
+        """A session's indexed messages, in order, without a database round trip."""
+        with self._lock:
+            row = self._conn.execute("SELECT messages FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else []
+
+
+class SearchIndexer:
+    """Keeps a SearchIndex current from a background thread.
+
+    Polls transcripts for documents whose updated_at moved past the index's
+    watermark, less an overlap window, and stores the watermark in the index
+    so a restart carries on where it left off. The first run indexes the whole collection, plus the archive
+    when ARCHIVE_LOCATION is set; documents without updated_at are
+    backfilled separately, in _id order.
+    """
+
+    def __init__(self, connection_string, index, interval=INDEX_INTERVAL, overlap=INDEX_OVERLAP):
+        self.connection_string = connection_string
+        self.index = index
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _read(self, document, field):
+        from utils.mongodb import read_messages
+        return read_messages(self.connection_string, document, field)
+
+    def catch_up(self):
+        """Index everything changed since the watermark; returns the number of documents indexed."""
+        from pymongo import ASCENDING
+        from utils.breaker import mongo_breaker
+        from utils.mongodb import ensure_indexes, get_mongo_client
+
+        if mongo_breaker.is_open:
+            return 0
+        ensure_indexes(self.connection_string)
+        watermark = self.index.get_state("watermark")
+        if watermark is None and self.index.get_state("archive_indexed") is None:
+            self.index_archive()
+            self.index.set_state("archive_indexed", "1")
+        collection = get_mongo_client(self.connection_string).diss_chatbot.transcripts
+        indexed = self._backfill_legacy(collection)
+        if watermark:
+            query = {"updated_at": {"$gte": datetime.fromisoformat(watermark) - self.overlap}}
+        else:
+            query = {"updated_at": {"$exists": True}}
+        batch = []
+        for document in collection.find(query).sort("updated_at", ASCENDING).batch_size(BATCH_SIZE):
+            batch.append(document)
+            if len(batch) == BATCH_SIZE:
+                indexed += self._index_batch(batch)
+                batch = []
+        if batch:
+            indexed += self._index_batch(batch)
+        return indexed
+
+    def _index_batch(self, batch):
+        self.index.index_documents(batch, self._read)
+        newest = batch[-1]["updated_at"]
+        # Documents in the overlap window are seen again next time, which is harmless
+        watermark = self.index.get_state("watermark")
+        if watermark is None or newest > datetime.fromisoformat(watermark):
+            self.index.set_state("watermark", newest.isoformat())
+        REGISTRY.set("search_index_lag_seconds", (datetime.utcnow() - newest).total_seconds())
+        return len(batch)
+
+    def _backfill_legacy(self, collection):
+        """Index documents written before updated_at existed, once, in _id order.
+
+        They never match the watermark query, so they have their own cursor,
+        which resumes after the last _id indexed if a pass is interrupted. A
+        legacy document that is written to again gains updated_at and is
+        picked up by the watermark query from then on.
+        """
+        from pymongo import ASCENDING
+        from utils.mongodb import object_id
+
+        if self.index.get_state("legacy_done"):
+            return 0
+        query = {"updated_at": {"$exists": False}}
+        after = self.index.get_state("legacy_after")
+        if after:
+            query["_id"] = {"$gt": object_id(after)}
+        indexed = 0
+        batch = []
+        for document in collection.find(query).sort("_id", ASCENDING).batch_size(BATCH_SIZE):
+            batch.append(document)
+            if len(batch) == BATCH_SIZE:
+                indexed += self._index_legacy(batch)
+                batch = []
+        if batch:
+            indexed += self._index_legacy(batch)
+        self.index.set_state("legacy_done", "1")
+        return indexed
+
+    def _index_legacy(self, batch):
+        self.index.index_documents(batch, self._read)
+        self.index.set_state("legacy_after", str(batch[-1]["_id"]))
+        return len(batch)
+
+    def index_archive(self):
+        archive_location = get_setting("ARCHIVE_LOCATION")
+        if not archive_location:
+            return
+        from utils.archive import read_archive
+        documents = read_archive(archive_location)
+        for start in range(0, len(documents), BATCH_SIZE):
+            self.index.index_documents(documents[start:start + BATCH_SIZE], lambda document, field: document[field])
+
+    def _run(self):
+        while True:
+            try:
+                self.catch_up()
+                self.error = None
+            except Exception as error:
+                self.error = str(error)
+                logger.warning("Search indexing failed: %s", error)
+            time.sleep(self.interval)
+
+
+_indexers = {}
+_indexers_lock = threading.Lock()
+
+
+def get_search_index(connection_string):
+    """Return the process-wide search index, starting its indexer on first use.
+
+    The index file is SEARCH_INDEX_PATH (default .search_index.db in the
+    working directory); SEARCH_INDEX_INTERVAL sets the polling interval and
+    SEARCH_INDEX_OVERLAP how many seconds behind the watermark each poll
+    looks again.
+    """
+    indexer = _indexers.get(connection_string)
+    if indexer is None:
+        with _indexers_lock:
+            indexer = _indexers.get(connection_string)
+            if indexer is None:
+                index = SearchIndex(get_setting("SEARCH_INDEX_PATH", ".search_index.db"))
+                interval = float(get_setting("SEARCH_INDEX_INTERVAL", INDEX_INTERVAL))
+                overlap = float(get_setting("SEARCH_INDEX_OVERLAP", INDEX_OVERLAP))
+                indexer = SearchIndexer(connection_string, index, interval, overlap).start()
+                _indexers[connection_string] = indexer
+    return indexer
@@ -0,0 +1,68 @@
+import streamlit as st
+from utils.mongodb import STATUS_INTERVIEW, STATUS_FEEDBACK, load_patient_messages
+from utils.scenarios import LEGACY_SCENARIO
+from utils.transcript import Transcript
+
+
+def _history_location(audio):
+    """Session state key and transcript field holding the interview history."""
+    if audio:
+        return "audio_chat_history", "patient_audio_messages"
+    return "patient_chat_history", "patient_messages"
+
+
+def rehydrate_session(document):
+    """Restore session state from an unfinished transcript document.
+
+    The document is expected to come from find_resumable_session, so it only
+    carries the tail of the interview. The number of messages left behind in
+    MongoDB is kept in patient_history_offset until ensure_full_history loads them.
+    """
+    audio = document.get("conversation_type") == "audio"
+    key, field = _history_location(audio)
+    messages = document.get(field, [])
+    message_count = document.get("message_count", len(messages))
+    status = document.get("status")
+    session_id = str(document["_id"])
+
+    st.session_state["session_id"] = session_id
+    st.session_state["scenario_id"] = document.get("scenario_id") or LEGACY_SCENARIO
+    st.session_state[key] = Transcript(messages)
+    st.session_state["patient_history_offset"] = max(message_count - len(messages), 0)
+    st.session_state["patient_response_counter"] = message_count // 2
+    st.session_state["patient_conversation_done"] = status != STATUS_INTERVIEW
+
+    if audio:
+        st.session_state["audio_conversation_finished"] = True
+        st.session_state["audio_session_id"] = session_id
+
+    diagnosis_results = document.get("diagnosis_results") or {}
+    if status == STATUS_FEEDBACK and diagnosis_results:
+        st.session_state["diagnosis_results"] = diagnosis_results
+        st.session_state["diagnosis_selections"] = dict(diagnosis_results.get("selections", {}))
+        st.session_state["diagnosis_done"] = True
+
+
+def transcript_owner():
+    """The session's identifier, session id and scenario, as log_transcript takes them.
+
+    Read these before submit_once, whose function must not touch Streamlit.
+    """
+    return {
+        "identifier": st.session_state.get("user_identifier", "anonymous"),
+        "session_id": st.session_state.get("session_id"),
+        "scenario_id": st.session_state.get("scenario_id"),
+    }
+
+
+def ensure_full_history():
+    """Load the part of a rehydrated interview that was left in MongoDB."""
+    if not st.session_state.get("patient_history_offset"):
+        return
+    key, field = _history_location(st.session_state.get("audio_conversation_finished", False))
+    st.session_state[key] = Transcript(load_patient_messages(
+        st.session_state["mongodb_uri"],
+        st.session_state["session_id"],
+        field
+    ))
+    st.session_state["patient_history_offset"] = 0
@@ -0,0 +1,339 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.config import get_setting
+from utils.session_store import (
+    DEFAULT_TTL,
+    SHARED_KEYS,
+    _decode,
+    _encode_default,
+    mark_synced,
+    reset_sync,
+    synced_keys,
+)
+from utils.telemetry import REGISTRY
+from utils.transcript_codec import compress, decompress
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("parked_sessions", "gauge", "Idle sessions whose state is parked outside process memory")
+REGISTRY.describe("session_parks_total", "counter", "Idle sessions parked")
+REGISTRY.describe("session_restores_total", "counter", "Parked sessions brought back by result (ok, missing, error)")
+REGISTRY.describe("session_bytes_reclaimed_total", "counter",
+                  "Serialised size of the session state moved out of process memory")
+REGISTRY.describe("session_restore_seconds", "histogram", "Time to bring a parked session's state back",
+                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+# The stub left in a parked session's state: {"keys", "bytes", "parked_at"}
+PARKED_KEY = "_parked_state"
+
+# Off unless SESSION_IDLE_SECONDS is set
+DEFAULT_IDLE_SECONDS = 0
+DEFAULT_INTERVAL = 60.0
+
+
+class SQLiteOffloadStore:
+    """Parked session state in a local SQLite file, one compressed row per session."""
+
+    name = "sqlite"
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS parked_sessions ("
+                           "session_key TEXT PRIMARY KEY, codec TEXT, payload BLOB, parked_at REAL)")
+
+    def put(self, session_key, codec, payload):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parked_sessions (session_key, codec, payload, parked_at) VALUES (?, ?, ?, ?)",
+                (session_key, codec, payload, time.time())
+            )
+
+    def get(self, session_key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT codec, payload FROM parked_sessions WHERE session_key = ?", (session_key,)
+            ).fetchone()
+
+    def delete(self, session_key):
+        with self._lock:
+            self._conn.execute("DELETE FROM parked_sessions WHERE session_key = ?", (session_key,))
+
+    def prune(self):
+        # Rows left behind by processes that exited with sessions parked
+        with self._lock:
+            self._conn.execute("DELETE FROM parked_sessions WHERE parked_at < ?", (time.time() - self._ttl,))
+
+
+class MongoOffloadStore:
+    """Parked session state in the parked_sessions collection; a TTL index removes leftovers."""
+
+    name = "mongodb"
+
+    def __init__(self, connection_string, ttl=DEFAULT_TTL):
+        from utils.mongodb import get_mongo_client
+        self._collection = get_mongo_client(connection_string).diss_chatbot.parked_sessions
+        self._collection.create_index("parked_at", expireAfterSeconds=int(ttl))
+
+    def put(self, session_key, codec, payload):
+        from utils.breaker import mongo_breaker
+        mongo_breaker.call(
+            self._collection.replace_one,
+            {"_id": session_key},
+            {"codec": codec, "payload": payload, "parked_at": datetime.utcnow()},
+            upsert=True
+        )
+
+    def get(self, session_key):
+        from utils.breaker import mongo_breaker
+        document = mongo_breaker.call(self._collection.find_one, {"_id": session_key})
+        return (document["codec"], document["payload"]) if document else None
+
+    def delete(self, session_key):
+        from utils.breaker import mongo_breaker
+        mongo_breaker.call(self._collection.delete_one, {"_id": session_key})
+
+    def prune(self):
+        pass
+
+
+def create_offload_store(spec):
+    """"sqlite:///path/to/file.db" or "mongodb" (the app's MONGODB_CONNECTION_STRING)."""
+    if spec.startswith("sqlite:///"):
+        return SQLiteOffloadStore(spec[len("sqlite:///"):])
+    if spec == "mongodb":
+        return MongoOffloadStore(st.secrets["MONGODB_CONNECTION_STRING"])
+    raise ValueError(f"Unknown SESSION_OFFLOAD: {spec}")
+
+
+class _Tracked:
+    __slots__ = ("state", "lock", "busy", "last_active", "idle", "parked")
+
+    def __init__(self, state):
+        # Weak, and only used to notice that Streamlit discarded the session;
+        # the state itself is only ever changed from the session's own thread
+        self.state = weakref.ref(state)
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.last_active = time.monotonic()
+        self.idle = False
+        self.parked = False
+
+
+class SessionReaper:
+    """Moves the state of idle sessions out of process memory.
+
+    Every page and fragment run marks its session busy (see active()). A
+    background thread flags sessions that have not run for idle_seconds. It
+    never touches session state: Streamlit only guards that per script run.
+    Each page registers a small fragment (watch_idle()) that reruns every
+    interval on the session's own script thread and parks a flagged session
+    there. Its SHARED_KEYS are serialised, compressed and written to the
+    offload store, then removed from session state, leaving a small stub. The
+    next run of the session finds the stub and restores the state before any
+    page code sees it.
+    """
+
+    def __init__(self, offload, idle_seconds=DEFAULT_IDLE_SECONDS, interval=DEFAULT_INTERVAL):
+        self.offload = offload
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @contextmanager
+    def active(self, session_key, state):
+        """Mark a session busy for the duration of a run, restoring it first if parked."""
+        with self._lock:
+            tracked = self._sessions.get(session_key)
+            if tracked is None or tracked.state() is not state:
+                tracked = self._sessions[session_key] = _Tracked(state)
+        with tracked.lock:
+            tracked.busy += 1
+            tracked.idle = False
+        try:
+            if PARKED_KEY in st.session_state:
+                self._restore(session_key, tracked)
+            yield
+        finally:
+            with tracked.lock:
+                tracked.busy -= 1
+                tracked.last_active = time.monotonic()
+
+    def _restore(self, session_key, tracked):
+        started = time.perf_counter()
+        try:
+            record = self.offload.get(session_key)
+            values = json.loads(decompress(*record)) if record else None
+        except Exception as error:
+            REGISTRY.inc("session_restores_total", result="error")
+            logger.warning("Could not restore parked session %s: %s", session_key, error)
+            # The stub stays, so the next interaction tries again
+            st.error("Your session couldn't be reloaded just now. Please try again in a moment.")
+            st.stop()
+        stub = st.session_state[PARKED_KEY]
+        if values is None:
+            # Expired or lost. A shared session store still has the state, so
+            # the next sync reloads it rather than overwriting it with a blank
+            # session; without one the app starts afresh and can resume the
+            # interview from MongoDB
+            REGISTRY.inc("session_restores_total", result="missing")
+            logger.warning("Parked state for session %s was not found", session_key)
+            reset_sync()
+        else:
+            for key, value in values.items():
+                st.session_state[key] = _decode(key, value)
+            # Restored lists are new objects; keys that matched the store when
+            # parked still do, so they are not all written again
+            mark_synced(stub.get("synced", []))
+            REGISTRY.inc("session_restores_total", result="ok")
+        del st.session_state[PARKED_KEY]
+        tracked.parked = False
+        try:
+            self.offload.delete(session_key)
+        except Exception as error:
+            # The store's expiry removes it later
+            logger.warning("Could not delete parked state for session %s: %s", session_key, error)
+        REGISTRY.observe("session_restore_seconds", time.perf_counter() - started)
+
+    def reap(self):
+        """Flag every session idle for longer than idle_seconds; returns how many were flagged."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            sessions = list(self._sessions.items())
+        flagged = 0
+        for session_key, tracked in sessions:
+            if tracked.state() is None:
+                # Streamlit has discarded the session
+                with self._lock:
+                    if self._sessions.get(session_key) is tracked:
+                        del self._sessions[session_key]
+                if tracked.parked:
+                    self.offload.delete(session_key)
+                continue
+            with tracked.lock:
+                if not tracked.parked and not tracked.idle and not tracked.busy and tracked.last_active < cutoff:
+                    tracked.idle = True
+                    flagged += 1
+        REGISTRY.set("parked_sessions", sum(1 for _, tracked in sessions if tracked.parked))
+        self.offload.prune()
+        return flagged
+
+    def park_if_idle(self, session_key):
+        """Park the current session if it has been flagged idle. Runs on the session's script thread."""
+        with self._lock:
+            tracked = self._sessions.get(session_key)
+        if tracked is None:
+            return False
+        with tracked.lock:
+            if not tracked.idle or tracked.parked or tracked.busy:
+                return False
+            return self._park(session_key, tracked)
+
+    def _park(self, session_key, tracked):
+        values = {key: st.session_state[key] for key in SHARED_KEYS if key in st.session_state}
+        if not values:
+            return False
+        synced = synced_keys()
+        raw = json.dumps(values, separators=(",", ":"), default=_encode_default).encode("utf-8")
+        try:
+            self.offload.put(session_key, *compress(raw))
+        except Exception as error:
+            # Left in memory; the next check tries again
+            logger.warning("Could not park session %s: %s", session_key, error)
+            return False
+        for key in values:
+            del st.session_state[key]
+        st.session_state[PARKED_KEY] = {
+            "keys": list(values), "synced": synced, "bytes": len(raw), "parked_at": time.time()
+        }
+        tracked.idle = False
+        tracked.parked = True
+        REGISTRY.inc("session_parks_total")
+        REGISTRY.inc("session_bytes_reclaimed_total", len(raw))
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as error:
+                logger.warning("Session reaper pass failed: %s", error)
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+_reaper_checked = False
+
+
+def get_reaper():
+    """Return the process-wide reaper, or None unless SESSION_IDLE_SECONDS is set.
+
+    SESSION_OFFLOAD selects where parked state goes (default
+    "sqlite:///.parked_sessions.db"); SESSION_REAPER_INTERVAL sets how often
+    sessions are checked.
+    """
+    global _reaper, _reaper_checked
+    if not _reaper_checked:
+        with _reaper_lock:
+            if not _reaper_checked:
+                idle_seconds = float(get_setting("SESSION_IDLE_SECONDS", DEFAULT_IDLE_SECONDS))
+                if idle_seconds > 0:
+                    offload = create_offload_store(get_setting("SESSION_OFFLOAD", "sqlite:///.parked_sessions.db"))
+                    interval = float(get_setting("SESSION_REAPER_INTERVAL", DEFAULT_INTERVAL))
+                    _reaper = SessionReaper(offload, idle_seconds, interval).start()
+                _reaper_checked = True
+    return _reaper
+
+
+@contextmanager
+def active_session():
+    """Track the current Streamlit session as busy, restoring its state first if it was parked.
+
+    A no-op with the reaper disabled or outside a Streamlit script run.
+    """
+    reaper = get_reaper()
+    ctx = get_script_run_ctx() if reaper is not None else None
+    # The session's underlying SessionState outlives each run's thread-safe wrapper
+    state = getattr(getattr(ctx, "session_state", None), "_state", None)
+    if state is None:
+        yield
+        return
+    with reaper.active(ctx.session_id, state):
+        yield
+
+
+def _idle_check():
+    reaper = get_reaper()
+    ctx = get_script_run_ctx()
+    if reaper is not None and ctx is not None:
+        reaper.park_if_idle(ctx.session_id)
+
+
+def watch_idle():
+    """Register the fragment that parks this session once the reaper flags it idle.
+
+    Call it once per full page run (Home.setup() does). A no-op with the
+    reaper disabled.
+    """
+    reaper = get_reaper()
+    if reaper is not None:
+        st.fragment(run_every=reaper.interval)(_idle_check)()
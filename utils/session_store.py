@@ -0,0 +1,477 @@
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import streamlit as st
+
+from utils.config import get_setting
+from utils.telemetry import REGISTRY
+from utils.transcript import Transcript
+
+# Session state that must follow a trainee to whichever replica serves the
+# next rerun. Scenario packs and the Mongo URI are per-process configuration;
+# only the scenario id travels with the session.
+SHARED_KEYS = [
+    "patient_chat_history",
+    "assessor_chat_history",
+    "patient_response_counter",
+    "assessor_response_counter",
+    "patient_conversation_done",
+    "diagnosis_done",
+    "assessor_conversation_done",
+    "session_id",
+    "user_identifier",
+    "scenario_id",
+    "audio_chat_history",
+    "audio_conversation_finished",
+    "audio_session_id",
+    "diagnosis_results",
+    "diagnosis_selections",
+    "diagnosis_submission",
+    "patient_history_offset",
+    "feedback_data",
+    "feedback_report",
+    "idempotency_keys",
+]
+
+# Keys holding a Transcript, stored as plain message lists
+TRANSCRIPT_KEYS = {"patient_chat_history", "audio_chat_history"}
+
+# Query parameter carrying the signed store key, so a reconnect to another
+# replica finds the same state
+SESSION_PARAM = "sid"
+
+# Cookie the signed key is bound to (set by Streamlit's XSRF protection)
+XSRF_COOKIE = "_streamlit_xsrf"
+
+# Idle sessions expire from shared backends after this many seconds
+DEFAULT_TTL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("session_store_round_trips_total", "counter", "Round trips made to the session store")
+REGISTRY.describe("session_store_errors_total", "counter",
+                  "Session store calls that failed, by operation; the run used local session state")
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), default=_encode_default)
+
+
+def _encode_default(value):
+    if isinstance(value, Transcript):
+        return value.to_list()
+    return str(value)
+
+
+def _decode(key, value):
+    if key in TRANSCRIPT_KEYS:
+        return Transcript(value)
+    return value
+
+
+class MemorySessionStore:
+    """Per-process store.
+
+    st.session_state already lives in process memory, so this only shares
+    state between tabs of one process. It exists so the sync logic can be
+    exercised without a shared backend.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._versions = {}
+
+    def load(self, session_key):
+        with self._lock:
+            data = self._data.get(session_key, {})
+            return {k: json.loads(v) for k, v in data.items()}, self._versions.get(session_key, 0)
+
+    def save(self, session_key, changes, deleted, expected_version):
+        with self._lock:
+            version = self._versions.get(session_key, 0)
+            if version != expected_version:
+                data = self._data.get(session_key, {})
+                return version, {k: json.loads(v) for k, v in data.items()}
+            data = self._data.setdefault(session_key, {})
+            data.update({k: _encode(v) for k, v in changes.items()})
+            for key in deleted:
+                data.pop(key, None)
+            self._versions[session_key] = version + 1
+            return version + 1, None
+
+
+# Compare-and-set in one round trip. KEYS: data hash, version counter.
+# ARGV: expected version, ttl, number of changed fields, the changed fields
+# as field/value pairs, then the deleted fields.
+_REDIS_SAVE = """
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+if current ~= tonumber(ARGV[1]) then
+    return {current, redis.call('HGETALL', KEYS[1])}
+end
+local changed = tonumber(ARGV[3])
+if changed > 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 4, 3 + 2 * changed))
+end
+if #ARGV > 3 + 2 * changed then
+    redis.call('HDEL', KEYS[1], unpack(ARGV, 4 + 2 * changed))
+end
+local version = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return {version}
+"""
+
+
+class RedisSessionStore:
+    """Shared store on Redis. Each session is a hash plus a version counter."""
+
+    name = "redis"
+
+    def __init__(self, url, ttl=DEFAULT_TTL):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl
+        self._save = self._redis.register_script(_REDIS_SAVE)
+
+    def _keys(self, session_key):
+        return f"diss:session:{session_key}", f"diss:session:{session_key}:version"
+
+    def load(self, session_key):
+        data_key, version_key = self._keys(session_key)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hgetall(data_key)
+        pipe.get(version_key)
+        data, version = pipe.execute()
+        return {k.decode(): json.loads(v) for k, v in data.items()}, int(version or 0)
+
+    def save(self, session_key, changes, deleted, expected_version):
+        args = [expected_version, self._ttl, len(changes)]
+        for key, value in changes.items():
+            args += [key, _encode(value)]
+        result = self._save(keys=list(self._keys(session_key)), args=args + list(deleted))
+        if len(result) == 1:
+            return int(result[0]), None
+        fields = result[1]
+        return int(result[0]), {
+            fields[i].decode(): json.loads(fields[i + 1]) for i in range(0, len(fields), 2)
+        }
+
+
+class SQLiteSessionStore:
+    """Shared store in a local SQLite file.
+
+    Stands in for the networked backend in development and tests: several
+    Streamlit processes on one host can share state through the same file.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self._path = path
+        self._ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS session_values ("
+                         "session_key TEXT, key TEXT, value TEXT, PRIMARY KEY (session_key, key))")
+            conn.execute("CREATE TABLE IF NOT EXISTS session_versions ("
+                         "session_key TEXT PRIMARY KEY, version INTEGER, updated_at REAL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def _read(self, conn, session_key):
+        rows = conn.execute("SELECT key, value FROM session_values WHERE session_key = ?", (session_key,)).fetchall()
+        row = conn.execute("SELECT version FROM session_versions WHERE session_key = ?", (session_key,)).fetchone()
+        return {k: json.loads(v) for k, v in rows}, row[0] if row else 0
+
+    def load(self, session_key):
+        with self._connect() as conn:
+            return self._read(conn, session_key)
+
+    def save(self, session_key, changes, deleted, expected_version):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM session_versions WHERE session_key = ?", (session_key,)).fetchone()
+            version = row[0] if row else 0
+            if version != expected_version:
+                return version, self._read(conn, session_key)[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO session_values (session_key, key, value) VALUES (?, ?, ?)",
+                [(session_key, k, _encode(v)) for k, v in changes.items()]
+            )
+            conn.executemany(
+                "DELETE FROM session_values WHERE session_key = ? AND key = ?",
+                [(session_key, k) for k in deleted]
+            )
+            conn.execute(
+                "INSERT INTO session_versions (session_key, version, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT(session_key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                (session_key, now)
+            )
+            conn.execute(
+                "DELETE FROM session_values WHERE session_key IN "
+                "(SELECT session_key FROM session_versions WHERE updated_at < ?)",
+                (now - self._ttl,)
+            )
+            conn.execute("DELETE FROM session_versions WHERE updated_at < ?", (now - self._ttl,))
+            return version + 1, None
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide session store selected by SESSION_STORE, or None.
+
+    "memory", "redis://..." or "sqlite:///path/to/file.db". Unset (the
+    default), state stays in each process's st.session_state.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(get_setting("SESSION_STORE")) or False
+    return _store or None
+
+
+def create_store(spec):
+    if not spec:
+        return None
+    if spec == "memory":
+        return MemorySessionStore()
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(spec)
+    if spec.startswith("sqlite:///"):
+        return SQLiteSessionStore(spec[len("sqlite:///"):])
+    raise ValueError(f"Unknown SESSION_STORE: {spec}")
+
+
+def _fingerprint(value):
+    # Chat histories are only ever appended to, so their identity and length
+    # are enough to notice a change without serialising them on every rerun
+    if isinstance(value, (list, Transcript)):
+        return ("list", id(value), len(value))
+    return ("value", _encode(value))
+
+
+_secret = None
+
+
+def _signing_key():
+    """SESSION_SECRET, shared by every replica; without it tokens only verify in the process that issued them."""
+    global _secret
+    if _secret is None:
+        configured = get_setting("SESSION_SECRET")
+        if not configured:
+            logger.warning("SESSION_SECRET is not set; session tokens will not carry over to other replicas")
+        _secret = (configured or secrets.token_hex(32)).encode("utf-8")
+    return _secret
+
+
+def _client_binding():
+    """What ties a session token to this browser: Streamlit's XSRF cookie, else the user agent.
+
+    The cookie never appears in the URL, so a copied link does not carry it.
+    """
+    context = getattr(st, "context", None)
+    if context is None:
+        return ""
+    return context.cookies.get(XSRF_COOKIE) or context.headers.get("User-Agent", "")
+
+
+def _sign(session_key):
+    message = f"{session_key}|{_client_binding()}".encode("utf-8")
+    return hmac.new(_signing_key(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def session_token(session_key):
+    """The SESSION_PARAM value for a store key, valid only from this browser."""
+    return f"{session_key}.{_sign(session_key)}"
+
+
+def verify_token(token):
+    """The store key a session token was issued for, or None if it is forged or from another browser."""
+    session_key, _, signature = (token or "").partition(".")
+    if session_key and signature and hmac.compare_digest(signature, _sign(session_key)):
+        return session_key
+    return None
+
+
+def _session_key():
+    # A running session keeps its own key; the URL token only matters when a
+    # reconnect lands on a replica that has not seen this session yet
+    session_key = st.session_state.get("_store_session_key") or verify_token(st.query_params.get(SESSION_PARAM))
+    if not session_key:
+        session_key = uuid.uuid4().hex
+    st.session_state["_store_session_key"] = session_key
+    # Page navigation drops query parameters, so put it back on every run
+    token = session_token(session_key)
+    if st.query_params.get(SESSION_PARAM) != token:
+        st.query_params[SESSION_PARAM] = token
+    return session_key
+
+
+_scope = threading.local()
+
+
+@contextmanager
+def shared_session_state(store=None):
+    """Sync SHARED_KEYS with the session store around a page or fragment run.
+
+    A session pulls its state once, on its first run in this process (a
+    reconnect to another replica). On exit all changes made during the run
+    are written in a single call that also checks no other replica or tab
+    has written since; only then, rarely, does it take a second round trip.
+    If the store fails, the run carries on with local st.session_state.
+    Nested scopes (a fragment inside a full page run) defer to the outermost
+    one, which also marks the session active for the idle-session reaper
+    (utils/session_reaper.py).
+    """
+    from utils.session_reaper import active_session
+
+    store = store or get_store()
+    depth = getattr(_scope, "depth", 0)
+    if depth:
+        _scope.depth = depth + 1
+        try:
+            yield
+        finally:
+            _scope.depth = depth
+        return
+
+    _scope.depth = 1
+    try:
+        with active_session():
+            if store is None:
+                yield
+                return
+            try:
+                _pull(store)
+                yield
+            finally:
+                _flush(store)
+    finally:
+        _scope.depth = depth
+
+
+def _store_failed(store, operation, error):
+    REGISTRY.inc("session_store_errors_total", backend=store.name, operation=operation)
+    logger.warning("Session store %s failed, using local session state: %s", operation, error)
+
+
+def _pull(store):
+    session_key = _session_key()
+    if "_store_version" in st.session_state:
+        return
+    REGISTRY.inc("session_store_round_trips_total", backend=store.name)
+    try:
+        values, version = store.load(session_key)
+    except Exception as error:
+        # Not synced yet: retried next run, and nothing is written until then
+        _store_failed(store, "load", error)
+        return
+    if version:
+        _apply(values)
+    st.session_state["_store_version"] = version
+    st.session_state["_store_fingerprints"] = {
+        k: _fingerprint(st.session_state[k]) for k in values if k in SHARED_KEYS
+    }
+
+
+def synced_keys():
+    """SHARED_KEYS whose current value is the one last saved to, or loaded from, the store."""
+    fingerprints = st.session_state.get("_store_fingerprints", {})
+    return [
+        key for key in SHARED_KEYS
+        if key in st.session_state and key in fingerprints and fingerprints[key] == _fingerprint(st.session_state[key])
+    ]
+
+
+def mark_synced(keys):
+    """Record the current values of keys as matching the store, e.g. after they were restored from a copy."""
+    if "_store_fingerprints" in st.session_state:
+        fingerprints = dict(st.session_state["_store_fingerprints"])
+        fingerprints.update({key: _fingerprint(st.session_state[key]) for key in keys if key in st.session_state})
+        st.session_state["_store_fingerprints"] = fingerprints
+
+
+def reset_sync():
+    """Forget that this session has synced, so its next run loads it from the store again."""
+    st.session_state.pop("_store_version", None)
+    st.session_state.pop("_store_fingerprints", None)
+
+
+def _apply(values, keep=()):
+    """Replace SHARED_KEYS with stored values, except the keys in keep."""
+    for key in SHARED_KEYS:
+        if key in keep:
+            continue
+        if key in values:
+            st.session_state[key] = _decode(key, values[key])
+        elif key in st.session_state:
+            del st.session_state[key]
+
+
+def _flush(store):
+    if "_store_version" not in st.session_state:
+        return
+    before = st.session_state.get("_store_fingerprints", {})
+    changes = {}
+    for key in SHARED_KEYS:
+        if key in st.session_state and before.get(key) != _fingerprint(st.session_state[key]):
+            changes[key] = st.session_state[key]
+    deleted = [key for key in before if key not in st.session_state]
+    if not changes and not deleted:
+        return
+    session_key = st.session_state["_store_session_key"]
+    try:
+        REGISTRY.inc("session_store_round_trips_total", backend=store.name)
+        version, current = store.save(session_key, changes, deleted, st.session_state["_store_version"])
+        if current is not None:
+            # Another replica or tab wrote first: take its values for the keys
+            # this run left alone and write this run's changes on top
+            _apply(current, keep=set(changes) | set(deleted))
+            REGISTRY.inc("session_store_round_trips_total", backend=store.name)
+            version, current = store.save(session_key, changes, deleted, version)
+            if current is not None:
+                # Lost the race again; the changes stay pending for the next run
+                _apply(current, keep=set(changes) | set(deleted))
+                st.session_state["_store_version"] = version
+                return
+    except Exception as error:
+        # The fingerprints are left as they were, so the next run retries
+        _store_failed(store, "save", error)
+        return
+    st.session_state["_store_version"] = version
+    st.session_state["_store_fingerprints"] = {
+        key: _fingerprint(st.session_state[key]) for key in SHARED_KEYS if key in st.session_state
+    }
@@ -0,0 +1,71 @@
+import time
+
+from utils.telemetry import REGISTRY
+
+# Flush at least this often while tokens are arriving (seconds)
+DEFAULT_FLUSH_INTERVAL = 0.05
+
+# Never hold back more than this many characters
+DEFAULT_MAX_BUFFER = 200
+
+REGISTRY.describe("stream_flushes", "histogram", "UI deltas sent per streamed reply",
+                  buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+REGISTRY.describe("stream_chunks_total", "counter", "Text chunks received from the model stream")
+REGISTRY.describe("stream_deltas_total", "counter", "UI deltas written to the browser")
+
+
+class StreamStats:
+    """Chunk and flush counts for a single coalesced stream."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.flushes = 0
+
+    def to_dict(self):
+        return {"stream_chunks": self.chunks, "stream_flushes": self.flushes}
+
+    def export(self, registry=REGISTRY, **labels):
+        registry.observe("stream_flushes", self.flushes, **labels)
+        registry.inc("stream_chunks_total", self.chunks, **labels)
+        registry.inc("stream_deltas_total", self.flushes, **labels)
+
+
+def coalesce(chunks, interval=DEFAULT_FLUSH_INTERVAL, max_buffer=DEFAULT_MAX_BUFFER, stats=None, clock=time.monotonic):
+    """Buffer small text chunks and yield them in larger pieces.
+
+    st.write_stream sends one websocket delta per yielded item, so yielding per
+    token is the expensive part of streaming. Text is released once `interval`
+    has passed since the last flush, cut at the last word boundary so words
+    still appear whole, or unconditionally once `max_buffer` characters are
+    held. Whatever remains is flushed when the stream ends.
+    """
+    stats = stats if stats is not None else StreamStats()
+    buffer = ""
+    last_flush = clock()
+    for text in chunks:
+        stats.chunks += 1
+        buffer += text
+        now = clock()
+        if len(buffer) >= max_buffer:
+            out, buffer = buffer, ""
+        elif now - last_flush >= interval:
+            cut = _last_boundary(buffer)
+            if cut == 0:
+                continue
+            out, buffer = buffer[:cut], buffer[cut:]
+        else:
+            continue
+        stats.flushes += 1
+        last_flush = now
+        yield out
+    if buffer:
+        stats.flushes += 1
+        yield buffer
+
+
+def _last_boundary(text):
+    """Index just past the last whitespace in text, or 0 if there is none."""
+    for i in range(len(text) - 1, -1, -1):
+        if text[i].isspace():
+            return i + 1
+    return 0
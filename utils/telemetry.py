@@ -0,0 +1,262 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.profiling import ENABLED as PROFILING_ENABLED, begin_run, end_run
+
+# Seconds; chosen around the latencies we see for gpt-4o-mini patient turns
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._help = {}
+        self._buckets = {}
+        self._values = {}
+
+    def describe(self, name, metric_type, help_text, buckets=None):
+        with self._lock:
+            self._types[name] = metric_type
+            self._help[name] = help_text
+            if buckets is not None:
+                self._buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._types.setdefault(name, "counter")
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._types.setdefault(name, "gauge")
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._types.setdefault(name, "histogram")
+            buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+            state = self._values.get(key)
+            if state is None:
+                state = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def get(self, name, **labels):
+        """Return the current value of a counter or gauge (0 if never set)."""
+        with self._lock:
+            return self._values.get((name, _label_key(labels)), 0)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for name in sorted(self._types):
+                metric_type = self._types[name]
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (metric_name, label_key), value in sorted(self._values.items(), key=lambda item: item[0]):
+                    if metric_name != name:
+                        continue
+                    labels = dict(label_key)
+                    if metric_type == "histogram":
+                        buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+                        for bound, count in zip(buckets, value["buckets"]):
+                            lines.append(f"{name}_bucket{_format_labels(dict(labels, le=repr(float(bound))))} {count}")
+                        lines.append(f"{name}_bucket{_format_labels(dict(labels, le='+Inf'))} {value['count']}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                    else:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+REGISTRY.describe("patient_turn_ttft_seconds", "histogram", "Time from request to first streamed token of a patient reply")
+REGISTRY.describe("patient_turn_generation_seconds", "histogram", "Time from request to last streamed token of a patient reply")
+REGISTRY.describe("patient_turn_render_seconds", "histogram", "Time spent rendering streamed chunks of a patient reply")
+REGISTRY.describe("patient_turns_total", "counter", "Patient replies generated")
+REGISTRY.describe("llm_prompt_tokens_total", "counter", "Prompt tokens consumed")
+REGISTRY.describe("llm_completion_tokens_total", "counter", "Completion tokens generated")
+REGISTRY.describe("llm_cached_tokens_total", "counter", "Prompt tokens served from the provider prompt cache")
+
+
+def prompt_version(prompt):
+    """Short stable hash of a prompt, used to attribute metrics to prompt changes."""
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+
+
+class TurnMetrics:
+    """Timing and token usage for a single streamed patient turn."""
+
+    def __init__(self, model, prompt_version=None):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.generation_time = None
+        self.render_time = 0.0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cached_tokens = None
+
+    def record_usage(self, usage):
+        self.prompt_tokens = usage.prompt_tokens
+        self.completion_tokens = usage.completion_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = getattr(details, "cached_tokens", None) or 0
+
+    def to_dict(self):
+        return {
+            "model": self.model,
+            "prompt_version": self.prompt_version,
+            "ttft_s": _round(self.ttft),
+            "generation_s": _round(self.generation_time),
+            "render_s": _round(self.render_time),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+    def export(self, registry=REGISTRY):
+        """Publish this turn to the process metrics registry."""
+        labels = {"model": self.model, "prompt_version": self.prompt_version or "unknown"}
+        registry.inc("patient_turns_total", **labels)
+        if self.ttft is not None:
+            registry.observe("patient_turn_ttft_seconds", self.ttft, **labels)
+        if self.generation_time is not None:
+            registry.observe("patient_turn_generation_seconds", self.generation_time, **labels)
+        registry.observe("patient_turn_render_seconds", self.render_time, **labels)
+        if self.prompt_tokens is not None:
+            registry.inc("llm_prompt_tokens_total", self.prompt_tokens, **labels)
+            registry.inc("llm_completion_tokens_total", self.completion_tokens or 0, **labels)
+            registry.inc("llm_cached_tokens_total", self.cached_tokens or 0, **labels)
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+def instrument_stream(stream, metrics):
+    """Yield text deltas from an OpenAI chat completion stream while recording metrics.
+
+    The request must be made with stream_options={"include_usage": True} for token
+    counts to be available. Render and generation time are recorded by
+    timed_render() around whatever the UI finally consumes; without it the
+    whole stream counts as generation.
+    """
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            metrics.record_usage(chunk.usage)
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content
+        if not text:
+            continue
+        if metrics.ttft is None:
+            metrics.ttft = time.perf_counter() - metrics.started
+        yield text
+    metrics.generation_time = time.perf_counter() - metrics.started - metrics.render_time
+
+
+def timed_render(chunks, metrics):
+    """Yield chunks unchanged, accumulating the time the consumer spends on each as render time.
+
+    Wrap the outermost generator handed to st.write_stream (e.g. after
+    coalesce()), so the time measured is the UI writing each flushed piece,
+    not buffering. Generation time is the rest of the turn.
+    """
+    for text in chunks:
+        yielded_at = time.perf_counter()
+        yield text
+        metrics.render_time += time.perf_counter() - yielded_at
+    metrics.generation_time = time.perf_counter() - metrics.started - metrics.render_time
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread. Safe to call on every rerun."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        return _server
+
+
+REGISTRY.describe("interaction_cpu_seconds", "histogram", "Server CPU time spent per script or fragment run",
+                  buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+REGISTRY.describe("interaction_wall_seconds", "histogram", "Wall-clock time spent per script or fragment run")
+
+
+@contextmanager
+def measure_interaction(page, section, registry=REGISTRY):
+    """Record CPU and wall time of a page or fragment run.
+
+    Streamlit executes each script run on its own thread, so thread CPU time
+    isolates this session's work from other concurrent sessions. Usable as a
+    context manager or as a decorator on fragment functions. With PROFILING
+    on, the outermost block on a thread also collects a run profile (see
+    utils/profiling.py).
+    """
+    token = begin_run(page, section) if PROFILING_ENABLED else None
+    cpu_started = time.thread_time()
+    wall_started = time.perf_counter()
+    try:
+        yield
+    finally:
+        cpu = time.thread_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+        registry.observe("interaction_cpu_seconds", cpu, page=page, section=section)
+        registry.observe("interaction_wall_seconds", wall, page=page, section=section)
+        if token is not None:
+            end_run(token, section, wall, cpu)
@@ -0,0 +1,124 @@
+import sys
+from array import array
+from collections.abc import Sequence
+
+# Roles are stored as one byte each instead of a string per message
+ROLES = ("user", "assistant", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+# Short messages ("ok", "yeah", "Thanks for talking with me, doc.") repeat
+# across sessions, so they are interned and shared process-wide
+INTERN_MAX_LENGTH = 64
+
+
+def order_realtime(events):
+    """Realtime audio transcript events in chronological order (by sequence, else timestamp)."""
+    return sorted(events, key=lambda event: event.get("sequence", event.get("timestamp", 0)))
+
+
+class Transcript(Sequence):
+    """Append-only chat history with compact per-message storage.
+
+    Behaves like the list of {"role", "content"} dicts it replaces: indexing and
+    iteration produce those dicts on demand, and append() accepts them. Per-turn
+    telemetry is kept in a sparse side table because only assistant turns have it.
+    """
+
+    __slots__ = ("_roles", "_contents", "_metrics")
+
+    def __init__(self, messages=()):
+        self._roles = array("b")
+        self._contents = []
+        self._metrics = {}
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        self.add(message["role"], message["content"], message.get("metrics"))
+
+    def add(self, role, content, metrics=None):
+        if len(content) <= INTERN_MAX_LENGTH:
+            content = sys.intern(content)
+        self._roles.append(ROLE_CODES[role])
+        self._contents.append(content)
+        if metrics:
+            self._metrics[len(self._contents) - 1] = metrics
+
+    def role(self, index):
+        return ROLES[self._roles[index]]
+
+    def content(self, index):
+        return self._contents[index]
+
+    def __len__(self):
+        return len(self._contents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._message(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transcript index out of range")
+        return self._message(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._message(i)
+
+    def _message(self, index):
+        message = {"role": ROLES[self._roles[index]], "content": self._contents[index]}
+        metrics = self._metrics.get(index)
+        if metrics:
+            message["metrics"] = metrics
+        return message
+
+    @classmethod
+    def from_realtime(cls, events):
+        """Chat history from realtime audio transcript events, already in order."""
+        transcript = cls()
+        for event in events:
+            transcript.add("user" if event["type"] == "user" else "assistant", event["content"])
+        return transcript
+
+    def to_list(self):
+        """Plain list of message dicts, for MongoDB and the session store."""
+        return list(self)
+
+    def request_messages(self, system_prompt):
+        """View of the conversation as chat-completion messages, headed by the system prompt."""
+        return RequestMessages(self, system_prompt)
+
+
+class RequestMessages(Sequence):
+    """Read-only view that the OpenAI client can iterate without a copied history list.
+
+    Only role and content are exposed, so telemetry never leaks into the request.
+    The view reflects the transcript as it is when iterated.
+    """
+
+    __slots__ = ("_transcript", "_system_prompt")
+
+    def __init__(self, transcript, system_prompt):
+        self._transcript = transcript
+        self._system_prompt = system_prompt
+
+    def __len__(self):
+        return len(self._transcript) + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index == 0:
+            return {"role": "system", "content": self._system_prompt}
+        if not 0 < index < len(self):
+            raise IndexError("request index out of range")
+        return {"role": self._transcript.role(index - 1), "content": self._transcript.content(index - 1)}
+
+    def __iter__(self):
+        yield {"role": "system", "content": self._system_prompt}
+        transcript = self._transcript
+        for i in range(len(transcript)):
+            yield {"role": transcript.role(i), "content": transcript.content(i)}
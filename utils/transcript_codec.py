@@ -0,0 +1,72 @@
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available; zstd is smaller and faster when installed
+    zstandard = None
+
+from utils.transcript import ROLE_CODES, ROLES
+
+# Packed message arrays larger than this go to GridFS instead of the document
+OFFLOAD_THRESHOLD = 256 * 1024
+
+ZSTD_LEVEL = 10
+
+
+def pack_messages(messages):
+    """Serialise messages compactly and compress them.
+
+    Each message becomes [role_code, content] or [role_code, content, metrics],
+    encoded as compact JSON. Returns (codec, payload).
+    """
+    rows = []
+    for message in messages:
+        row = [ROLE_CODES[message["role"]], message["content"]]
+        if message.get("metrics"):
+            row.append(message["metrics"])
+        rows.append(row)
+    return compress(json.dumps(rows, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+
+def unpack_messages(codec, payload):
+    """Inverse of pack_messages."""
+    messages = []
+    for row in json.loads(decompress(codec, payload)):
+        message = {"role": ROLES[row[0]], "content": row[1]}
+        if len(row) > 2:
+            message["metrics"] = row[2]
+        messages.append(message)
+    return messages
+
+
+def compress(raw):
+    """Compress bytes with zstd when installed, else zlib. Returns (codec, payload)."""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+
+def decompress(codec, payload):
+    """Inverse of compress."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This payload is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def summarise_messages(messages):
+    """Queryable summary fields kept in plain form next to a packed message array."""
+    return {
+        "message_count": len(messages),
+        "user_turns": sum(1 for m in messages if m["role"] == "user"),
+        "assistant_turns": sum(1 for m in messages if m["role"] == "assistant"),
+        "char_count": sum(len(m["content"]) for m in messages),
+    }
+
+
+def packed_field(field):
+    return f"{field}_packed"
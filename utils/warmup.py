@@ -0,0 +1,52 @@
+import logging
+import threading
+import time
+
+from utils.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("warm_up_seconds", "gauge", "Time the background warm-up took after process start")
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def start_warm_up(mongodb_uri):
+    """Pre-initialise pooled clients and the default scenario on a background thread, once per process.
+
+    Streamlit has no server-start hook, so this runs from the first script run.
+    The session that triggers it carries on rendering while the heavy imports
+    and connection setup happen in the background.
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    thread = threading.Thread(
+        target=_warm_up,
+        args=(mongodb_uri,),
+        name="warm-up",
+        daemon=True
+    )
+    thread.start()
+
+
+def _warm_up(mongodb_uri):
+    from utils.identifiers import get_identifier_set
+    from utils.llm import ROLES, get_provider
+    from utils.mongodb import ensure_indexes, get_mongo_client
+    from utils.scenarios import get_scenario
+
+    started = time.perf_counter()
+    try:
+        get_scenario()
+        for role in ROLES:
+            get_provider(role)
+        get_mongo_client(mongodb_uri).admin.command("ping")
+        ensure_indexes(mongodb_uri)
+        get_identifier_set(mongodb_uri)
+    except Exception:
+        logger.exception("Warm-up failed; clients will be created on first use")
+    REGISTRY.set("warm_up_seconds", time.perf_counter() - started)
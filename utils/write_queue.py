@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from utils.breaker import CircuitOpenError, mongo_breaker
+from utils.config import get_setting
+from utils.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGISTRY.describe("write_queue_depth", "gauge", "Transcript writes waiting locally for MongoDB to recover")
+REGISTRY.describe("write_queue_replayed_total", "counter", "Queued transcript writes applied after MongoDB recovered")
+
+DRAIN_INTERVAL = 5.0
+
+
+class WriteQueue:
+    """Local, durable FIFO of transcript writes made while MongoDB is unavailable.
+
+    Writes are transcript_write plans (see utils.mongodb), stored BSON-encoded
+    in SQLite so they survive a restart. Each row records its target, a hash
+    of the connection string, and a queue only replays its own target's rows,
+    so a file shared by several deployments never sends a write to the wrong
+    cluster. A drain thread replays them in order through the MongoDB circuit
+    breaker, which doubles as its half-open probe. While anything is queued,
+    new writes queue behind it to keep their order.
+    """
+
+    def __init__(self, path, apply, target):
+        self._apply = apply
+        self.target = target
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS writes ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, phase TEXT, payload BLOB, queued_at REAL, target TEXT)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(writes)")}
+        if "target" not in columns:
+            self._conn.execute("ALTER TABLE writes ADD COLUMN target TEXT")
+        untargeted = self._conn.execute("SELECT COUNT(*) FROM writes WHERE target IS NULL").fetchone()[0]
+        if untargeted:
+            logger.warning("%s holds %d queued writes from before writes recorded their target; they are not "
+                           "replayed until their target column is set", path, untargeted)
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM writes WHERE target = ?", (target,)).fetchone()[0]
+        REGISTRY.set("write_queue_depth", self._depth)
+        self._thread = threading.Thread(target=self._drain_forever, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        return self._depth
+
+    def put(self, write, phase):
+        import bson
+        payload = bson.encode({"write": list(write)})
+        with self._lock:
+            self._conn.execute("INSERT INTO writes (phase, payload, queued_at, target) VALUES (?, ?, ?, ?)",
+                               (phase, payload, time.time(), self.target))
+            self._depth += 1
+            REGISTRY.set("write_queue_depth", self._depth)
+        logger.warning("MongoDB unavailable; queued %s write locally (%d pending)", phase, self._depth)
+
+    def drain(self):
+        """Apply queued writes in order until the queue is empty or MongoDB fails again."""
+        import bson
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id, phase, payload FROM writes WHERE target = ? ORDER BY id LIMIT 1", (self.target,)
+                ).fetchone()
+            if row is None:
+                return
+            write_id, phase, payload = row
+            write = tuple(bson.decode(payload)["write"])
+            try:
+                mongo_breaker.call(self._apply, write, phase)
+            except CircuitOpenError:
+                return
+            except Exception as error:
+                if mongo_breaker.is_failure(error):
+                    return
+                # The database rejected the write itself; retrying won't help
+                logger.exception("Dropping queued %s write that MongoDB rejected", phase)
+            with self._lock:
+                self._conn.execute("DELETE FROM writes WHERE id = ?", (write_id,))
+                self._depth -= 1
+                REGISTRY.set("write_queue_depth", self._depth)
+            REGISTRY.inc("write_queue_replayed_total", phase=phase)
+
+    def _drain_forever(self):
+        while True:
+            time.sleep(DRAIN_INTERVAL)
+            if self._depth:
+                try:
+                    self.drain()
+                except Exception:
+                    logger.exception("Write queue drain failed")
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def queue_target(connection_string):
+    """Short, stable name for a connection string that does not reveal its credentials."""
+    return hashlib.sha256(connection_string.encode("utf-8")).hexdigest()[:16]
+
+
+def get_write_queue(connection_string, apply):
+    """Return the process-wide write queue for a connection string.
+
+    apply(write, phase) performs one write against MongoDB. The queue file is
+    WRITE_QUEUE_PATH, by default .write_queue-<target>.db in the working
+    directory, one file per connection string.
+    """
+    queue = _queues.get(connection_string)
+    if queue is None:
+        with _queues_lock:
+            queue = _queues.get(connection_string)
+            if queue is None:
+                target = queue_target(connection_string)
+                path = get_setting("WRITE_QUEUE_PATH", f".write_queue-{target}.db")
+                queue = WriteQueue(path, apply, target)
+                _queues[connection_string] = queue
+    return queue